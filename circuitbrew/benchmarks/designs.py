@@ -0,0 +1,156 @@
+"""
+    Synthetic designs whose size is set by a parameter, for benchmarking how each
+    pass scales.
+
+    Every generator returns a `Main` Module class (like the one a user's MODULE
+    defines) that builds the design when instantiated inside a Session.
+"""
+import logging
+
+from ..module import Module, Param, Parameterize
+from ..ports import InputPort, OutputPort, InputPorts, OutputPorts
+from ..compound_ports import SupplyPort
+from ..elements import Supply, ResetPulse
+from ..gates import Inv_x1, NorN
+from ..qdi import Celement2, Wchb, VerilogSrcE1of2, VerilogBucketE1of2
+
+logger = logging.getLogger(__name__)
+
+
+def wchb_chain(n: int, tokens: int = 8) -> type:
+    """ A source, a chain of n Wchb buffers and a bucket.  The source sends a fixed
+        pattern of tokens, so the behavioral simulation exercises every stage.
+    """
+    class Main(Module):
+        def build(self):
+            self.supply = Supply('vdd', self.sim_setup['voltage'])
+            p = self.supply.p
+            self._preset_pulse = ResetPulse('preset', p=p)
+            self._sreset_pulse = ResetPulse('sreset', p=p)
+            _pR = self._preset_pulse.node
+            _sR = self._sreset_pulse.node
+
+            self.buf = [Wchb(f'wchb_{i}', _pReset=_pR, p=p) for i in range(n)]
+            for i in range(1, n):
+                self.buf[i].l = self.buf[i-1].r
+
+            self.src = VerilogSrcE1of2(name='src', values=[i % 2 for i in range(tokens)],
+                                       _pReset=_pR, _sReset=_sR)
+            self.src.l = self.buf[0].l
+            self.buc = VerilogBucketE1of2(name='buc', _pReset=_pR, _sReset=_sR, l=self.buf[n-1].r)
+            self.finalize()
+    return Main
+
+
+def celement_array(m: int, n: int) -> type:
+    """ An m x n grid of Celement2, each one joining the outputs of its left and
+        upper neighbours
+    """
+    class Main(Module):
+        def build(self):
+            self.supply = Supply('vdd', self.sim_setup['voltage'])
+            p = self.supply.p
+            grid = []
+            for r in range(m):
+                row = []
+                for c in range(n):
+                    cell = Celement2(f'c_{r}_{c}', p=p)
+                    if c:
+                        cell.i[0] = row[c-1].o
+                    if r:
+                        cell.i[1] = grid[r-1][c].o
+                    row.append(cell)
+                grid.append(row)
+            self.cells = [cell for row in grid for cell in row]
+            self.finalize()
+    return Main
+
+
+def wide_nor(width: int, count: int = 4) -> type:
+    """ count NorN gates of `width` inputs each (made with Parameterize), sharing their inputs
+    """
+    class Main(Module):
+        def build(self):
+            self.supply = Supply('vdd', self.sim_setup['voltage'])
+            p = self.supply.p
+            Nor = Parameterize(NorN, N=width)
+            self.nors = [Nor(p=p) for i in range(count)]
+            for nor in self.nors[1:]:
+                nor.a = list(self.nors[0].a)
+            self.finalize()
+    return Main
+
+
+class Nest(Module):
+    """ A hierarchy `depth` levels deep, with `fanout` children in series at each level
+        and an inverter at the bottom
+    """
+    depth: Param
+    fanout: Param
+
+    i = InputPort()
+    o = OutputPort()
+    p = SupplyPort()
+
+    def build(self):
+        if self.depth == 0:
+            self.inv = Inv_x1(inp=self.i, out=self.o, p=self.p)
+        else:
+            child = Parameterize(Nest, depth=self.depth-1, fanout=self.fanout)
+            self.children = [child(p=self.p) for k in range(self.fanout)]
+            self.children[0].i = self.i
+            for k in range(1, self.fanout):
+                self.children[k].i = self.children[k-1].o
+            self.children[-1].o = self.o
+        self.finalize()
+
+
+def deep_hierarchy(depth: int, fanout: int = 2) -> type:
+    """ A Nest hierarchy: fanout**depth inverters in depth+1 levels of subcircuits
+    """
+    class Main(Module):
+        def build(self):
+            self.supply = Supply('vdd', self.sim_setup['voltage'])
+            p = self.supply.p
+            self.nest = Parameterize(Nest, depth=depth, fanout=fanout)(p=p)
+            self.finalize()
+    return Main
+
+
+class BusStage(Module):
+    """ Inverts each bit of a W-bit bus
+    """
+    W: Param
+
+    d = InputPorts(width=Param('W'))
+    q = OutputPorts(width=Param('W'))
+    p = SupplyPort()
+
+    def build(self):
+        self.invs = [Inv_x1(inp=self.d[k], out=self.q[k], p=self.p) for k in range(self.W)]
+        self.finalize()
+
+
+def wide_bus(width: int, stages: int = 4) -> type:
+    """ A chain of `stages` BusStages on a `width`-bit bus
+    """
+    class Main(Module):
+        def build(self):
+            self.supply = Supply('vdd', self.sim_setup['voltage'])
+            p = self.supply.p
+            Stage = Parameterize(BusStage, W=width)
+            self.stages = [Stage(p=p) for k in range(stages)]
+            for k in range(1, stages):
+                self.stages[k].d = self.stages[k-1].q
+            self.finalize()
+    return Main
+
+
+GENERATORS = {
+    'wchb_chain': wchb_chain,
+    'celement_array': celement_array,
+    'wide_nor': wide_nor,
+    'deep_hierarchy': deep_hierarchy,
+    'wide_bus': wide_bus,
+}
+"""Generator name -> function(size arguments) returning a Main class"""
@@ -0,0 +1,235 @@
+"""Run the benchmark designs through every pass and compare against a baseline
+
+Usage:
+    cb_benchmark [options] [NAME...]
+    cb_benchmark --list
+
+Arguments:
+    NAME    Generators to run (default: all of them)
+
+Options:
+    -h --help             show this message
+    -r --repeat N         keep the best of N runs of each pass [default: 3]
+    --save FILE           write the results to this JSON file (e.g. a new baseline)
+    --baseline FILE       compare against this JSON file, and exit with status 1 if any
+                          pass got slower by more than the tolerance
+    --tolerance FRAC      allowed slowdown before a pass counts as a regression [default: 0.25]
+    --no-memory           skip the (slower) extra run that measures peak memory
+    --list                list the benchmarks
+"""
+import sys, copy, json, math, time, logging, platform, tempfile, tracemalloc
+from types import SimpleNamespace
+
+from ..helpers import PhaseTimer
+from ..session import Session
+from .designs import GENERATORS
+
+logger = logging.getLogger(__name__)
+
+PASSES = ['build', 'sim', 'netlist', 'render', 'write']
+"""The flow phases that are timed (see CircuitBrew.build and CircuitBrew.emit)"""
+
+# Ignore slowdowns of passes that take less than this many ms, they're all noise
+MIN_COMPARE_MS = 5.0
+
+
+class Benchmark:
+    """ One generator at one size
+
+        Args:
+            generator: Name of the generator in designs.GENERATORS
+            scale: Size of the design (e.g. the number of cells), to estimate how each
+                   pass scales between sizes of the same generator
+            kwargs: Arguments for the generator
+    """
+    def __init__(self, generator: str, scale: int, **kwargs):
+        self.generator = generator
+        self.scale = scale
+        self.kwargs = kwargs
+
+    @property
+    def key(self) -> str:
+        args = ','.join(f'{k}={v}' for k, v in self.kwargs.items())
+        return f'{self.generator}({args})'
+
+    def __repr__(self):
+        return self.key
+
+
+SUITE = [Benchmark('wchb_chain', n, n=n) for n in (8, 16, 32)] \
+      + [Benchmark('celement_array', n*n, m=n, n=n) for n in (4, 8, 12)] \
+      + [Benchmark('wide_nor', w, width=w) for w in (8, 32, 128)] \
+      + [Benchmark('deep_hierarchy', 2**d, depth=d) for d in (4, 6, 8)] \
+      + [Benchmark('wide_bus', w, width=w) for w in (16, 32, 64)]
+"""The default benchmarks, three sizes of each generator"""
+
+
+def _run_flow(script, bench: Benchmark, tech_options: dict, template_str: str, output_dir: str) -> dict:
+    sim_setup = copy.deepcopy(tech_options)
+    sim_setup['output_dir'] = output_dir
+    script.timer = PhaseTimer()
+    with Session(sim_setup) as session:
+        circuit_lib = SimpleNamespace(Main=GENERATORS[bench.generator](**bench.kwargs))
+        main = script.build(circuit_lib)
+        spice = script.emit(main, sim_setup, template_str)
+    return {'times': dict(script.timer.phases),
+            'subckts': len(session.modules),
+            'lines': spice.count('\n'),
+           }
+
+
+def run_benchmark(bench: Benchmark, repeat: int = 3, memory: bool = True) -> dict:
+    """ Build, simulate, netlist, render and write one benchmark design
+
+        Returns:
+            dict: with the best time in ms of each pass in PASSES, the peak traced
+                  memory in MB (`peak_mb`, unless memory is False), and the number of
+                  subcircuits (`subckts`) and netlist lines (`lines`)
+    """
+    from ..circuitbrew import CircuitBrew
+    from ..cb_netlist import __doc__ as docopt_string
+    script = CircuitBrew(docopt_string)
+    script.netlist_type = 'hspice'
+    # Starting and stopping the monitor's thread takes up to ~0.5 s, which would swamp the sim times
+    script.sim_monitor = False
+    tech_options, template_str = script._get_techfile('sw130')
+    tech_options['sim_type'] = script.netlist_type
+
+    result = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for i in range(repeat):
+            run = _run_flow(script, bench, tech_options, template_str, output_dir)
+            for name in PASSES:
+                t = run['times'].get(name, 0.0) * 1000
+                result[name] = min(result.get(name, t), t)
+        result['subckts'] = run['subckts']
+        result['lines'] = run['lines']
+        if memory:
+            tracemalloc.start()
+            try:
+                _run_flow(script, bench, tech_options, template_str, output_dir)
+                result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+    return result
+
+
+def run_suite(benchmarks: list[Benchmark], repeat: int = 3, memory: bool = True) -> dict:
+    """ Run the benchmarks
+
+        Returns:
+            dict: JSON-able results, with the benchmark results under `benchmarks`
+                  (keyed by Benchmark.key) and some details of the machine
+    """
+    results = {'python': platform.python_version(),
+               'machine': platform.machine(),
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'benchmarks': {},
+              }
+    for bench in benchmarks:
+        logger.info(f'Running {bench}')
+        t0 = time.perf_counter()
+        result = run_benchmark(bench, repeat, memory)
+        result['scale'] = bench.scale
+        results['benchmarks'][bench.key] = result
+        logger.info(f'{bench} done in {time.perf_counter()-t0:.1f} s')
+    return results
+
+
+def get_scaling(benchmarks: list[Benchmark], results: dict) -> dict:
+    """ Estimate how each pass grows with the size of each generator's designs
+
+        Returns:
+            dict: generator -> {pass: exponent}, where time ~ scale**exponent between the
+                  smallest and largest size run (1 is linear)
+    """
+    scaling = {}
+    by_generator = {}
+    for bench in benchmarks:
+        by_generator.setdefault(bench.generator, []).append(bench)
+    for generator, benches in by_generator.items():
+        if len(benches) < 2:
+            continue
+        small, large = min(benches, key=lambda b: b.scale), max(benches, key=lambda b: b.scale)
+        r_small, r_large = results[small.key], results[large.key]
+        exponents = {}
+        for name in PASSES:
+            if r_small[name] > 0 and r_large[name] > 0:
+                exponents[name] = math.log(r_large[name]/r_small[name]) / math.log(large.scale/small.scale)
+        scaling[generator] = exponents
+    return scaling
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25) -> list[str]:
+    """ Compare results against a baseline from run_suite
+
+        Returns:
+            list[str]: A description of each regression: a pass that got slower by more than
+                       `tolerance` (ignoring passes under MIN_COMPARE_MS), more peak memory
+                       than `tolerance` allows, or a change in the generated netlist size
+    """
+    regressions = []
+    for key, result in results['benchmarks'].items():
+        if (base := baseline['benchmarks'].get(key)) is None:
+            continue
+        for name in PASSES:
+            new, old = result[name], base.get(name)
+            if old is not None and max(new, old) >= MIN_COMPARE_MS and new > old*(1+tolerance):
+                regressions.append(f'{key}: {name} {old:.1f} ms -> {new:.1f} ms (x{new/old:.2f})')
+        new, old = result.get('peak_mb'), base.get('peak_mb')
+        if new is not None and old is not None and new > old*(1+tolerance):
+            regressions.append(f'{key}: peak memory {old:.1f} MB -> {new:.1f} MB (x{new/old:.2f})')
+        for name in ('subckts', 'lines'):
+            if base.get(name) is not None and result[name] != base[name]:
+                regressions.append(f'{key}: {name} changed {base[name]} -> {result[name]}')
+    return regressions
+
+
+def report(results: dict, scaling: dict = None) -> str:
+    """ Format the results as a table (times in ms)
+    """
+    width = max(len(key) for key in results['benchmarks'])
+    header = f'{"benchmark":<{width}}' + ''.join(f'{name:>10}' for name in PASSES) + f'{"peak MB":>10}{"lines":>10}'
+    lines = [header, '-'*len(header)]
+    for key, result in results['benchmarks'].items():
+        peak = f'{result["peak_mb"]:10.1f}' if 'peak_mb' in result else f'{"-":>10}'
+        lines.append(f'{key:<{width}}' + ''.join(f'{result[name]:10.1f}' for name in PASSES)
+                     + peak + f'{result["lines"]:10d}')
+    if scaling:
+        lines += ['', 'Scaling exponents (time ~ size**k):']
+        for generator, exponents in scaling.items():
+            lines.append(f'{generator:<{width}}' + ''.join(f'{exponents.get(name, float("nan")):10.2f}' for name in PASSES))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from docopt import docopt
+    args = docopt(__doc__, argv=sys.argv[1:] if argv is None else argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # The flow itself logs a lot at INFO
+    logging.getLogger('circuitbrew').setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    benchmarks = [bench for bench in SUITE if not args['NAME'] or bench.generator in args['NAME']]
+    if args['--list']:
+        print('\n'.join(bench.key for bench in benchmarks))
+        return 0
+    unknown = set(args['NAME']) - set(GENERATORS)
+    assert not unknown, f'Unknown benchmarks {sorted(unknown)}, pick from {sorted(GENERATORS)}'
+
+    results = run_suite(benchmarks, int(args['--repeat']), not args['--no-memory'])
+    print(report(results, get_scaling(benchmarks, results['benchmarks'])))
+
+    if args['--save']:
+        with open(args['--save'], 'w') as f:
+            json.dump(results, f, indent=2)
+    if args['--baseline']:
+        with open(args['--baseline']) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, float(args['--tolerance']))
+        if regressions:
+            print(f'\n{len(regressions)} regressions against {args["--baseline"]}:')
+            print('\n'.join(regressions))
+            return 1
+        print(f'\nNo regressions against {args["--baseline"]}')
+    return 0
@@ -18,13 +18,48 @@ Options:
     -h --help                 show this message
     -v --verbose              show more information
     -d --debug                show even more information              
+    --time-startup            report the time spent importing, loading the tech and in each flow step
+    --profile FILE            write a JSON profile of each pass and module type to this file
+    --trace FILE              record every token sent and received in the sim step to this file
+    --vcd FILE                also export the sim tokens as a VCD waveform file
+    --channel-stats FILE      write the tokens, stall times and occupancy of each sim channel to
+                              this JSON file, and print the likely bottleneck modules
+    --throughput FILE         write the cycle time and critical cycle of the handshakes of the
+                              built design (from the cell latencies in the tech file) to this file
+    --timing FILE             run the sim in virtual time with the cell latencies in the tech file,
+                              and write the cycle time and latency of each channel to this file
+    --stats FILE              write the transistor and instance counts of each module type of the
+                              built design to this JSON file, and print a summary
+    --merge-subckts           emit structurally identical subcircuits only once
+    --split-subckts           write each subcircuit to its own file, included from the top file
+    --compress FORMAT         compress the netlists with gzip or zstd (adds .gz or .zst)
+    --short-names             use short ids for the nets, instances and subcircuits, and write
+                              their original names to output_dir/names.map
+    --flat FILE               also write a flat netlist (no subcircuits) of the design to this file
+    --connect SOCKET          send this request to a running cb_netlistd server instead
+    --sweep FILE              netlist every corner listed in this YAML file into output_dir/<corner>
+    -j --jobs N               number of worker processes for --sweep [default: 1]
+    --sweep-style STYLE       files (a netlist per corner), or a single netlist using
+                              alter (.alter blocks) or data (a .data table) [default: files]
 
 """
-import circuitbrew.circuitbrew
+import time
+_start = time.perf_counter()
 import sys
+
 def main():
+    argv = sys.argv[1:]
+    if '--connect' in argv or any(arg.startswith('--connect=') for arg in argv):
+        # Hand the whole command line to the server, which keeps the
+        # interpreter, imports and tech files warm between requests
+        from circuitbrew.server import run_client
+        sys.exit(run_client(argv))
+
+    # Import lazily so that --help and the startup timer don't pay for more
+    # than the flow steps that are actually requested
+    import circuitbrew.circuitbrew
     sys.path.append('.')
-    script = circuitbrew.circuitbrew.CircuitBrew(__doc__)
+    script = circuitbrew.circuitbrew.CircuitBrew(__doc__, start_time=_start)
     script.go(sys.argv[1:])
 
 if __name__=='__main__':
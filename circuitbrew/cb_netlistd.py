@@ -0,0 +1,42 @@
+"""
+Serve cb_netlist requests from a warm interpreter over a local Unix socket
+
+Usage:
+    cb_netlistd [options] SOCKET
+
+    cb_netlistd -h
+
+Arguments:
+    SOCKET   Path of the Unix socket to listen on
+
+Options:
+    -h --help                 show this message
+    -v --verbose              show more information
+    -d --debug                show even more information
+    --poll SECONDS            how often to check the watched module files for changes (0 to disable) [default: 0.5]
+
+Send requests with:
+
+    cb_netlist --connect SOCKET TECH MODULE NETLIST_TYPE all
+
+"""
+import sys, logging
+from docopt import docopt
+
+def main():
+    from circuitbrew.version import __version__
+    args = docopt(__doc__, version=__version__)
+    if args['--debug']:
+        logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+    elif args['--verbose']:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    from circuitbrew.server import NetlistServer
+    server = NetlistServer(args['SOCKET'], poll=float(args['--poll']))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__=='__main__':
+    main()
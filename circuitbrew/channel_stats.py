@@ -0,0 +1,194 @@
+"""
+    Throughput and stall statistics for the channels of a behavioral simulation,
+    enabled with `cb_netlist --channel-stats FILE`, to find the stage that limits
+    the throughput of a pipeline without running SPICE.
+
+    A channel is the queue of one receiving Port (for E1of2 channels that's the
+    true rail, which carries the tokens).  For each channel the sim counts:
+
+    - `tokens`: tokens put into the queue
+    - `full_time`: time senders spent blocked because the queue was full.  Sim
+      queues are unbounded unless the tech file sets `channel_slack` (the number of
+      tokens a channel can hold), so this stays 0 without it
+    - `empty_time`: time the receiver spent blocked waiting on an empty queue
+    - `occupancy`: histogram of the number of tokens already queued when each
+      token arrived (plus its mean and max)
+
+    Only the ports of the modules that run a sim are counted as channels.  Times are
+    in ms, or in the latency unit of the tech file for timed sims ([circuitbrew.timing][]).
+
+    Modules are ranked by their stall balance: the time their senders were blocked
+    on them plus the time their receivers starved for their outputs, minus the
+    time they themselves were blocked on their inputs and outputs.  A slow stage in
+    a pipeline has full inputs and empty outputs, while the fast stages around it
+    spend as long stalled as they make others stall, so the bottleneck comes first.
+"""
+import sys, json, time, logging
+from collections import Counter
+
+from .trace import iter_named_ports
+
+logger = logging.getLogger(__name__)
+
+
+class Channel:
+    """ The counters of one channel
+
+        Attributes:
+            name (str): Hierarchical name of the receiving port
+            module (str): Hierarchical name of the receiving module
+            senders (set): Ports that sent on this channel
+            tokens (int): Tokens put into the queue
+            full_wait (float): Clock time senders spent blocked on a full queue
+            empty_wait (float): Clock time the receiver spent blocked on an empty queue
+            occupancy (Counter): Tokens already queued -> number of arriving tokens
+    """
+    __slots__ = ('name', 'module', 'senders', 'tokens', 'full_wait', 'empty_wait', 'occupancy')
+
+    def __init__(self, name: str, module: str):
+        self.name = name
+        self.module = module
+        self.senders = set()
+        self.tokens = 0
+        self.full_wait = 0.0
+        self.empty_wait = 0.0
+        self.occupancy = Counter()
+
+
+class ChannelStats:
+    """ Collects the channel statistics of a sim.  Port.send and Port.recv go through
+        put() and get() while this is set on the current session.
+
+        Examples:
+
+            >>> with Session(sim_setup, channel_stats=ChannelStats()) as session:
+                    ...
+            >>> session.channel_stats.write('channels.json')
+
+        Args:
+            clock: Returns the current time
+            scale: Multiplies clock times into the reported time unit
+            time_unit: Name of the reported time unit
+    """
+    def __init__(self, clock=time.perf_counter, scale: float = 1000, time_unit: str = 'ms'):
+        self.clock = clock
+        self.scale = scale
+        self.time_unit = time_unit
+        self.channels = {}      # Receiving Port -> Channel
+        self.port_names = {}    # Port -> (hierarchical port name, module name), from the sim walk
+        self.start = clock()
+        self.end = None
+
+    def name_ports(self, module_name: str, port_name: str, port):
+        """ Name the channels of a module port
+        """
+        for name, sub_port in iter_named_ports(f'{module_name}.{port_name}', port):
+            self.port_names.setdefault(sub_port, (name, module_name))
+
+    def _get_channel(self, port) -> Channel:
+        if (channel := self.channels.get(port)) is None:
+            if (names := self.port_names.get(port)) is None:
+                # Not a port of a simulated module (e.g. the cells inside a Wchb also
+                # get its tokens, but nothing reads them)
+                return None
+            channel = self.channels[port] = Channel(*names)
+        return channel
+
+    async def put(self, sender, receiver, queue, val):
+        """ Put val into the queue of receiver, counting the time blocked on a full queue
+        """
+        if (channel := self._get_channel(receiver)) is None:
+            await queue.put(val)
+            return
+        channel.senders.add(sender)
+        channel.tokens += 1
+        channel.occupancy[queue.qsize()] += 1
+        if queue.full():
+            t0 = self.clock()
+            await queue.put(val)
+            channel.full_wait += self.clock() - t0
+        else:
+            await queue.put(val)
+
+    async def get(self, receiver, queue):
+        """ Returns:
+                The next token from the queue of receiver, counting the time blocked
+                on an empty queue
+        """
+        if queue.empty() and (channel := self._get_channel(receiver)) is not None:
+            t0 = self.clock()
+            tok = await queue.get()
+            channel.empty_wait += self.clock() - t0
+            return tok
+        return await queue.get()
+
+    def stop(self):
+        """ Mark the end of the sim
+        """
+        self.end = self.clock()
+
+    def get_report(self) -> dict:
+        """ Returns:
+                dict: `time_unit`, `sim_time`, `channels` ranked by the time senders were blocked on
+                them (then by mean occupancy), and `modules` ranked by stall balance
+                (see [circuitbrew.channel_stats][])
+        """
+        sim_time = (self.end if self.end is not None else self.clock()) - self.start
+        channels = []
+        modules = {}
+        def module_entry(name):
+            if (entry := modules.get(name)) is None:
+                entry = modules[name] = {'in_full_time': 0.0, 'in_empty_time': 0.0,
+                                         'out_full_time': 0.0, 'out_empty_time': 0.0, 'tokens_in': 0}
+            return entry
+
+        for channel in self.channels.values():
+            arrivals = sum(channel.occupancy.values())
+            mean = sum(n*count for n, count in channel.occupancy.items())/arrivals if arrivals else 0.0
+            senders = sorted(self.port_names.get(p, (p.name, '?'))[0] for p in channel.senders)
+            full, empty = channel.full_wait*self.scale, channel.empty_wait*self.scale
+            channels.append({'name': channel.name, 'module': channel.module, 'senders': senders,
+                             'tokens': channel.tokens,
+                             'tokens_per_time': channel.tokens/(sim_time*self.scale) if sim_time > 0 else 0.0,
+                             'full_time': full, 'empty_time': empty,
+                             'mean_occupancy': mean, 'max_occupancy': max(channel.occupancy, default=0),
+                             'occupancy': {str(n): count for n, count in sorted(channel.occupancy.items())}})
+            receiver = module_entry(channel.module)
+            receiver['in_full_time'] += full
+            receiver['in_empty_time'] += empty
+            receiver['tokens_in'] += channel.tokens
+            for sender_module in {self.port_names.get(p, (None, '?'))[1] for p in channel.senders}:
+                sender = module_entry(sender_module)
+                sender['out_full_time'] += full
+                sender['out_empty_time'] += empty
+
+        for entry in modules.values():
+            entry['stall_balance'] = (entry['in_full_time'] + entry['out_empty_time']
+                                      - entry['in_empty_time'] - entry['out_full_time'])
+        channels.sort(key=lambda c: (-c['full_time'], -c['mean_occupancy'], c['name']))
+        return {'time_unit': self.time_unit,
+                'sim_time': sim_time*self.scale,
+                'channels': channels,
+                'modules': dict(sorted(modules.items(), key=lambda kv: -kv[1]['stall_balance']))}
+
+    def summary(self, report: dict, top: int = 10) -> str:
+        """ A short table of the `top` likely bottleneck modules and channels in the report
+        """
+        unit = report['time_unit']
+        lines = [f'{"module":<40}{"balance " + unit:>12}{"in full " + unit:>12}{"out empty " + unit:>14}{"tokens in":>11}']
+        for name, entry in list(report['modules'].items())[:top]:
+            lines.append(f'{name[:39]:<40}{entry["stall_balance"]:12.1f}{entry["in_full_time"]:12.1f}'
+                         f'{entry["out_empty_time"]:14.1f}{entry["tokens_in"]:11d}')
+        lines.append('')
+        lines.append(f'{"channel":<40}{"tokens":>9}{"full " + unit:>10}{"empty " + unit:>10}{"mean occ":>10}{"max occ":>9}')
+        for c in report['channels'][:top]:
+            lines.append(f'{c["name"][:39]:<40}{c["tokens"]:9d}{c["full_time"]:10.1f}{c["empty_time"]:10.1f}'
+                         f'{c["mean_occupancy"]:10.2f}{c["max_occupancy"]:9d}')
+        return '\n'.join(lines)
+
+    def write(self, filename: str):
+        report = self.get_report()
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info('Wrote channel statistics to %s', filename)
+        print(self.summary(report), file=sys.stderr)
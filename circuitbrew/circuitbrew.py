@@ -1,20 +1,23 @@
-import sys, logging
+import sys, logging, copy
 from pathlib import Path
-import curio
 from docopt import docopt
-from mako.template import Template
 from importlib import import_module
-import importlib
-import yaml
+import importlib.resources
 
 import os
 from .walker import BuildPass, NetlistPass, SimPass
 from .module import Module
+from .session import Session
+from .netlist import get_subcircuits, render_netlist, NAME_MAP
+from .helpers import PhaseTimer
 
 from .version import __version__ 
 
 import circuitbrew.tech as tech
 
+# Note: curio, mako and yaml are imported inside the flow steps that need them
+# so that short runs (and --help) don't pay for loading them
+
 logger = logging.getLogger(__name__)
 
 class CircuitBrew:
@@ -28,14 +31,32 @@ class CircuitBrew:
     """
 
     file_extension = { 'hspice': 'sp', 'verilog': 'v'}
-    def __init__(self, docopt_string):
+    _tech_cache = {}  # Resolved tech directory -> (file mtimes, tech options, template)
+
+    def __init__(self, docopt_string, start_time=None):
         self.flow = { 'build': 'Build netlist',
                       'sim'  : 'Simulate vectors',
                       'netlist': 'Output netlist',
                     }
         self.docopt_string = docopt_string
+        self.profiler = None   # A Profiler when --profile is given
+        self.trace_file = None # Sim token trace file when --trace (or --vcd) is given
+        self.vcd_file = None
+        self.channel_stats_file = None  # Sim channel statistics file when --channel-stats is given
+        self.throughput_file = None     # Static throughput analysis file when --throughput is given
+        self.timing_file = None         # Timed sim report file when --timing is given
+        self.stats_file = None          # Design statistics file when --stats is given
+        self.merge_subckts = False      # Merge identical subcircuits (--merge-subckts)
+        self.split_subckts = False      # A file per subcircuit (--split-subckts)
+        self.compress = None            # gzip or zstd (--compress)
+        self.short_names = False        # Short net, instance and subcircuit names (--short-names)
+        self.flat_file = None           # Flat netlist file when --flat is given
+        self.sim_monitor = True         # Run the sim with the curio monitor
+        self.timer = PhaseTimer(start_time)
+        self.timer.mark('startup')
 
-    def _get_techfile(self, process: str) -> tuple[dict, str]:
+    @classmethod
+    def _get_techfile(cls, process: str) -> tuple[dict, str]:
         """
             Read the tech file from process/tech.yml and the template spice file
             for the process.  
@@ -48,15 +69,22 @@ class CircuitBrew:
             Args:
                 process: A string like 'n7' or 'sw130', or a local directory
             
+            The parsed files are cached (keyed by their modification times), so
+            long-running processes like the netlist server only re-read them when
+            they change.
+
             Returns:
                 (techoptions, template_file):  A dict of the tech options and the contents of the template spice file
         """
-        pth = importlib.resources.files(tech) / 'process' / process
-        if not pth.exists():
-            pth_local = Path(process)
-            assert pth_local.exists(), f'Cannot find process {process} in {pth} or {pth_local}'
-            pth = pth_local
+        pth = cls._find_process(process)
+        key = os.path.abspath(pth)
+        if (cached := cls._tech_cache.get(key)):
+            mtimes, techoptions, template_file = cached
+            if all(os.stat(fn).st_mtime_ns == mtime for fn, mtime in mtimes.items()):
+                # Callers add to the tech options, so hand out a copy
+                return copy.deepcopy(techoptions), template_file
 
+        import yaml
         with open(pth / 'tech.yml') as f:
             techfile = f.read()
             techoptions = yaml.safe_load(techfile)
@@ -66,45 +94,222 @@ class CircuitBrew:
         with open(pth / template_filename) as f:
             template_file = f.read()
 
+        mtimes = {os.path.join(key, fn): os.stat(pth / fn).st_mtime_ns 
+                    for fn in ('tech.yml', template_filename)}
+        cls._tech_cache[key] = (mtimes, copy.deepcopy(techoptions), template_file)
         return techoptions, template_file
 
+    @classmethod
+    def _find_process(cls, process: str):
+        """ Returns:
+                The directory of the process (built-in or local, see _get_techfile)
+        """
+        pth = importlib.resources.files(tech) / 'process' / process
+        if not pth.exists():
+            pth_local = Path(process)
+            assert pth_local.exists(), f'Cannot find process {process} in {pth} or {pth_local}'
+            pth = pth_local
+        return pth
+
+    @classmethod
+    def get_tech_files(cls, process: str) -> list[str]:
+        """ Returns:
+                The files (tech.yml and the template) that _get_techfile read for the
+                process, or an empty list if they haven't been read
+        """
+        try:
+            key = os.path.abspath(cls._find_process(process))
+        except AssertionError:
+            return []
+        cached = cls._tech_cache.get(key)
+        return list(cached[0]) if cached else []
+
     def netlist(self):
-        tech_options, template_str = self._get_techfile(self.process)
-        mytemplate = Template(template_str)
-
-        circuit_lib = import_module(self.module)
-
-        sim_setup = tech_options
-        sim_setup['sim_type'] = self.netlist_type   # Add in whether CL option was hspice or verilog
-
-        # Measure.sim_setup = sim_setup
-        # Leaf.sim_setup = sim_setup
-        # G.sim_setup = sim_setup
-        Module.sim_setup = sim_setup
-        #sim_setup['circuit'] = main.get_netlist('xmain')
-        main = circuit_lib.Main()
-        walker = BuildPass(main, 'xmain')
-        walker.run()
-        
+        """ Run the flow for self.module in a fresh Session, so that repeated calls
+            (or other designs netlisted in the same process) don't share instance
+            counters or emitted subcircuits.
+
+            Returns:
+                The rendered netlist
+        """
+        timer = self.timer
+        with timer.phase('tech'):
+            tech_options, template_str = self._get_techfile(self.process)
+
+        with timer.phase('import module'):
+            circuit_lib = import_module(self.module)
+
+        sim_setup = self.add_options(tech_options)
+        self.session = Session(sim_setup, profiler=self.profiler)
+        with self.session:
+            return self._run_flow(circuit_lib, sim_setup, template_str)
+
+    def add_options(self, tech_options: dict) -> dict:
+        """ Set the tech options given on the command line (netlist type,
+            `--merge-subckts`, `--split-subckts`, `--compress`, `--short-names`)
+
+            Returns:
+                tech_options
+        """
+        tech_options['sim_type'] = self.netlist_type   # Add in whether CL option was hspice or verilog
+        if self.merge_subckts:
+            tech_options['merge_subcircuits'] = True
+        if self.split_subckts:
+            tech_options['split_subcircuits'] = True
+        if self.compress:
+            tech_options['compress'] = self.compress
+        if self.short_names:
+            tech_options['short_names'] = True
+        return tech_options
+
+    def _run_flow(self, circuit_lib, sim_setup, template_str):
+        main = self.build(circuit_lib)
+        return self.emit(main, sim_setup, template_str)
+
+    def build(self, circuit_lib) -> Module:
+        """ Build the Main module of circuit_lib in the current session, and run the
+            behavioral simulation if that flow step was requested
+
+            Returns:
+                The built Main instance
+        """
+        timer = self.timer
+        with timer.phase('build'):
+            main = circuit_lib.Main()
+            walker = BuildPass(main, 'xmain')
+            walker.run()
+
+        if self.throughput_file:
+            from . import throughput
+            with timer.phase('throughput'):
+                throughput.write(main, self.throughput_file)
+
+        if self.stats_file:
+            from . import stats
+            with timer.phase('stats'):
+                stats.write(main, self.stats_file)
+
         if 'sim' in self.flow:
-            walker = SimPass(main, 'xmain')
-            curio.run(walker.run_sim, with_monitor=True)
-
-        walker = NetlistPass(main, 'xmain')
-        walker.run()
-        lines = []
-        for module, contents in Module._modules.items():
-            lines += contents
-            lines += '\n'
-        sim_setup['circuit'] = '\n'.join(lines)
-        sim_setup['main_type_name'] = main.get_module_type_name()
-
-        spice = mytemplate.render(**sim_setup)
-
-        with open(os.path.join(sim_setup['output_dir'], 'top.'+self.file_extension[self.netlist_type]), 'w') as f:
-            f.write(spice)
+            import curio
+            with timer.phase('sim'):
+                session = Session.current()
+                if self.trace_file:
+                    from .trace import TraceRecorder
+                    session.tracer = TraceRecorder(self.trace_file)
+                activations = []
+                if self.timing_file:
+                    from .timing import SimClock
+                    session.sim_clock = SimClock()
+                    activations.append(session.sim_clock)
+                if self.channel_stats_file:
+                    from .channel_stats import ChannelStats
+                    if session.sim_clock is None:
+                        session.channel_stats = ChannelStats()
+                    else:
+                        # Count the stalls in virtual time
+                        session.channel_stats = ChannelStats(clock=lambda clock=session.sim_clock: clock.now,
+                                                                scale=1, time_unit='sim')
+                try:
+                    walker = SimPass(main, 'xmain')
+                    curio.run(walker.run_sim, with_monitor=self.sim_monitor, activations=activations)
+                finally:
+                    if session.sim_clock is not None:
+                        session.sim_clock.write(self.timing_file)
+                        session.sim_clock = None
+                    if session.tracer is not None:
+                        session.tracer.close()
+                        session.tracer = None
+                    if session.channel_stats is not None:
+                        session.channel_stats.stop()
+                        session.channel_stats.write(self.channel_stats_file)
+                        session.channel_stats = None
+            if self.vcd_file:
+                from .trace import export_vcd
+                with timer.phase('vcd'):
+                    export_vcd(self.trace_file, self.vcd_file)
+        return main
+
+    def emit(self, main: Module, sim_setup: dict, template_str: str, netlist_pass=NetlistPass,
+             flat_file: str = None) -> str:
+        """ Netlist the built design, render the process template and write the top file
+            into sim_setup['output_dir'].  Only the files that changed are rewritten
+            (listed in self.changed, see [circuitbrew.outputs][]).  The `compress`
+            and `split_subcircuits` tech options compress the netlists and write a
+            file per subcircuit (see [circuitbrew.split][]), and `short_names`
+            shortens the names (see [circuitbrew.shortnames][]).
+
+            Args:
+                flat_file: Where to write the flat netlist, instead of self.flat_file
+
+            Returns:
+                The rendered netlist
+        """
+        from .outputs import write_if_changed, compressed_filename
+        timer = self.timer
+        written = Session.current().outputs
+        written.clear()
+        compression = sim_setup.get('compress')
+        extension = self.file_extension[self.netlist_type]
+        with timer.phase('netlist'):
+            subcircuits = netlisted = get_subcircuits(main, sim_setup, netlist_pass)
+            name_map = None
+            if sim_setup.get('short_names'):
+                assert self.netlist_type != 'verilog', 'Short names are SPICE only'
+                from .shortnames import shorten_names
+                subcircuits, name_map = shorten_names(subcircuits, main.get_module_type_name())
+                netlisted = subcircuits
+            split_files = {}
+            if sim_setup.get('split_subcircuits'):
+                from .split import split_subcircuits
+                netlisted, split_files = split_subcircuits(subcircuits, self.netlist_type, extension, compression)
+        spice = render_netlist(main, sim_setup, template_str, timer=timer, subcircuits=netlisted)
+
+        with timer.phase('write'):
+            output_dir = sim_setup['output_dir']
+            top_filename = compressed_filename(os.path.join(output_dir, f'top.{extension}'), compression)
+            write_if_changed(top_filename, spice, written, compression)
+            for filename, contents in split_files.items():
+                write_if_changed(os.path.join(output_dir, filename), contents, written, compression)
+            if name_map is not None:
+                write_if_changed(os.path.join(output_dir, NAME_MAP), name_map, written)
+
+        flat_file = flat_file or self.flat_file
+        if flat_file:
+            assert self.netlist_type != 'verilog', 'Flat netlists are SPICE only'
+            from .flatten import write_flat
+            with timer.phase('flat'):
+                write_flat(subcircuits, main.get_module_type_name(), compressed_filename(flat_file, compression),
+                           outputs=written, compression=compression)
+        # The netlist first, then the sources, the subcircuit files and the flat netlist
+        self.outputs = [top_filename] + [fn for fn in written if fn != top_filename]
+        self.changed = [fn for fn in self.outputs if written[fn]]
+        logger.info('%d of %d output files changed: %s', len(self.changed), len(self.outputs),
+                    ' '.join(self.changed))
         return spice
 
+    def sweep(self, sweep_filename: str, jobs: int = 1, style: str = 'files'):
+        """ Netlist self.module at every corner in the sweep file.
+            See [circuitbrew.sweep][]
+
+            Args:
+                style: 'files' for a netlist per corner, or 'alter'/'data' for a
+                       single netlist
+
+            Returns:
+                list of [circuitbrew.sweep.CornerResult][] for the 'files' style,
+                else the rendered netlist
+        """
+        from .sweep import Sweep
+        corners = Sweep.load_corners(sweep_filename)
+        sweep = Sweep(self, corners, jobs=jobs)
+        with self.timer.phase('sweep'):
+            if style != 'files':
+                return sweep.run_single(style)
+            results = sweep.run()
+        for result in results:
+            logger.info(result)
+        return results
+
     def get_options(self, argv):
         """
             Parse the command-line options and set the following object properties:
@@ -122,7 +327,8 @@ class CircuitBrew:
         docstring = docstring % ('|'.join(self.flow), 
                               ','.join(self.flow.keys()),
                               '\n'.join(['    '+k+' '*(padding+4-len(k))+v for k,v  in self.flow.items()]))
-        args = docopt(docstring, version=__version__)
+        with self.timer.phase('options'):
+            args = docopt(docstring, argv=argv, version=__version__)
         if args['--debug']:
             logging.basicConfig(level=logging.DEBUG, format='%(message)s')
         elif args['--verbose']:
@@ -148,6 +354,24 @@ class CircuitBrew:
         self.module   = args['MODULE']
         self.netlist_type = args['NETLIST_TYPE']
 
+        if args['--profile']:
+            from .profiling import Profiler
+            self.profiler = Profiler()
+
+        self.vcd_file = args['--vcd']
+        if (trace_file := args['--trace']) is None and self.vcd_file:
+            trace_file = str(Path(self.vcd_file).with_suffix('.cbt'))
+        self.trace_file = trace_file
+        self.channel_stats_file = args['--channel-stats']
+        self.throughput_file = args['--throughput']
+        self.timing_file = args['--timing']
+        self.stats_file = args['--stats']
+        self.merge_subckts = args['--merge-subckts']
+        self.split_subckts = args['--split-subckts']
+        self.compress = args['--compress']
+        self.short_names = args['--short-names']
+        self.flat_file = args['--flat']
+
         self.args = args # Just save this for posterity
 
 
@@ -168,4 +392,11 @@ class CircuitBrew:
         logger.info('Analyzing options...')
         self.get_options(argv)
         logger.info('Setting up run...')
-        self.netlist()
+        if self.args['--sweep']:
+            self.sweep(self.args['--sweep'], int(self.args['--jobs']), self.args['--sweep-style'])
+        else:
+            self.netlist()
+        if self.args['--time-startup']:
+            print(self.timer.report(), file=sys.stderr)
+        if self.profiler is not None:
+            self.profiler.write(self.args['--profile'], self.timer)
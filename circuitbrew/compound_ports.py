@@ -1,6 +1,5 @@
 import logging
 
-from .symbols import SymbolTable
 from .ports import Port
 
 logger = logging.getLogger(__name__)
@@ -18,15 +17,40 @@ class CompoundPort(Port):
                 clk = InputPort()
             ```
 
+        The sub ports declared in the class are found once per class (see
+        `_fields`), so creating a compound port only creates its sub ports.  Two
+        compound ports are equal when they hold the same sub ports.
+
         Attributes:
-            sym_table (SymbolTable): Hold all the mappings
+            _fields (tuple): (name, declared sub port) of each sub port, in declaration order
+            _ports (tuple): This instance's sub ports, in the order of `_fields`
     """
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        declared = {}
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                if isinstance(attr, Port):
+                    declared[name] = attr
+        cls._fields = tuple(sorted(declared.items(), key=lambda field: field[1].count))
 
     def __init__(self, name=""):
         """In general, no extra args except the name if needed
         """
         super().__init__(name)
-        self.sym_table = SymbolTable(self)
+        ports = []
+        for sub_port_name, sub_port in self._fields:
+            ports.append(type(sub_port)(name=sub_port_name))
+            self.__dict__[sub_port_name] = ports[-1]
+        self._ports = tuple(ports)
+
+    def get_ports(self) -> dict[str, Port]:
+        """ Returns:
+                dict: sub port name -> sub port, in declaration order
+        """
+        return {name: port for (name, _), port in zip(self._fields, self._ports)}
 
     def _insert_into_instance(self, instance):
         """ Used for the descriptor protocol for attribute access to the sub ports.
@@ -35,16 +59,10 @@ class CompoundPort(Port):
 
                 CompoundPort: Either the lookup if it exists, or the newly created self
         """
-        
-        # Need to create a new CompoundPort object and create new Sub port objects to go along with it
         if (compound_port:= instance.__dict__.get(self.name)):
             return compound_port
         else:
-            compound_port = type(self)(name=self.name)
-            for sub_port_name, sub_port in compound_port.sym_table.get_ports().items():
-                #compound_port.__dict__[sub_port_name] = type(sub_port)(name=f'{self.name}.{sub_port_name}')
-                compound_port.__dict__[sub_port_name] = type(sub_port)(name=f'{sub_port_name}')
-            instance.__dict__[self.name] = compound_port
+            compound_port = instance.__dict__[self.name] = type(self)(name=self.name)
             return compound_port
 
     def __get__(self, instance, cls):
@@ -54,18 +72,12 @@ class CompoundPort(Port):
     def __set__(self, instance, value):
         # This gets called when we try to assign one compound port to another
         # We need to make sure the fields match up
-        #assert isinstance(value, type(self)), f'Trying to connect two compound ports of types {type(value)} and {type(self)}'
         port = self._insert_into_instance(instance)
-
-        # Create a new CompoundPort object (not a descriptor) to store it into the instance
-        # if the instance does not already have it
-        for port_name, subport in port.sym_table.get_ports().items():
-            val = getattr(value, port_name)
-            subport._set(val)
+        port._set(value)
 
     def _set(self, value):
         assert isinstance(value, CompoundPort), f'Trying to set {self} to non-compound port type {type(value)}'
-        for port_name, subport in self.sym_table.get_ports().items():
+        for (port_name, _), subport in zip(self._fields, self._ports):
             subport._set(getattr(value, port_name))
 
 
@@ -74,55 +86,43 @@ class CompoundPort(Port):
             
     def __repr__(self):
         # Get all the subports
-        port_dict = self.sym_table.get_ports()
-        l = [f'{n}:{p}' for n,p in port_dict.items() ]
+        l = [f'{n}:{p}' for n,p in self.get_ports().items() ]
 
         return ' '.join(l)
 
     def get_spice(self):
         # Need to get all the sub ports
-        ports = self.sym_table.get_ports() 
-        ports_spice = [port.get_spice() for port in ports.values()]
-        #s = ' '.join([ port.get_spice() for port in ports.values()])
+        ports_spice = [port.get_spice() for port in self._ports]
         s = ' '.join([f'{self.name}.{port}' for port in ports_spice])
         return s
 
     def get_instance_spice(self, scope):
         # Need to get all the sub ports
         # TODO: Do we need to maintain the hierarchy name for the sub-ports?
-        ports = self.sym_table.get_ports() 
-        s = ' '.join([ port.get_instance_spice(scope) for port in ports.values()])
+        s = ' '.join([ port.get_instance_spice(scope) for port in self._ports])
         return s
 
     def __eq__(self, other):
         if not isinstance(other, CompoundPort):
             return False
-        myports = self.sym_table.get_ports()
-        other_ports = set(other.sym_table.get_ports().values())
-
-
-        for port_name, port in myports.items():
-            if port not in other_ports:
-                return False
-        return True
+        return self._ports == other._ports
 
     def __hash__(self):
-        return hash(map(hash, self.sym_table.get_ports()))
+        return hash(self._ports)
 
     def __iter__(self):
-        myports = self.sym_table.get_ports()
-        for portname, port in myports.items():
+        for port in self._ports:
             yield from port
 
     def get_flattened(self, parent_scope_name=None):
         port_dict = {}
-        for portname, port in self.sym_table.get_ports().items():
+        for port in self._ports:
             subport_dict = port.get_flattened(parent_scope_name=self.name)
             port_dict = port_dict | subport_dict
         return port_dict
         
     def iter_flattened(self):
-        for port in self.sym_table.get_ports().values():
+        for port in self._ports:
             yield from port.iter_flattened()
 
     def is_flat(self): 
@@ -133,11 +133,11 @@ class SupplyPort(CompoundPort):
     """Use this for passing around the vdd and gnd global ports
 
         Attributes:
-            vdd (Port): + terminal
             gnd (Port): - terminal    
+            vdd (Port): + terminal
     """
-    vdd = Port()
     gnd = Port()
+    vdd = Port()
 
 
 class E1of2(CompoundPort):
@@ -170,7 +170,7 @@ class E1of2(CompoundPort):
         """ Just use the true rail for sending valuese for modelling
         """
         val = await self.t.recv()
-        logger.info(f'channel {self} received {val}')
+        logger.info('channel %s received %s', self, val)
         return val
 
 class E1of2InputPort(E1of2):
@@ -0,0 +1,141 @@
+"""
+    Merge subcircuits that are structurally identical, enabled with the
+    `merge_subcircuits` tech option (or `cb_netlist --merge-subckts`).
+
+    Every Parameterize'd or Verilog parameterized module gets a type (and a
+    subcircuit) of its own, even when it ends up with the same body as another
+    one, e.g. the sources of an array that all send the same values.  This pass
+    keeps the first of each set of identical subcircuits and points the instances
+    of the others to it, so the simulator parses each body once.
+
+    Two subcircuits are identical when their bodies are, up to the names of
+    their ports (compared by position), internal nets and elements (compared by
+    order of first use), with the types of their instances compared the same way,
+    recursively.  The nets are those of the instance and element lines (parsed
+    as in [circuitbrew.flatten][]) and the probes of the `.measure` statements;
+    the canonical names can't clash with the names left as they are.  Verilog-A
+    modules (`.hdl` lines) are identical when their sources are, up to the module
+    name.  Anything else in a body (models, parameters, measurements) must match
+    literally, and a subcircuit with a line that can't be parsed is never merged,
+    so the pass only ever misses merges, it never merges different circuits.
+"""
+import re, hashlib, logging
+
+from .flatten import NODE_COUNTS, GLOBAL_NETS, parse_subcircuit, rename_probes
+
+logger = logging.getLogger(__name__)
+
+
+def _split_instance(line: str):
+    """ Returns:
+            (tokens, index of the type token) of an instance line, or None for other lines
+    """
+    if not line[:1] in 'xX':
+        return None
+    tokens = line.split()
+    for i in range(len(tokens)-1, 0, -1):
+        if '=' not in tokens[i]:
+            return tokens, i
+    return None
+
+
+def _canonical_subcircuit(type_name: str, lines: list[str], child_key) -> list[str]:
+    """ Returns:
+            The lines of a subcircuit with its ports, nets and elements renamed to
+            `\\0p<i>`, `\\0n<i>` and `\\0<letter><i>`, and the types of its instances
+            to child_key(type), or None if a line can't be parsed
+    """
+    for line in lines[1:]:
+        letter = line[:1].lower()
+        if letter not in NODE_COUNTS and letter not in 'x.*':
+            return None
+    ports, body = parse_subcircuit(type_name, lines)
+    nets = {port: f'\0p{i}' for i, port in enumerate(ports)}
+    elements = {}
+    for entry in body:
+        if entry[0] != '.':
+            elements[entry[1]] = f'\0{entry[1][0].lower()}{len(elements)}'
+            for net in entry[2]:
+                if net not in nets:
+                    nets[net] = net if net in GLOBAL_NETS else f'\0n{len(nets)}'
+
+    names = set(nets) | set(elements)
+    canonical = [f'.subckt {len(ports)}']
+    for entry in body:
+        kind = entry[0]
+        if kind == 'x':
+            _, name, inst_nets, child, rest = entry
+            canonical.append(' '.join([elements[name], *[nets[net] for net in inst_nets],
+                                       child_key(child), *rest.split()[1:]]))
+        elif kind == 'e':
+            _, name, elem_nets, rest = entry
+            canonical.append(' '.join([elements[name], *[nets[net] for net in elem_nets], rest]))
+        else:
+            line = rename_probes(entry[1], lambda arg: elements.get(arg) or nets.get(arg) or arg)
+            if names.intersection(line.split()):
+                return None   # Refers to a net or element outside of a probe
+            canonical.append(line)
+    return canonical
+
+
+def merge_subcircuits(modules: dict, read_source=None) -> dict:
+    """ Merge the identical subcircuits
+
+        Args:
+            modules: Module type name -> lines of its subcircuit, in netlist order
+            read_source: Returns the contents of a Verilog-A source file (or None if
+                         it isn't available), to compare the `.hdl` modules
+
+        Returns:
+            dict: Module type name -> lines, without the duplicates, and with the
+                  instances of the duplicates renamed to the subcircuit kept
+    """
+    keys = {}       # Type name -> structural hash
+    kept = {}       # Structural hash -> first type name with it
+
+    def key_of(type_name):
+        if (key := keys.get(type_name)) is not None:
+            return key
+        keys[type_name] = type_name.encode()  # Until known (guards against cycles)
+        lines = modules[type_name]
+        if lines and lines[0].startswith('.subckt'):
+            canonical = _canonical_subcircuit(type_name, lines,
+                            lambda child: key_of(child).hex() if child in modules else child)
+        else:
+            canonical = []
+            for line in lines:
+                if line.startswith('.hdl') and read_source is not None:
+                    source = read_source(line.split(None, 1)[1].strip())
+                    if source is not None:
+                        line = '.hdl ' + re.sub(rf'\b{re.escape(type_name)}\b', '@', source)
+                    else:
+                        canonical = None
+                        break
+                canonical.append(line)
+        if canonical is None:
+            canonical = [f'\0{type_name}']   # Can't tell, so unique
+        key = keys[type_name] = hashlib.blake2b('\n'.join(canonical).encode(), digest_size=16).digest()
+        return key
+
+    renames = {}
+    for type_name in modules:
+        rep = kept.setdefault(key_of(type_name), type_name)
+        if rep != type_name:
+            renames[type_name] = rep
+    if not renames:
+        return modules
+
+    merged = {}
+    for type_name, lines in modules.items():
+        if type_name in renames:
+            continue
+        new_lines = []
+        for line in lines:
+            if (split := _split_instance(line)) is not None and split[0][split[1]] in renames:
+                tokens, type_index = split
+                tokens[type_index] = renames[tokens[type_index]]
+                line = ' '.join(tokens)
+            new_lines.append(line)
+        merged[type_name] = new_lines
+    logger.info('Merged %d duplicate subcircuits into %d', len(renames), len(set(renames.values())))
+    return merged
@@ -1,13 +1,13 @@
 import os
 import logging
-import curio
 from .measure import Power
 from .ports import *
 from .compound_ports import SupplyPort
 from .module import Leaf, Module, ParameterizedModule, SourceModule
+from .session import SessionAttribute
 
-# The template files
-from mako.template import Template
+# The template files (mako and curio are only imported when a template is rendered
+# or a simulation is run)
 import importlib.resources as pkg_resources
 import circuitbrew.tech as tech
 
@@ -45,6 +45,16 @@ class VoltageSource(Leaf):
         s.append(f'V{self.name} {connected} 0 {self.voltage}')
         return '\n'.join(s)
 
+    def get_instance_verilog(self, scope, nets):
+        """ Drive the node with supply strength: 1 unless the voltage is 0
+        """
+        node, = self._get_verilog_nets(scope, nets)
+        try:
+            high = float(str(self.voltage).rstrip('Vv')) != 0
+        except ValueError:
+            high = True   # e.g. 750mV
+        return f"assign (supply1, supply0) {node} = 1'b{int(high)};"
+
 class Supply(Module):
     """ Instantiate the full supply for vdd and gnd as a sub-circuit.
 
@@ -120,6 +130,16 @@ class ResetPulse(Leaf):
         s.append(f'Vpwl{self.name} {node_str} {gnd_str} PWL (0n 0 {rsttime}n 0 {rsttime+self.slope}n {self.sim_setup["voltage"]})')
         return 'n'.join(s)
 
+    def get_instance_verilog(self, scope, nets):
+        """ A step from 0 to 1 at the middle of the slope
+        """
+        from .verilog import escape
+        node = self._get_verilog_nets(scope, nets)[0]
+        reg = escape(f'Vpwl{self.name}')
+        return '\n'.join([f"reg {reg} = 1'b0;",
+                          f"initial #{self.deassert_time + self.slope/2} {reg} = 1'b1;",
+                          f'assign {node} = {reg};'])
+
 class VerilogModule(Module):
     """ Any Module class that depends on a Verilog-A/Verilog code inside a template file
         can subclass this.  It will automatically copy the template file to the output directory.
@@ -130,6 +150,8 @@ class VerilogModule(Module):
         [circuitbrew.elements.VerilogParameterizedModule][] below.
         
     """
+    hdl_sources = SessionAttribute('hdl_sources')  # None unless netlisting in memory
+    _outputs = SessionAttribute('outputs')
 
     def build(self):
         self.finalize()
@@ -150,9 +172,14 @@ class VerilogModule(Module):
             Returns:
                 out_filename (str): The output file
         """
-        mytemplate = Template(pkg_resources.files(tech).joinpath(src_filename).read_text())
+        from .netlist import get_template
+        if (profiler := self.profiler) is not None:
+            start = profiler.start()
+        mytemplate = get_template(pkg_resources.files(tech).joinpath(src_filename).read_text())
 
         srcfile = mytemplate.render(**param_dict, **self.sim_setup)
+        if profiler is not None:
+            profiler.add('render', self.get_module_type_name(), start)
 
         if not out_filename: out_filename=src_filename
         self._write_file(out_filename, srcfile)
@@ -160,16 +187,22 @@ class VerilogModule(Module):
 
     def _write_file(self, filename: str, contents: str):
         """ Write out the filename to the output directory in `sim_setup['output_dir']`.
-            Optionally create that directory if it doesn't exist
+            Optionally create that directory if it doesn't exist.  The file is only
+            rewritten if its contents changed (see [circuitbrew.outputs][]).  When
+            netlisting in memory (see [circuitbrew.netlist][]), keep it in the session
+            instead.
         """
+        from .outputs import write_if_changed
+        if (sources := self.hdl_sources) is not None:
+            sources[filename] = contents
+            return
         output_dir = self.sim_setup['output_dir']
         
         if not os.path.isdir(output_dir):
-            logger.info(f'Creating output directory {output_dir}')
+            logger.info('Creating output directory %s', output_dir)
             os.makedirs(output_dir)
 
-        with open(os.path.join(output_dir, filename), 'w') as f:
-            f.write(contents)
+        write_if_changed(os.path.join(output_dir, filename), contents, self._outputs)
 
 
     def get_spice(self, param_dict={}):
@@ -186,9 +219,20 @@ class VerilogModule(Module):
                       }
         self._emit_src_file(src_filename, param_dict)
 
-        l = [f'.hdl {src_filename}']
+        l = [self._include(src_filename)]
         return l
 
+    def get_verilog(self):
+        return self.get_spice()
+
+    def _include(self, filename: str) -> str:
+        """ Returns:
+                The netlist line that loads the source file
+        """
+        if self.sim_setup['sim_type'] == 'verilog':
+            return f'`include "{filename}"'
+        return f'.hdl {filename}'
+
 class VerilogClock(VerilogModule):
     """ Create a clock with the specified frequency and offset
 
@@ -208,13 +252,19 @@ class VerilogClock(VerilogModule):
         super().__init__(name=name, **kwargs)
         self.freq = freq
         self.offset = offset
-        self.src_filename = {'hspice': 'hspice_clk.va'}
+        self.src_filename = {'hspice': 'hspice_clk.va', 'verilog': 'verilog_clk.v'}
 
     def get_instance_spice(self, scope):
         s = super().get_instance_spice(scope)
         s = f'{s} freq={self.freq} offset={self.offset}'
         return s
 
+    def get_instance_verilog(self, scope, nets):
+        from .verilog import escape
+        connected = ', '.join(self._get_verilog_nets(scope, nets))
+        return (f'{escape(self.get_module_type_name())} #(.freq({self.freq}), .offset({self.offset})) '
+                f'{escape("x"+self.name)}({connected});')
+
 class VerilogParameterizedModule(ParameterizedModule, VerilogModule): 
     """ For any verilog-a/verilog module that we need to uniquify the template
         file.
@@ -233,7 +283,7 @@ class VerilogParameterizedModule(ParameterizedModule, VerilogModule):
 
         self._emit_src_file(src_filename, param_dict, output_filename)
 
-        l = [f'.hdl {output_filename}']
+        l = [self._include(output_filename)]
         return l
 
 class VerilogSrc(VerilogParameterizedModule, SourceModule):
@@ -256,7 +306,7 @@ class VerilogSrc(VerilogParameterizedModule, SourceModule):
     def __init__(self, name, values: list[int], **kwargs):
         super().__init__(name=name, **kwargs)
         self.values = values
-        self.src_filename = {'hspice': 'hspice_src.va'}
+        self.src_filename = {'hspice': 'hspice_src.va', 'verilog': 'verilog_src.v'}
     
     def get_spice(self):
         param_dict = {'values': self.values,
@@ -293,7 +343,7 @@ class VerilogBucket(VerilogParameterizedModule):
     def __init__(self, name: str, values: list[int]=None, **kwargs):
         super().__init__(name=name, **kwargs)
         self.values = values
-        self.src_filename = {'hspice': 'hspice_bucket.va'}
+        self.src_filename = {'hspice': 'hspice_bucket.va', 'verilog': 'verilog_bucket.v'}
     
     def get_spice(self):
         param_dict = {'values': self.values,
@@ -309,12 +359,13 @@ class VerilogBucket(VerilogParameterizedModule):
         if self.values: 
             # No need to simulate if user already supplied the expected values
             return
+        import curio
         try:
-            logger.info(f'Bucket {self} waiting')
+            logger.info('Bucket %s waiting', self)
             vals = []
             while True:
                 val = await self.d.recv()
-                logger.info(f'Bucket {self} received {val}')
+                logger.info('Bucket %s received %s', self, val)
                 vals.append(val)
         except curio.CancelledError:
             pass # Time to end because the simulation is done and we were cancelled
@@ -28,11 +28,21 @@ class Fet(Leaf):
         scope.instance.fet_count.update([self.__class__])
         return s
 
+    def get_instance_verilog(self, scope, nets):
+        """ A switch (tranif1/tranif0) between the drain and source, numbered like the
+            SPICE fets.  The bulk isn't modelled.
+        """
+        d, g, s, b = self._get_verilog_nets(scope, nets)
+        cnt = scope.instance.fet_count[self.__class__]
+        scope.instance.fet_count.update([self.__class__])
+        return f'{self.switch} xm{self.inst_prefix}{cnt}({d}, {s}, {g});'
+
 class Nfet(Fet):
     """Nfet
     """
 
     inst_prefix = 'n'
+    switch = 'tranif1'   # Verilog switch primitive
 
     def post_init(self):
         self.fet_type = getattr(self, self.vt)
@@ -49,6 +59,7 @@ class Pfet(Fet):
     """
 
     inst_prefix = 'p'
+    switch = 'tranif0'
 
     def post_init(self):
         self.fet_type = getattr(self, self.vt)
@@ -0,0 +1,175 @@
+"""
+    Write a flat netlist of a design (no `.subckt`s), enabled with
+    `cb_netlist --flat FILE`, for tools that need one (LVS, fast-SPICE).
+
+    The subcircuits of the hierarchical netlist are expanded from the top
+    instance (`xmain`) down, and each element is written to the file as soon as
+    it is reached, so memory is proportional to the depth of the hierarchy times
+    the size of a subcircuit, not to the size of the flat design.  Each
+    subcircuit is parsed once.
+
+    The flat names are the hierarchical SPICE names:
+
+    - a net takes the name of the net it's connected to in the highest instance
+      it reaches through subcircuit ports, e.g. `xmain.r_0` rather than
+      `xmain.xwchb_1.l.t`; internal nets are prefixed with their instance path
+      (`xmain.xwchb_1.mypreset`).  Node `0` is global.
+    - an element is prefixed with its instance path, keeping its type letter in
+      front (`xmain.xwchb_1.xmn0`, `Vxmain.xvdd.Vvdd_vdd`).
+
+    All the nets and elements of an instance share its path string, and the
+    ports of an instance are the very strings of the nets they connect to.  The
+    probes of the `.measure` statements (`v(node)`, `i(element)`) are renamed too.
+"""
+import re, sys, logging
+
+logger = logging.getLogger(__name__)
+
+# Nodes of each SPICE element (by the first letter of its name); subcircuit calls
+# (x) take every token up to the subcircuit name
+NODE_COUNTS = {'r': 2, 'c': 2, 'l': 2, 'd': 2, 'v': 2, 'i': 2, 'b': 2, 'f': 2, 'h': 2,
+               'q': 3, 'j': 3, 'm': 4, 'e': 4, 'g': 4}
+GLOBAL_NETS = frozenset(['0'])
+
+_PROBE = re.compile(r'\b([A-Za-z]\w*)\(([^()]*)\)')
+
+
+def parse_subcircuit(type_name: str, lines: list[str]):
+    """ Parse the lines of a subcircuit
+
+        Returns:
+            (port names, body): body has ('x', name, nets, child type, rest),
+            ('e', name, nets, rest) and ('.', line) entries
+    """
+    ports = [sys.intern(port) for port in lines[0].split()[2:]]
+    body = []
+    for line in lines[1:]:
+        tokens = line.split()
+        if not tokens or tokens[0] == '.ends':
+            continue
+        name = tokens[0]
+        letter = name[0].lower()
+        if letter == 'x':
+            i = len(tokens) - 1
+            while i > 1 and '=' in tokens[i]:
+                i -= 1
+            body.append(('x', name, [sys.intern(net) for net in tokens[1:i]], tokens[i], ' '.join(tokens[i:])))
+        elif letter in NODE_COUNTS:
+            n = NODE_COUNTS[letter]
+            body.append(('e', name, [sys.intern(net) for net in tokens[1:1+n]], ' '.join(tokens[1+n:])))
+        else:
+            assert letter in '.*', f'Cannot parse line "{line}" of {type_name}: unknown element type'
+            if letter == '.':
+                body.append(('.', line))
+    return ports, body
+
+
+def rename_probes(line: str, rename) -> str:
+    """ Returns:
+            line with the arguments of its probes (`v(node)`, `i(element)`) renamed
+            with rename(argument)
+    """
+    def rename_args(match):
+        args = [rename(arg.strip()) for arg in match.group(2).split(',')]
+        return f'{match.group(1)}({",".join(args)})'
+    return _PROBE.sub(rename_args, line)
+
+
+class FlatWriter:
+    """ Expand the subcircuits of a netlist into a flat netlist
+
+        Args:
+            subcircuits: Module type name -> lines of its subcircuit (from
+                         [circuitbrew.netlist.get_subcircuits][])
+            out: The file to write to
+    """
+    def __init__(self, subcircuits: dict, out):
+        self.subcircuits = subcircuits
+        self.out = out
+        self.elements = 0
+        self.instances = 0
+        self._parsed = {}   # Type name -> (ports, body)
+
+    def _parse(self, type_name: str):
+        """ Returns:
+                (port names, body) (see parse_subcircuit), parsed once per type
+        """
+        if (parsed := self._parsed.get(type_name)) is not None:
+            return parsed
+        parsed = self._parsed[type_name] = parse_subcircuit(type_name, self.subcircuits[type_name])
+        return parsed
+
+    def _is_subckt(self, type_name: str) -> bool:
+        lines = self.subcircuits.get(type_name)
+        return bool(lines) and lines[0].startswith('.subckt')
+
+    def write_instance(self, type_name: str, path: str, port_nets: list = None):
+        """ Write the elements of an instance of type_name (and of all its sub-instances)
+
+            Args:
+                path: Hierarchical name of the instance (e.g. `xmain.xwchb_0`)
+                port_nets: Flat names of the nets connected to its ports (by default
+                           the ports are named inside the instance)
+        """
+        ports, body = self._parse(type_name)
+        self.instances += 1
+        if port_nets is None:
+            nets = {port: f'{path}.{port}' for port in ports}
+        else:
+            assert len(port_nets) == len(ports), \
+                f'{path} connects {len(port_nets)} nets to the {len(ports)} ports of {type_name}'
+            nets = dict(zip(ports, port_nets))
+
+        def flat_net(net):
+            if (flat := nets.get(net)) is None:
+                flat = net if net in GLOBAL_NETS else f'{path}.{net}'
+                nets[net] = flat
+            return flat
+
+        def flat_element(name):
+            return f'{path}.{name}' if name[0] in 'xX' else f'{name[0]}{path}.{name}'
+
+        elements = None
+        write = self.out.write
+        for entry in body:
+            kind = entry[0]
+            if kind == 'x' and self._is_subckt(entry[3]):
+                _, name, inst_nets, child, _ = entry
+                self.write_instance(child, f'{path}.{name}', [flat_net(net) for net in inst_nets])
+            elif kind == '.':
+                line = entry[1]
+                if '(' in line:
+                    if elements is None:
+                        elements = {e[1] for e in body if e[0] != '.'}
+                    line = rename_probes(line, lambda arg: flat_element(arg) if arg in elements
+                                                           else flat_net(arg) if arg in nets else arg)
+                write(line + '\n')
+            else:
+                name, elem_nets, rest = entry[1], entry[2], entry[-1]
+                write(f'{flat_element(name)} {" ".join([flat_net(net) for net in elem_nets])} {rest}\n')
+                self.elements += 1
+
+
+def write_flat(subcircuits: dict, main_type_name: str, filename: str, main_name: str = 'xmain',
+               outputs: dict = None, compression: str = None) -> dict:
+    """ Write the flat netlist of the design whose top subcircuit is main_type_name
+        (only replacing the file if it changed, see [circuitbrew.outputs][])
+
+        Args:
+            outputs: filename -> whether it changed is recorded in this dict
+            compression: `gzip` or `zstd` to compress the file as it's written
+
+        Returns:
+            dict: the number of `elements` and subcircuit `instances` written
+    """
+    from .outputs import output_file
+    with output_file(filename, outputs, compression) as f:
+        f.write(f'* Flat netlist of {main_type_name}\n')
+        for type_name, lines in subcircuits.items():
+            if lines and not lines[0].startswith('.subckt'):
+                # Not a subcircuit, e.g. the .hdl statement of a Verilog-A module
+                f.writelines(line + '\n' for line in lines)
+        writer = FlatWriter(subcircuits, f)
+        writer.write_instance(main_type_name, main_name)
+    logger.info('Wrote %d elements of %d instances to flat netlist %s', writer.elements, writer.instances, filename)
+    return {'elements': writer.elements, 'instances': writer.instances}
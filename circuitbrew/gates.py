@@ -2,7 +2,6 @@ from .compound_ports import SupplyPort, CompoundPort
 from .ports import InputPort, OutputPort, InputPorts, OutputPorts
 from .fets import Nfet, Pfet
 from .module import Module, SourceModule, Param, Parameterize
-from .elements import VerilogParametrizedModule
 
 class Inv(Module):
     """ Parametrized (n/p sizing and vt choice) inverter
@@ -38,6 +37,8 @@ class Inv(Module):
     n_strength : Param
     p_strength : Param
     vt         : Param
+    forward_latency  : Param  # For timed sims (see circuitbrew.timing)
+    backward_latency : Param
 
     def build(self):
         """ Two transistors """
@@ -83,6 +84,8 @@ class NorN(Module):
     
     """
     N: Param
+    forward_latency: Param  # For timed sims (see circuitbrew.timing)
+    backward_latency: Param
 
     a = InputPorts(width=Param('N'))
     b = OutputPort()
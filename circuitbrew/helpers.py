@@ -1,36 +1,93 @@
 
-import logging
+import sys, logging, time, itertools
+from contextlib import contextmanager
 from functools import wraps
 
+from .session import SessionAttribute
+
 class LogBlock:
-    blocks = {}
+    """ Log a banner at the start of a block, and again at its end (the second
+        LogBlock with the same name).  Does nothing unless INFO logging is on.
+    """
+    blocks = SessionAttribute('log_blocks')
     def __init__(self, name):
-        if name not in LogBlock.blocks:
+        logger = logging.getLogger(__name__)
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        blocks = self.blocks
+        if name not in blocks:
             msg = f'Starting {name}'
-            LogBlock.blocks[name] = 'in progress'
+            blocks[name] = 'in progress'
         else:
             msg = f'Ending {name}'
-            del LogBlock.blocks[name]
-        logger = logging.getLogger(__name__)
+            del blocks[name]
         msg_len = len(msg)+16
         logger.info('\n'+'-'*msg_len)
-        logger.info(f'\t{msg}')
+        logger.info('\t%s', msg)
         logger.info('-'*msg_len)
     
 
+class PhaseTimer:
+    """ Accumulate the wall-clock time spent in each named phase of a run.
+
+        Examples:
+
+            >>> timer = PhaseTimer()
+            >>> with timer.phase('build'):
+                    walker.run()
+            >>> print(timer.report())
+
+        Args:
+            start: perf_counter() value to measure the first phase from (defaults to now)
+    """
+    def __init__(self, start: float = None):
+        self.start = start if start is not None else time.perf_counter()
+        self.phases = {}
+        self.blocks = {}  # Net change in allocated memory blocks over each phase
+
+    def mark(self, name: str, since: float = None):
+        """ Record the time elapsed from `since` (or the timer start) as phase `name`
+        """
+        since = self.start if since is None else since
+        self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - since
+
+    @contextmanager
+    def phase(self, name: str):
+        b0 = sys.getallocatedblocks()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(name, t0)
+            self.blocks[name] = self.blocks.get(name, 0) + sys.getallocatedblocks() - b0
+
+    def total(self) -> float:
+        return time.perf_counter() - self.start
+
+    def report(self) -> str:
+        total = self.total()
+        width = max([len(name) for name in self.phases] + [len('total')])
+        lines = [f'{name:<{width}}  {t*1000:9.2f} ms' for name, t in self.phases.items()]
+        lines.append(f'{"total":<{width}}  {total*1000:9.2f} ms')
+        return '\n'.join(lines)
+
+
 def log_block(block_name):
     def printer():
         logger.info('\n------------')
-        logger.info(f'\tStarting {block_name}')
+        logger.info('\tStarting %s', block_name)
         yield
-        logger.info(f'\tEnding {block_name}')
+        logger.info('\tEnding %s', block_name)
 
     
 class WithId:
-    count = 0
+    """ Gives every object a unique, increasing `count`.  This records creation
+        (declaration) order, e.g. to list a module's ports in the order they were
+        declared, so it is process-wide rather than per Session.
+    """
+    _ids = itertools.count()
     def __init__(self):
-        self.count = WithId.count
-        WithId.count += 1
+        self.count = next(WithId._ids)
 
 def is_listable(self, obj):
     from typing import Iterable, Sequence, MutableSequence, Mapping, Text
@@ -16,6 +16,16 @@ class Measure(Leaf):
         node_name = scope.get_symbol_from_scope(next(iter(self.node.connections)))[0]
         return node_name
 
+    def get_measure_names(self) -> dict:
+        """ Returns:
+                dict: quantity -> name of the .measure result this emits (see
+                [circuitbrew.measurements][] to read them back)
+        """
+        return {}
+
+    def get_instance_verilog(self, scope, nets):
+        # Measurements are SPICE only
+        return ''
 
 
 class Freq(Measure):
@@ -25,15 +35,19 @@ class Freq(Measure):
         self.second_transition = second_transition
         super().__init__(name=name, **kwargs)
 
+    def get_measure_names(self):
+        return {'cycletime': f'cycletime{self._id}', 'freq': f'freq{self._id}'}
+
     def get_instance_spice(self, scope):
         #node_name = ' '.join(self._get_instance_ports(scope))
         LogBlock(f'FREQ scope')
-        logger.debug(scope)
-        logger.debug(scope.instance)
-        logger.debug(self.node)
-        logger.debug('fast locals table:')
-        for local_port, local_connected_set in scope.connected['locals'].items():
-            logger.debug(f'{local_port} == {local_connected_set}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(scope)
+            logger.debug(scope.instance)
+            logger.debug(self.node)
+            logger.debug('fast locals table:')
+            for local_port, local_connected_set in scope.connected['locals'].items():
+                logger.debug('%s == %s', local_port, local_connected_set)
         LogBlock(f'FREQ scope')
         node_name = self._get_node_name(scope)
         msr = []
@@ -52,6 +66,10 @@ class Power(Measure):
         self.end_time = end_time
         self.voltage_source = voltage_source
 
+    def get_measure_names(self):
+        return {'supplycurrent': f'supplycurrent{self._id}', 'supplypower': f'supplypower{self._id}',
+                'supplypower_direct': f'supplypower_direct{self._id}'}
+
     def get_instance_spice(self, scope):
         assert self.voltage_source, f'Must specify a voltage source in {self}'
         node_name = f'V{self.voltage_source.name}'
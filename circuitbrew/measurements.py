@@ -0,0 +1,165 @@
+"""
+    Read the results of the `.measure` statements (from `Freq`, `Power` and the
+    other `Measure` modules) back from the simulator's measurement files, into
+    NumPy structured arrays with one row per sim run and one field per result.
+
+        >>> measures = find_measures(main)          # after the build
+        >>> data = read_runs(find_measure_files('output'))
+        >>> by_instance(data, measures)['xmain.msr_freq0']['freq']
+        array([3.21e+08, 2.87e+08, ...])
+
+    Two file formats are read:
+
+    - HSPICE-style tables (`.mt0`, `.mt1`, ... one per `.alter` block): `$DATA1`
+      and `.TITLE` header lines, then the column names and then the values, both
+      wrapped over as many lines as needed, one row per sweep point (e.g. per row of
+      a `.data` sweep).  Failed measurements are read as NaN.
+    - `name = value` lines (as written by Xyce), read as one row.
+
+    The simulators lowercase the measurement names, and so do the fields here.
+    NumPy is only needed by this module, and is imported when it's used (install
+    it with the `analysis` extra: `pip install circuitbrew[analysis]`).
+"""
+import os, re, glob, logging
+
+from .module import Module
+from .measure import Measure
+from .walker import Walker
+
+logger = logging.getLogger(__name__)
+
+_VALUE_START = frozenset(b'0123456789+-.')
+_NAME_VALUE = re.compile(rb'(\S+)\s*=\s*(\S+)')
+
+
+class MeasurePass(Walker):
+    """ Collect the Measure instances of a built design
+    """
+    def run(self, found: dict = None) -> dict:
+        found = {} if found is None else found
+        if isinstance(self.target, Measure):
+            found[self.target_name] = self.target
+        for varname, var in vars(self.target).items():
+            for i, module in enumerate(self.iter_flattened(var, lambda x: isinstance(x,Module))):
+                MeasurePass(module, f'{self.target_name}.{varname}{i}').run(found)
+        return found
+
+
+def find_measures(main: Module, main_name: str = 'xmain') -> dict:
+    """ Returns:
+            dict: hierarchical instance name -> Measure, for every Measure in the design
+    """
+    return MeasurePass(main, main_name).run()
+
+
+def _split_table(text: bytes, filename: str) -> tuple[list, list]:
+    """ Returns:
+            (names, values): the column names, and the value tokens of all the rows
+    """
+    lines = text.splitlines()
+    start = 0
+    while start < len(lines) and lines[start].lstrip()[:1] in (b'$', b'.', b'*'):
+        start += 1
+    body = b'\n'.join(lines[start:])
+    if b'=' in body:
+        pairs = _NAME_VALUE.findall(body)
+        return [name for name, _ in pairs], [value for _, value in pairs]
+    tokens = body.split()
+    for n, token in enumerate(tokens):
+        if token[0] in _VALUE_START or token == b'failed':
+            break
+    else:
+        n = len(tokens)
+    names, values = tokens[:n], tokens[n:]
+    assert names, f'No measurement names found in {filename}'
+    assert len(values) % len(names) == 0, \
+        f'{filename} has {len(values)} values, not a whole number of rows of {len(names)} columns'
+    return names, values
+
+
+def read_mt0(filename: str):
+    """ Read one measurement file
+
+        Returns:
+            numpy structured array: one row per sweep point, one float field per result
+    """
+    import numpy as np
+    with open(filename, 'rb') as f:
+        names, values = _split_table(f.read(), filename)
+    names = [name.decode().lower() for name in names]
+    assert len(set(names)) == len(names), f'Duplicate measurement names in {filename}'
+    values = np.array(values)
+    values[values == b'failed'] = b'nan'
+    rows = values.astype(np.float64).reshape(-1, len(names))
+    return rows.view(np.dtype([(name, np.float64) for name in names])).reshape(-1)
+
+
+def find_measure_files(output_dir: str) -> dict:
+    """ Find the measurement files of a sim, or of a sweep (one sub-directory per corner)
+
+        Returns:
+            dict: run label (the path relative to output_dir, e.g. `ss_1v6_125c/top.mt1`)
+                  -> filename, in corner and then `.alter` order
+    """
+    def order(filename):
+        head, ext = os.path.splitext(filename)
+        return head, int(ext[3:] or 0)
+    filenames = glob.glob(os.path.join(output_dir, '*.mt[0-9]*')) \
+              + glob.glob(os.path.join(output_dir, '*', '*.mt[0-9]*'))
+    return {os.path.relpath(filename, output_dir): filename
+                for filename in sorted(filenames, key=order)}
+
+
+def read_runs(filenames):
+    """ Read the measurement files of many runs into one array
+
+        Args:
+            filenames: run label -> filename (e.g. from find_measure_files), or a list of filenames
+
+        Returns:
+            numpy structured array: a `run` field with the label of the file each row
+            came from, then a float field for every result found in any file (NaN in
+            the rows of runs that don't have it)
+    """
+    import numpy as np
+    if not isinstance(filenames, dict):
+        filenames = {filename: filename for filename in filenames}
+    tables = [(label, read_mt0(filename)) for label, filename in filenames.items()]
+    columns = {}
+    for _, table in tables:
+        columns.update(dict.fromkeys(table.dtype.names))
+    label_width = max((len(label) for label in filenames), default=1)
+    data = np.empty(sum(len(table) for _, table in tables),
+                    dtype=[('run', f'U{label_width}')] + [(name, np.float64) for name in columns])
+    for name in columns:
+        data[name] = np.nan
+    row = 0
+    for label, table in tables:
+        rows = slice(row, row+len(table))
+        data['run'][rows] = label
+        for name in table.dtype.names:
+            data[name][rows] = table[name]
+        row += len(table)
+    logger.info('Read %d measurement rows from %d files', len(data), len(tables))
+    return data
+
+
+def by_instance(data, measures: dict) -> dict:
+    """ Map the fields of the data back to the Measure instances that created them
+
+        Args:
+            data: From read_mt0 or read_runs
+            measures: From find_measures
+
+        Returns:
+            dict: instance name -> {quantity (e.g. `freq`): array of its values}, for the
+                  results found in data
+    """
+    fields = set(data.dtype.names)
+    results = {}
+    for instance_name, measure in measures.items():
+        values = {quantity: data[name.lower()]
+                    for quantity, name in measure.get_measure_names().items() if name.lower() in fields}
+        if values:
+            results[instance_name] = values
+    return results
@@ -1,4 +1,3 @@
-import curio
 import inspect
 import sys
 from collections import Counter
@@ -7,12 +6,16 @@ import logging
 from .ports import Port, InputPort
 from .symbols import SymbolTable
 from .stack import Stack
+from .session import SessionAttribute
 
 logger = logging.getLogger(__name__)
 class Module:
-    registry = {}  # All sub classes (class name -> class)
-    module_counts = Counter()
-    _modules = {}
+    # These are owned by the current Session (see circuitbrew.session)
+    registry = SessionAttribute('registry')  # All sub classes (class name -> class)
+    module_counts = SessionAttribute('module_counts')
+    _modules = SessionAttribute('modules')
+    sim_setup = SessionAttribute('sim_setup')
+    profiler = SessionAttribute('profiler')   # None unless profiling
 
     def __init__(self, name='', **kwargs):
         self.finalize_called = False
@@ -31,12 +34,13 @@ class Module:
             if(my_port := self._sym_table.ports.get(p_name)):
                 my_port._set(p)
 
-        logger.debug('\n-------------------------------\n\n')
-        logger.debug(f'Printing ports of {self.get_module_type_name()}:...')
-        logger.debug('\n-------------------------------\n\n')
-        logger.debug(self._sym_table.ports)
-        for name, p in self._sym_table.ports.items():
-            logger.debug (f'{p.count} ')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('\n-------------------------------\n\n')
+            logger.debug('Printing ports of %s:...', self.get_module_type_name())
+            logger.debug('\n-------------------------------\n\n')
+            logger.debug(self._sym_table.ports)
+            for name, p in self._sym_table.ports.items():
+                logger.debug('%s ', p.count)
 
         self.get_sim_setup(**kwargs)
 
@@ -59,7 +63,9 @@ class Module:
            to this object.
 
            If any of these settings have been overridden by the user via the
-           kwargs, then apply those instead
+           kwargs (or Parameterize), then apply those instead.  Settings under an
+           `override` key (e.g. the params of a sweep corner) are applied last,
+           over the Parameterize values (but not the kwargs).
            
            Args:
                 kw: any options you want to override during module/leaf instancing
@@ -68,27 +74,29 @@ class Module:
         """
         # Get any settings from the sim_setup dict, mapped by class name
         setup_dict = self.sim_setup
+        # Values already set (by Parameterize) take priority over the tech defaults
+        preset = set(self.__dict__)
 
-        # Reverse MRO so we apply defaults from base class -> sub classes
-        base_classes = reversed(inspect.getmro(self.__class__))
-
-        def _get_auto_dict(d):
+        def _get_auto_dict(d, base_classes, key):
             # At each dict level, we search for each base class name
             for bc in base_classes:
                 bc_name = bc.__name__
                 bc_dict = d.get(bc_name, {})
                 if bc_dict:
                     # base class name is found, so check if there are any auto settings
-                    auto = bc_dict.get('auto', {})
+                    auto = bc_dict.get(key, {})
                     for k,v in auto.items():
                         # Check if user overrode with kwargs
                         if k in kw:
                             setattr(self, k, kw[k])
-                        else:
+                        elif key == 'override' or k not in preset:
                             setattr(self, k, v)
                     # Recurse
-                    _get_auto_dict(bc_dict)
-        _get_auto_dict(setup_dict)
+                    _get_auto_dict(bc_dict, base_classes, key)
+
+        for key in ('auto', 'override'):
+            # Reverse MRO so we apply defaults from base class -> sub classes
+            _get_auto_dict(setup_dict, reversed(inspect.getmro(self.__class__)), key)
 
     def iter_flattened(self, myiter, filter=lambda x: x is not None):
         """Iterator to flatten arbitrary nested lists"""
@@ -107,15 +115,21 @@ class Module:
         port_list = ' '.join([port.get_spice() for port in self._sym_table.ports.values()])
         l.append(f'.subckt {self.get_module_type_name()} {port_list}')
         # Now, go through all the leaf/module instances in namespace
+        profiler = self.profiler
         for inst_name, modules in self._sym_table.sub_instances.items():
             for module in self.iter_flattened(modules): 
-                l.append(module.get_instance_spice(scope=self._sym_table))
+                if profiler is None:
+                    l.append(module.get_instance_spice(scope=self._sym_table))
+                else:
+                    start = profiler.start()
+                    l.append(module.get_instance_spice(scope=self._sym_table))
+                    profiler.add('get_instance_spice', module.get_module_type_name(), start)
 
         l.append(f'.ends')
         return l
 
     def get_instance_spice(self, scope):
-        logger.debug(f'Getting instance spice for {self.name}:{self.get_module_type_name()}')
+        logger.debug('Getting instance spice for %s:%s', self.name, self.get_module_type_name())
         s = f'x{self.name} {" ".join(self._get_instance_ports(scope))} {self.get_module_type_name()}'
         return s
 
@@ -123,7 +137,59 @@ class Module:
         connected = [port.get_instance_spice(scope) for port in self._sym_table.ports.values()] 
         return connected
 
-   
+    def get_verilog(self):
+        """ The Verilog module of this module type (see [circuitbrew.verilog][])
+        """
+        from .verilog import escape, port_declarations, CHARGE_MODULE
+        ports = [decl for port in self._sym_table.ports.values() for decl in port_declarations(port)]
+        l = [f'module {escape(self.get_module_type_name())}({", ".join([escape(name) for name, _ in ports])});']
+        l += [f'    {direction} {escape(name)};' for name, direction in ports]
+
+        nets = set()
+        body = []
+        for inst_name, modules in self._sym_table.sub_instances.items():
+            for module in self.iter_flattened(modules):
+                body.append(module.get_instance_verilog(self._sym_table, nets))
+        # Every net that isn't a port is declared before it's used
+        port_names = {name for name, _ in ports}
+        internal = sorted(nets - port_names)
+        l += [f'    wire {escape(net)};' for net in internal]
+        l += [f'    {line}' for inst in body for line in inst.splitlines()]
+        if self._has_switches():
+            # The internal nodes of the transistor stacks keep their charge while floating
+            l += [f'    {CHARGE_MODULE} {escape("charge."+net)}({escape(net)});' for net in internal]
+        l.append('endmodule')
+        return l
+
+    def _has_switches(self) -> bool:
+        from .fets import Fet
+        return any(isinstance(module, Fet) for modules in self._sym_table.sub_instances.values()
+                                            for module in self.iter_flattened(modules))
+
+    def get_instance_verilog(self, scope, nets: set) -> str:
+        """ Args:
+                nets: The nets of the parent module used so far (filled in)
+        """
+        from .verilog import escape
+        connected = ', '.join(self._get_verilog_nets(scope, nets))
+        return f'{escape(self.get_module_type_name())} {escape("x"+self.name)}({connected});'
+
+    def _get_verilog_nets(self, scope, nets: set) -> list[str]:
+        """ Returns:
+                The escaped nets connected to each single port, in port order (empty
+                for the unconnected ones)
+        """
+        from .verilog import escape
+        connected = []
+        for port in self._get_instance_ports(scope):
+            for net in port.split():
+                if net == 'UNC':
+                    connected.append('')
+                else:
+                    nets.add(net)
+                    connected.append(escape(net))
+        return connected
+
     def dump_spice(self):
         s = self.get_spice()
         print(s)
@@ -143,7 +209,7 @@ class Module:
             return is_list, isinstance(obj, Module)
 
     def finalize(self):
-        logger.debug(f'Finalizing construction of {self}')
+        logger.debug('Finalizing construction of %s', self)
         #previous_frame = inspect.currentframe().f_back
         previous_frame = inspect.currentframe().f_back
         #frame_info = stack_data.FrameInfo(previous_frame)
@@ -152,14 +218,14 @@ class Module:
         my_locals = previous_frame.f_locals
         logger.debug (my_locals)
         for name, obj in my_locals.items():
-            logger.debug (name)
             if isinstance(obj, Port):
                 self._sym_table.add_local(name, obj)
         del previous_frame
-        logger.debug(f'Instance attributes:')
-        logger.debug(self._sym_table.get_log_ports(self._sym_table.locals))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Instance attributes:')
+            logger.debug(self._sym_table.get_log_ports(self._sym_table.locals))
 
-        logger.debug(f'Instance attributes:')
+        logger.debug('Instance attributes:')
         logger.debug('---------')
         for attr in dir(self):
             obj = getattr(self, attr)
@@ -231,6 +297,7 @@ class Module:
     async def sim(self): 
         # No sim method was defined in this module,
         # So, we need to propagate all values on input to their fanouts
+        import curio
         port_pids = []
         for port in self._sym_table.ports.values():
             pid = await curio.spawn(port.sim())
@@ -243,7 +310,7 @@ class Module:
         except curio.CancelledError:
             # Cancel all ports
             for port_pid in port_pids:
-                logger.info(f'Cancelling port {port_pid}')
+                logger.info('Cancelling port %s', port_pid)
                 await port_pid.cancel()
             raise
         
@@ -258,7 +325,7 @@ class Leaf(Module):
     def build(self):
         """ Finalize this without adding any instances
         """
-        logger.debug(f'Finalized leaf {self.name}')
+        logger.debug('Finalized leaf %s', self.name)
         self.finalize()
 
     def finalize(self): 
@@ -286,6 +353,8 @@ def Param(name):
         return v
     return lookup
 
+# (cls, parameters) -> the class Parameterize made for them, so that every call with
+# the same parameters returns the same class
 def Parameterize(cls, **kwargs):
     """Given Parameterize(cls, N=3, P=4), 
         it will return a new subclass of cls that has an __init__
@@ -299,7 +368,25 @@ def Parameterize(cls, **kwargs):
                     self.P = 4
                     cls.__init__(self, *args, **kwargs)
 
+        Calls with the same cls and parameters return the same class, so its
+        instances share one type name, instance counter and tech settings.  The
+        parameters are matched in order, like the class name is built, so a name
+        never depends on which call came first.  The classes are remembered on cls
+        itself, so they go away with it (e.g. when the netlist server reloads its
+        module).
+
     """
+    key = tuple((name, type(val), val) for name, val in kwargs.items())
+    if (memo := cls.__dict__.get('_parameterized')) is None:
+        memo = {}
+        cls._parameterized = memo
+    try:
+        if (parameterized_class := memo.get(key)) is not None:
+            parameterized_class.registry.setdefault(str(parameterized_class), parameterized_class)
+            return parameterized_class
+    except TypeError:
+        key = None  # Unhashable parameter values get a class of their own
+
     # Check to make sure every param in kwargs was defined as
     # a class annotation of type Param. 
     params = []
@@ -323,5 +410,7 @@ def Parameterize(cls, **kwargs):
     #sys.exit(0)
     parameterized_class = type(f'{cls.__name__}_{params_to_str}', (cls,), 
                               { '__init__': init_fn })
+    if key is not None:
+        memo[key] = parameterized_class
 
-    return parameterized_class
\ No newline at end of file
+    return parameterized_class
@@ -0,0 +1,232 @@
+"""
+    Netlist a design from Python, in memory, for loops that generate many variants
+    of a design (optimizers, design space exploration):
+
+        >>> from circuitbrew.netlist import Tech, netlist
+        >>> tech = Tech.load('sw130')
+        >>> for strength in range(1, 5):
+                result = netlist(Parameterize(Main, strength=strength), tech, voltage=1.6)
+                score(result.top, result.sources)
+        >>> result.write('output/best')
+
+    Each call builds, simulates and netlists the design in a fresh
+    [circuitbrew.session.Session][], so variants never see each other's instance
+    counters or subcircuits.  Nothing is written to disk: the Verilog-A sources of
+    the `VerilogModule`s are kept in the result instead of being written into
+    `output_dir`, until `write()` is called.
+"""
+import os, logging
+from functools import lru_cache, partial
+
+from .module import Module
+from .session import Session
+from .walker import BuildPass, NetlistPass, SimPass
+
+logger = logging.getLogger(__name__)
+
+NAME_MAP = 'names.map'  # The name map file of the short names (see circuitbrew.shortnames)
+
+
+@lru_cache(maxsize=32)
+def get_template(template_str: str):
+    """ Returns:
+            The compiled Mako template (compiled once per template text)
+    """
+    from mako.template import Template
+    return Template(template_str)
+
+
+def get_subcircuits(main: Module, sim_setup: dict, netlist_pass=NetlistPass) -> dict:
+    """ Netlist the built design in the current session
+
+        Args:
+            netlist_pass: The NetlistPass (sub)class to walk the design with
+
+        Returns:
+            dict: Module type name -> lines of its subcircuit (or Verilog module),
+                  with the identical subcircuits merged if the `merge_subcircuits`
+                  tech option is set (see [circuitbrew.dedup][], SPICE only)
+    """
+    netlist_pass(main, 'xmain').run()
+    modules = Module._modules
+    if sim_setup.get('merge_subcircuits') and sim_setup.get('sim_type') != 'verilog':
+        from .dedup import merge_subcircuits
+        modules = merge_subcircuits(modules, partial(_read_source, sim_setup))
+    return modules
+
+
+def _read_source(sim_setup: dict, filename: str):
+    if (sources := Session.current().hdl_sources) is not None:
+        return sources.get(filename)
+    try:
+        with open(os.path.join(sim_setup['output_dir'], filename)) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _source_filename(line: str):
+    """ Returns:
+            The source file loaded by a netlist line (`.hdl` or Verilog `` `include ``), or None
+    """
+    if line.startswith('.hdl'):
+        return line.split(None, 1)[1].strip()
+    if line.startswith('`include'):
+        return line.split(None, 1)[1].strip().strip('"')
+    return None
+
+
+def render_netlist(main: Module, sim_setup: dict, template_str: str, netlist_pass=NetlistPass,
+                   timer=None, subcircuits: dict = None) -> str:
+    """ Netlist the built design in the current session and render the process template
+        (or, for Verilog netlists, the top file of [circuitbrew.verilog][])
+
+        Args:
+            netlist_pass: The NetlistPass (sub)class to walk the design with
+            timer: A PhaseTimer to time the netlist and render phases with
+            subcircuits: The subcircuits, if get_subcircuits was already called
+
+        Returns:
+            The rendered netlist
+    """
+    from contextlib import nullcontext
+    with timer.phase('netlist') if timer else nullcontext():
+        if subcircuits is None:
+            subcircuits = get_subcircuits(main, sim_setup, netlist_pass)
+        lines = []
+        for module, contents in subcircuits.items():
+            lines += contents
+            lines += '\n'
+        sim_setup['circuit'] = '\n'.join(lines)
+        sim_setup['main_type_name'] = main.get_module_type_name()
+
+    with timer.phase('render') if timer else nullcontext():
+        if sim_setup.get('sim_type') == 'verilog':
+            from .verilog import get_top_template
+            template_str = get_top_template()
+        return get_template(template_str).render(**sim_setup)
+
+
+class Tech:
+    """ A process: its tech options and netlist template
+
+        Args:
+            options: The tech options (the parsed tech.yml)
+            template: The text of the process template
+    """
+    def __init__(self, options: dict, template: str):
+        self.options = options
+        self.template = template
+
+    @classmethod
+    def load(cls, process: str) -> 'Tech':
+        """ Load a built-in process (e.g. `sw130`) or a local process directory
+        """
+        from .circuitbrew import CircuitBrew
+        return cls(*CircuitBrew._get_techfile(process))
+
+
+class Netlist:
+    """ A netlisted design, in memory
+
+        Attributes:
+            main (Module): The built design
+            sim_setup (dict): The tech options it was netlisted with
+            top (str): The rendered netlist
+            subcircuits (dict): Module type name -> list of lines of its subcircuit
+            sources (dict): Verilog-A (or Verilog) source filename -> contents
+            measures (dict): Hierarchical instance name -> Measure (to map the sim
+                             results back, see [circuitbrew.measurements][])
+            split (dict): Subcircuit filename -> contents, with the `split_subcircuits`
+                          tech option (see [circuitbrew.split][])
+            name_map (str): The name map, with the `short_names` tech option (see
+                            [circuitbrew.shortnames][]), else None
+            changed (list): The files that changed in the last `write()`
+    """
+    def __init__(self, main, sim_setup, top, subcircuits, sources, measures, split=None, name_map=None):
+        self.main = main
+        self.sim_setup = sim_setup
+        self.top = top
+        self.subcircuits = subcircuits
+        self.sources = sources
+        self.measures = measures
+        self.split = split or {}
+        self.name_map = name_map
+        self.changed = []
+
+    def write(self, output_dir: str = None) -> list[str]:
+        """ Write the netlist and its sources into output_dir (by default the tech
+            file's `output_dir`), only rewriting the files that changed (see
+            [circuitbrew.outputs][]).  The netlists are compressed if the `compress`
+            tech option is set.
+
+            Returns:
+                The files written, the netlist first
+        """
+        from .circuitbrew import CircuitBrew
+        from .outputs import write_if_changed, compressed_filename
+        output_dir = output_dir or self.sim_setup['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+        extension = CircuitBrew.file_extension[self.sim_setup['sim_type']]
+        compression = self.sim_setup.get('compress')
+        netlists = {compressed_filename(f'top.{extension}', compression): self.top, **self.split}
+        written = {}
+        for filename, contents in netlists.items():
+            write_if_changed(os.path.join(output_dir, filename), contents, written, compression)
+        for filename, contents in self.sources.items():
+            write_if_changed(os.path.join(output_dir, filename), contents, written)
+        if self.name_map is not None:
+            write_if_changed(os.path.join(output_dir, NAME_MAP), self.name_map, written)
+        self.changed = [filename for filename, changed in written.items() if changed]
+        return list(written)
+
+    def write_flat(self, filename: str) -> dict:
+        """ Write a flat netlist of the design (see [circuitbrew.flatten][])
+        """
+        from .flatten import write_flat
+        return write_flat(self.subcircuits, self.main.get_module_type_name(), filename)
+
+
+def netlist(main_cls: type, tech: Tech, netlist_type: str = 'hspice', sim: bool = True,
+            **options) -> Netlist:
+    """ Build, simulate and netlist a design in memory
+
+        Args:
+            main_cls: The top Module class
+            tech: The process
+            netlist_type: e.g. `hspice`
+            sim: Run the behavioral sim (needed for the modules that get their
+                 values from it, e.g. buckets)
+            options: Overrides of the tech options (e.g. voltage=1.6)
+
+        Returns:
+            The [circuitbrew.netlist.Netlist][]
+    """
+    from .measurements import find_measures
+    sim_setup = dict(tech.options, sim_type=netlist_type, **options)
+    session = Session(sim_setup, hdl_sources={})
+    with session:
+        main = main_cls()
+        BuildPass(main, 'xmain').run()
+        if sim:
+            import curio
+            curio.run(SimPass(main, 'xmain').run_sim)
+        subcircuits = netlisted = get_subcircuits(main, sim_setup)
+        name_map = None
+        if sim_setup.get('short_names'):
+            assert netlist_type != 'verilog', 'Short names are SPICE only'
+            from .shortnames import shorten_names
+            subcircuits, name_map = shorten_names(subcircuits, main.get_module_type_name())
+            netlisted = subcircuits
+        split = {}
+        if sim_setup.get('split_subcircuits'):
+            from .split import split_subcircuits
+            from .circuitbrew import CircuitBrew
+            netlisted, split = split_subcircuits(subcircuits, netlist_type, CircuitBrew.file_extension[netlist_type],
+                                                 sim_setup.get('compress'))
+        top = render_netlist(main, sim_setup, tech.template, subcircuits=netlisted)
+        measures = find_measures(main)
+    # Only the sources still used after merging subcircuits
+    used = {_source_filename(line) for lines in subcircuits.values() for line in lines}
+    sources = {filename: contents for filename, contents in session.hdl_sources.items() if filename in used}
+    return Netlist(main, sim_setup, top, subcircuits, sources, measures, split, name_map)
@@ -0,0 +1,149 @@
+"""
+    Write the output files (netlists, Verilog-A sources) only when their contents
+    change, so that an unchanged file keeps its mtime and the simulator compile
+    caches and make-style pipelines downstream don't redo work for it.
+
+    Each file is compared with the one on disk (size first, then contents).  If it
+    differs, it's written to a temporary file in the same directory, which is then
+    renamed over it, so readers never see a partially written file.
+
+    The netlists can be compressed (the `compress` tech option, or `cb_netlist
+    --compress gzip|zstd`), which adds `.gz` or `.zst` to their names.  The
+    compressed files are reproducible (no timestamp in the gzip header), so an
+    unchanged netlist is still not rewritten.  zstd needs the `zstandard` package
+    (the `zstd` extra).
+
+    `cb_netlist` records the files it wrote in the session (filename -> whether it
+    changed), and reports them as `CircuitBrew.outputs` and `CircuitBrew.changed`
+    (and in the `changed` key of the [circuitbrew.server][] responses).
+"""
+import os, io, gzip, filecmp, threading, logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}  # Compression -> file name suffix
+
+
+def compressed_filename(filename: str, compression: str = None) -> str:
+    """ Returns:
+            The name of filename once compressed with compression (None for none)
+    """
+    if not compression:
+        return filename
+    assert compression in EXTENSIONS, \
+        f'Unknown compression {compression}, expected one of {", ".join(EXTENSIONS)}'
+    return filename + EXTENSIONS[compression]
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd compression needs the zstandard package (pip install circuitbrew[zstd])') from None
+    return zstandard
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == 'gzip':
+        return gzip.compress(data, mtime=0)
+    return _zstandard().ZstdCompressor().compress(data)
+
+
+@contextmanager
+def _compressed_writer(f, compression: str):
+    """ A text stream that compresses into the binary file f
+    """
+    if compression == 'gzip':
+        stream = gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0)
+    else:
+        stream = _zstandard().ZstdCompressor().stream_writer(f, closefd=False)
+    with io.TextIOWrapper(stream, encoding='utf-8') as text:
+        yield text
+
+
+def _temp_filename(filename: str) -> str:
+    directory, name = os.path.split(filename)
+    return os.path.join(directory, f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+
+def _same_contents(filename: str, data: bytes) -> bool:
+    try:
+        if os.stat(filename).st_size != len(data):
+            return False
+        with open(filename, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def _remove(filename: str):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def _record(filename: str, changed: bool, outputs: dict):
+    if outputs is not None:
+        outputs[filename] = changed
+    if not changed:
+        logger.debug('%s is unchanged', filename)
+
+
+def write_if_changed(filename: str, contents: str, outputs: dict = None, compression: str = None) -> bool:
+    """ Atomically write contents to filename, unless the file already has them
+
+        Args:
+            outputs: filename -> whether it changed is recorded in this dict
+            compression: `gzip` or `zstd` to compress the contents (the caller names
+                         the file, see compressed_filename)
+
+        Returns:
+            True if the file was written
+    """
+    data = contents.encode()
+    if compression:
+        data = _compress(data, compression)
+    changed = not _same_contents(filename, data)
+    if changed:
+        tmp_filename = _temp_filename(filename)
+        try:
+            with open(tmp_filename, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            _remove(tmp_filename)
+            raise
+    _record(filename, changed, outputs)
+    return changed
+
+
+@contextmanager
+def output_file(filename: str, outputs: dict = None, compression: str = None):
+    """ Open filename to stream text into, e.g. a flat netlist too big to hold in
+        memory.  The text goes to a temporary file (compressed as it's written if
+        compression is given), which replaces filename on exit only if their
+        contents differ.
+
+        Args:
+            outputs: filename -> whether it changed is recorded in this dict
+            compression: `gzip` or `zstd`
+    """
+    tmp_filename = _temp_filename(filename)
+    try:
+        if compression:
+            with open(tmp_filename, 'wb') as f, _compressed_writer(f, compression) as text:
+                yield text
+        else:
+            with open(tmp_filename, 'w') as f:
+                yield f
+        changed = not (os.path.exists(filename) and filecmp.cmp(tmp_filename, filename, shallow=False))
+        if changed:
+            os.replace(tmp_filename, filename)
+        else:
+            os.remove(tmp_filename)
+    except BaseException:
+        _remove(tmp_filename)
+        raise
+    _record(filename, changed, outputs)
@@ -1,7 +1,8 @@
 import sys, inspect, logging
 from collections.abc import MutableSequence
 from .helpers import WithId
-from curio import Queue
+from .session import current_session
+from .trace import SEND, RECV
 
 logger = logging.getLogger(__name__)
 
@@ -19,33 +20,61 @@ class Port(WithId):
     def __init__(self, name="", count=None):
         super().__init__()
         self.connections = set()
-        self._q = Queue()   
         self.name = name
 
         if count:
             self.count = count
-        logger.debug(f'__init__ ({name}): id = {self.count}')
+        logger.debug('__init__ (%s): id = %s', name, self.count)
 
     # ----------------------------------------------------------------
     # Simulation related methods
     # ----------------------------------------------------------------
+    def __getattr__(self, attr):
+        """Create the Curio queue (self._q) on first use, so that only simulations
+           need to import curio and allocate queues
+        """
+        if attr == '_q':
+            from curio import Queue
+            q = self._q = Queue()
+            return q
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{attr}'")
+
     async def recv(self):
         """Receive a value on the internal Curio queue
 
            :return: received value
         """
         q = self._q
-        tok = await q.get()
+        session = current_session()
+        if session.channel_stats is None:
+            tok = await q.get()
+        else:
+            tok = await session.channel_stats.get(self, q)
         #await q.task_done()
-        logger.info(f'Received {tok} on port {self.name}')
+        if session.sim_clock is not None:
+            session.sim_clock.received(self)
+        if session.tracer is not None:
+            session.tracer.record(self, RECV, tok)
+        logger.info('Received %s on port %s', tok, self.name)
         return tok
 
     async def send(self, val):
+        session = current_session()
+        if (clock := session.sim_clock) is not None:
+            await clock.before_send(self)
+        if session.tracer is not None:
+            session.tracer.record(self, SEND, val)
+        stats = session.channel_stats
         # Copy to all listeners in the q
         for receiver in self.connections:
             queue = receiver._q
-            logger.info(f'Sending {val} on {self} to receiver {receiver.name}')
-            await queue.put(val)
+            logger.info('Sending %s on %s to receiver %s', val, self, receiver.name)
+            if clock is not None:
+                await clock.before_put(receiver)
+            if stats is None:
+                await queue.put(val)
+            else:
+                await stats.put(self, receiver, queue, val)
 
     async def sim(self):
         while True:
@@ -57,7 +86,7 @@ class Port(WithId):
     #   e.g. port_a & port_b yields a series n-fet stack 
     # ----------------------------------------------------------------
     def __invert__(self):
-        logger.debug(f'NEGATING port {self}')
+        logger.debug('NEGATING port %s', self)
         from .stack import Stack
         stack=Stack()
         stack.add_parallel_fet(self, negated=True)
@@ -66,12 +95,12 @@ class Port(WithId):
 
     def __and__(self, other):
         from .stack import Stack
-        logger.debug(f'ANDing ports {self} with {other}')
+        logger.debug('ANDing ports %s with %s', self, other)
         if isinstance(other, Stack):
             other.add_series_fet(self)
             return other
         else:
-            logger.debug(f'Got {self.name} & {other.name}')
+            logger.debug('Got %s & %s', self.name, other.name)
             stack = Stack()
             stack.add_series_fet(self)
             stack.add_series_fet(other)
@@ -80,12 +109,12 @@ class Port(WithId):
     def __or__(self, other):
         from .stack import Stack
         from .fets import Nfet
-        logger.debug(f'ORing ports {self} with {other}')
+        logger.debug('ORing ports %s with %s', self, other)
         if isinstance(other, Stack):
             other.add_parallel_fet(self)
             return other
         else:
-            logger.debug(f'Got {self.name} & {other.name}')
+            logger.debug('Got %s & %s', self.name, other.name)
             stack = Stack()
             stack.add_parallel_fet(other)
             stack.add_parallel_fet(self)
@@ -96,7 +125,7 @@ class Port(WithId):
     # as instance variables ("block ports") 
     # ----------------------------------------------------------------
     def __set_name__(self, cls, name):
-        logger.debug(f'{self.__class__}: setting name to {name} for port id {self.count}')
+        logger.debug('%s: setting name to %s for port id %s', self.__class__, name, self.count)
         self.name = name
 
     def __get__(self, instance, cls):
@@ -181,51 +210,117 @@ class OutputPort(Port):
 
 
 class Ports(MutableSequence, WithId):
+    """Sequence (array, bus) of single ports
+
+       The single ports are created on first access, and connecting two buses
+       (or slices of them) only records the range mapping between them, so wide
+       buses cost nothing until a bit is used.  Once a bit is created, it is
+       connected to the bits of the buses its range is mapped to (creating them
+       too), so netlisting and simulating see the same connections as if every
+       bit had been connected one by one.
+
+       Slices with a step of 1 are views that share the bits of the bus they
+       were taken from.
+    """
     port_type = Port
     def __init__(self, **kwargs):
         super().__init__()
-        self.ports = None
+        self._bits = {}     # Index -> single port created so far
+        self._links = []    # (start, length, other bus, other start) range mappings
+        self._base, self._start = self, 0
         if (count := kwargs.get('count')):
             self.count = count
         if 'items' in kwargs:
             items = kwargs['items']
             self.width = len(items) 
-            self.ports = items
+            self._bits = dict(enumerate(items))
             if 'name' in kwargs:
                 self.name = kwargs['name']
         elif 'name' in kwargs:
             assert 'width' in kwargs, f'{type(self)} construction must specify width using (width=..)'
             self.width = kwargs['width']
             self.name = kwargs['name']
-            # Enough info to instantiate this object
-            self.ports = [self.port_type(name=f'{self.name}[{i}]') for i in range(self.width)]
-
         else:
             # Decorator only
             assert 'width' in kwargs, f'{type(self)} construction must specify width using (width=..)'
             self.width = kwargs['width']
 
     def __set_name__(self, cls, name):
-        logger.debug(f'got name {name} for ')
+        logger.debug('got name %s for ', name)
         self.name = name
-        #if not self.ports:  # In case we manually supplied the list of ports already in the constructore (items=...)
-            #self.ports = [self.port_type(name=f'{self.name}[{i}]') for i in range(self.width)]
 
     def _insert_into_instance(self, instance):
         if (ports := instance.__dict__.get(self.name)):
             return ports
         else:
             # Check if there was parameter for the width.  If so, it will be a deferred callable that should
-            # resolve at this point (because the instance has been instantiatied).
-            if callable(self.width): self.width = self.width(instance)
-            ports = instance.__dict__[self.name] = type(self)(name=self.name, width=self.width, count=self.count)
+            # resolve at this point (because the instance has been instantiatied).  Resolve it per
+            # instance: the descriptor is shared by every Parameterize'd subclass
+            width = self.width(instance) if callable(self.width) else self.width
+            ports = instance.__dict__[self.name] = type(self)(name=self.name, width=width, count=self.count)
             return ports
 
+    # ----------------------------------------------------------------
+    # Lazy bits and range connections
+    # ----------------------------------------------------------------
+    def _bit(self, index):
+        """The single port at index, created (and connected) on first access
+        """
+        base, i = self._base, self._start + index
+        if (port := base._bits.get(i)) is None:
+            port = base._create_bit(i)
+        return port
+
+    def _create_bit(self, index):
+        port = self._bits[index] = self.port_type(name=f'{self.name}[{index}]')
+        # Connect it through the range mappings, creating the bits it maps to.  A
+        # worklist rather than recursion, since a chain of buses maps each bit
+        # all the way along the chain
+        work = [(self, index, port)]
+        while work:
+            bus, i, p = work.pop()
+            for start, length, other, other_start in bus._links:
+                if start <= i < start+length:
+                    j = other_start + i - start
+                    if (q := other._bits.get(j)) is None:
+                        q = other._bits[j] = other.port_type(name=f'{other.name}[{j}]')
+                        work.append((other, j, q))
+                    p._set(q)
+        return port
+
+    def _link(self, other):
+        """Connect every bit of this bus (or slice) to the bit at the same index in other
+        """
+        assert len(other) == len(self), f'Trying to connect {self.name} (width {len(self)}) to {other.name} (width {len(other)})'
+        a, a_start = self._base, self._start
+        b, b_start = other._base, other._start
+        n = len(self)
+        a._links.append((a_start, n, b, b_start))
+        b._links.append((b_start, n, a, a_start))
+        # The bits that were already created get connected now
+        for i in [i for i in a._bits if a_start <= i < a_start+n]:
+            a._bits[i]._set(other._bit(i-a_start))
+        for j in [j for j in b._bits if b_start <= j < b_start+n]:
+            self._bit(j-b_start)._set(b._bits[j])
+
+    def _connect(self, value):
+        if isinstance(value, Ports):
+            self._link(value)
+        else:
+            assert isinstance(value, list), f'Trying to set {self} to non-list type {type(value)}'
+            assert len(value) == len(self), f'Trying to set {self.name} (width {len(self)}) to {len(value)} ports'
+            for p, v in zip(self, value):
+                assert isinstance(v, Port), f'Trying to set {self} to non-port type {type(v)}'
+                p._set(v)
+
+    @property
+    def ports(self):
+        """List of all the single ports (creates them)
+        """
+        return list(self)
+
     def _set(self, value):
-        assert isinstance(value, list), f'Trying to set {self} to non-list type {type(value)}'
-        for p,v in zip(self.ports, value):
-            assert isinstance(v, Port), f'Trying to set {self} to non-port type {type(value)}'
-            p._set(v)
+        self._connect(value)
 
     def __get__(self, instance, cls):
         ports = self._insert_into_instance(instance)
@@ -233,32 +328,38 @@ class Ports(MutableSequence, WithId):
         return ports
 
     def __set__(self, instance, value):
-        assert len(value) == self.width
         ports = self._insert_into_instance(instance)
-
-        for port, val in zip(ports, value):
-            port._set(val)
+        ports._connect(value)
 
     def __getitem__(self, index):
         if isinstance(index, slice):
-            elements = self.ports[index]
-            return type(self)(name=self.name, items=elements)
+            indices = range(self.width)[index]
+            if indices.step == 1:
+                view = type(self)(name=self._base.name, width=len(indices))
+                view._base, view._start = self._base, self._start + indices.start
+                return view
+            return type(self)(name=self._base.name, items=[self._bit(i) for i in indices])
         else:
-            return self.ports[index]
-            #return type(self)(key=f'{self.key}[{index}]', width=1, items=[self.ports[index]])
+            if index < 0:
+                index += self.width
+            if not 0 <= index < self.width:
+                raise IndexError(f'{self.name} index {index} out of range')
+            return self._bit(index)
     
     def __len__(self): 
         return self.width
 
+    def __iter__(self):
+        for i in range(self.width):
+            yield self._bit(i)
+
     def __setitem__(self, index, val):
-        logger.debug(f'Inside __setitem__ with {val} and index {index}')
+        logger.debug('Inside __setitem__ with %s and index %s', val, index)
         # Just need to set the connection
         if isinstance(index, slice):
-            for port, v in zip(self.ports[index], val):
-                port._set(v)
-                logger.debug(f'\tSetting connection {port} to {v}')
+            self[index]._connect(val)
         else:
-            self.ports[index]._set(val)
+            self[index]._set(val)
 
     def __delitem__(self, index):
         raise Exception
@@ -266,20 +367,27 @@ class Ports(MutableSequence, WithId):
     def insert(self, index, val):
         raise Exception
 
+    def _bit_name(self, index):
+        base, i = self._base, self._start + index
+        if (port := base._bits.get(i)) is not None:
+            return port.name
+        return f'{base.name}[{i}]'
+
     def get_spice(self):
-        s = ' '.join([ port.get_spice() for port in self.ports])
+        # Only names, so the subckt port list doesn't create the bits
+        s = ' '.join([self._bit_name(i) for i in range(self.width)])
         return s
 
     def get_instance_spice(self, scope):
         """scope is a symbol table of the module that is trying to instance
            this in its body
         """
-        s = ' '.join([ port.get_instance_spice(scope) for port in self.ports])
+        s = ' '.join([ port.get_instance_spice(scope) for port in self])
         return s
 
     def get_flattened(self, parent_scope_name=None):
         port_dict = {}
-        for port in self.ports:
+        for port in self:
             if parent_scope_name: 
                 prefix= f'{parent_scope_name}.'
             else:
@@ -288,9 +396,7 @@ class Ports(MutableSequence, WithId):
         return port_dict
 
     def iter_flattened(self):
-        yield from self.ports
-        # for port in self.ports:
-        #     yield from port.iter_flattened()
+        yield from self
 
     def is_flat(self):
         return False
@@ -302,19 +408,27 @@ class Ports(MutableSequence, WithId):
                 received value
         """
         vals = []
-        for p in self.ports:
+        for p in self:
             vals.append(await p.recv())
-        logger.info(f'Received {vals} on port {self.name}')
+        logger.info('Received %s on port %s', vals, self.name)
         return vals
 
     async def send(self, val: list):
         """ Send list of values on list of ports
         """
         # Copy to all listeners in the q
-        for p, v in zip(self.ports, val):
+        for p, v in zip(self, val):
             # Copy v to every connection in p
             await p.send(v)
 
+    async def sim(self):
+        """ Pass values through each port of the array independently
+        """
+        from curio import TaskGroup
+        async with TaskGroup() as g:
+            for p in self:
+                await g.spawn(p.sim())
+
 class InputPorts(Ports):
     """Sequence (array) of InputPort
     """
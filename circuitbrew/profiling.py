@@ -0,0 +1,118 @@
+"""
+    Low-overhead instrumentation of the flow, enabled with `cb_netlist --profile FILE`.
+
+    The Profiler is carried by the current Session.  When profiling is off the
+    session's profiler is None, and each hook costs a single `is None` check.
+
+    The JSON report has:
+
+    - `passes`: wall time and the net change in allocated memory blocks of each flow
+      step (build, sim, netlist, render, write)
+    - `module_types`: per module type, the calls, total time and net change in
+      allocated memory blocks (`alloc_blocks`) of `build()`, `get_spice()` (which
+      includes the `get_instance_spice()` of its sub-instances),
+      `get_instance_spice()` and Verilog-A template rendering (`render`), plus the
+      symbol lookups made while netlisting that type
+    - `lookups`: symbol-table lookups over the whole design.  `fast` lookups were
+      answered by the connection tables built in `_setup_connections_lookup`;
+      `slow_hit`/`slow_miss` fell through to the `get_connected_symbol` search of the
+      sub-instance ports, with `slow_ms` spent there
+"""
+import sys, json, time, logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """ Collects per module type call counts, times and allocations
+
+        Examples:
+
+            >>> with Session(sim_setup, profiler=Profiler()) as session:
+                    ...
+            >>> session.profiler.write('profile.json', timer)
+
+        Attributes:
+            calls (dict): (kind, module type name) -> [number of calls, seconds,
+                          net allocated blocks]
+            lookups (dict): module type name -> Counter of lookup outcomes
+            slow_lookup_time (float): Seconds spent in slow-path symbol lookups
+    """
+    def __init__(self):
+        self.calls = {}
+        self.lookups = {}
+        self.slow_lookup_time = 0.0
+
+    @staticmethod
+    def start() -> tuple[float, int]:
+        """ Returns:
+                The start of a call to pass to add()
+        """
+        return time.perf_counter(), sys.getallocatedblocks()
+
+    def add(self, kind: str, type_name: str, start: tuple[float, int]):
+        """ Record one call of `kind` ('build', 'get_spice', ...) on a module type
+            that started at start (from Profiler.start())
+        """
+        dt = time.perf_counter() - start[0]
+        blocks = sys.getallocatedblocks() - start[1]
+        if (entry := self.calls.get((kind, type_name))) is None:
+            self.calls[(kind, type_name)] = [1, dt, blocks]
+        else:
+            entry[0] += 1
+            entry[1] += dt
+            entry[2] += blocks
+
+    def count_lookup(self, type_name: str, outcome: str, t0: float = None):
+        """ Record a symbol lookup made in a module of this type: outcome is 'fast',
+            'slow_hit' or 'slow_miss'.  Slow lookups pass their start time.
+        """
+        if (counts := self.lookups.get(type_name)) is None:
+            counts = self.lookups[type_name] = Counter()
+        counts[outcome] += 1
+        if t0 is not None:
+            self.slow_lookup_time += time.perf_counter() - t0
+
+    def get_report(self, timer=None) -> dict:
+        """ Returns:
+                dict: The JSON report described in [circuitbrew.profiling][]
+        """
+        report = {'passes': {}, 'module_types': {}, 'lookups': Counter()}
+        if timer is not None:
+            for name, t in timer.phases.items():
+                report['passes'][name] = {'ms': t*1000}
+                if name in timer.blocks:
+                    report['passes'][name]['alloc_blocks'] = timer.blocks[name]
+        types = report['module_types']
+        for (kind, type_name), (calls, t, blocks) in self.calls.items():
+            types.setdefault(type_name, {})[kind] = {'calls': calls, 'ms': t*1000, 'alloc_blocks': blocks}
+        for type_name, counts in self.lookups.items():
+            types.setdefault(type_name, {})['lookups'] = dict(counts)
+            report['lookups'].update(counts)
+        report['lookups'] = dict(report['lookups'], slow_ms=self.slow_lookup_time*1000)
+        # Most expensive types first
+        report['module_types'] = dict(sorted(types.items(), key=lambda kv: -self._total_ms(kv[1])))
+        return report
+
+    @staticmethod
+    def _total_ms(entry: dict) -> float:
+        return sum(v['ms'] for kind, v in entry.items() if kind in ('build', 'get_spice'))
+
+    def summary(self, report: dict, top: int = 10) -> str:
+        """ A short table of the `top` most expensive module types in the report
+        """
+        lines = [f'{"module type":<40}{"build ms":>10}{"spice ms":>10}{"inst ms":>10}{"slow lookups":>14}']
+        for type_name, entry in list(report['module_types'].items())[:top]:
+            ms = [entry.get(kind, {}).get('ms', 0.0) for kind in ('build', 'get_spice', 'get_instance_spice')]
+            slow = entry.get('lookups', {})
+            slow = slow.get('slow_hit', 0) + slow.get('slow_miss', 0)
+            lines.append(f'{type_name[:39]:<40}' + ''.join(f'{t:10.1f}' for t in ms) + f'{slow:14d}')
+        return '\n'.join(lines)
+
+    def write(self, filename: str, timer=None):
+        report = self.get_report(timer)
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f'Wrote profile to {filename}')
+        print(self.summary(report), file=sys.stderr)
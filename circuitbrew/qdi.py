@@ -1,9 +1,9 @@
-import curio, logging
+import logging
 from .compound_ports import SupplyPort, E1of2InputPort, E1of2OutputPort
 from .ports import InputPorts, InputPort, OutputPort, OutputPorts 
 from .fets import *
-from .module import Module, SourceModule, Parameterize
-from .elements import VerilogParametrizedModule
+from .module import Module, SourceModule, Param, Parameterize
+from .elements import VerilogParameterizedModule
 from .gates import Inv_x2 as Inv, NorN
 
 logger = logging.getLogger(__name__)
@@ -15,6 +15,9 @@ class Celement2(Module):
     o = OutputPort()
     p = SupplyPort()
 
+    forward_latency: Param  # For timed sims (see circuitbrew.timing)
+    backward_latency: Param
+
     def build(self):
         """ build method
         """
@@ -88,6 +91,9 @@ class Wchb(Module):
     _pReset = InputPort()
     p = SupplyPort()
 
+    forward_latency: Param  # For timed sims (see circuitbrew.timing)
+    backward_latency: Param
+
     def build(self):
         """ Build method """
         self.c2_t = Celement2(i=[self.l.t, self.r.e], o = self.r.t, p=self.p)
@@ -102,14 +108,14 @@ class Wchb(Module):
     async def sim(self):
         """ Sim method """
         while True:
-            logger.debug(f'{self} Waiting to receive')
+            logger.debug('%s Waiting to receive', self)
             val = await self.l.recv()
-            logger.debug(f'{self} received {val}')
+            logger.debug('%s received %s', self, val)
             await self.r.send(val)
-            logger.debug(f'{self} sent {val}')
+            logger.debug('%s sent %s', self, val)
 
 
-class VerilogSrcE1of2(VerilogParametrizedModule, SourceModule):
+class VerilogSrcE1of2(VerilogParameterizedModule, SourceModule):
     """ Dual-rail with enable (E1of2) input source for 4-phase QDI circuits
     """
     _pReset = InputPort()
@@ -120,7 +126,7 @@ class VerilogSrcE1of2(VerilogParametrizedModule, SourceModule):
     def __init__(self, name, values, **kwargs):
         super().__init__(name=name, **kwargs)
         self.values = values
-        self.src_filename = {'hspice': 'hspice_src_1of2.va'}
+        self.src_filename = {'hspice': 'hspice_src_1of2.va', 'verilog': 'verilog_src_1of2.v'}
     
     def get_spice(self):
         simtype = self.sim_setup['sim_type']
@@ -133,14 +139,14 @@ class VerilogSrcE1of2(VerilogParametrizedModule, SourceModule):
 
         self._emit_src_file(src_filename, param_dict, output_filename)
 
-        l = [f'.hdl {output_filename}']
+        l = [self._include(output_filename)]
         return l
 
     async def sim(self):
         for val in self.values:
             await self.l.send(val)
 
-class VerilogBucketE1of2(VerilogParametrizedModule):
+class VerilogBucketE1of2(VerilogParameterizedModule):
     """ Dual-rail with enable (E1of2) output sink/verification for 4-phase QDI circuits
     """
     _pReset = InputPort()
@@ -151,7 +157,7 @@ class VerilogBucketE1of2(VerilogParametrizedModule):
     def __init__(self, name, values=None, **kwargs):
         super().__init__(name=name, **kwargs)
         self.values = values
-        self.src_filename = {'hspice': 'hspice_bucket_1of2.va'}
+        self.src_filename = {'hspice': 'hspice_bucket_1of2.va', 'verilog': 'verilog_bucket_1of2.v'}
 
     def get_spice(self):
         simtype = self.sim_setup['sim_type']
@@ -164,7 +170,7 @@ class VerilogBucketE1of2(VerilogParametrizedModule):
 
         self._emit_src_file(src_filename, param_dict, output_filename)
 
-        l = [f'.hdl {output_filename}']
+        l = [self._include(output_filename)]
         return l
 
 
@@ -173,12 +179,13 @@ class VerilogBucketE1of2(VerilogParametrizedModule):
         if self.values:
             return # No need to sim as user supplied values
 
+        import curio
         try:
-            logger.info(f'Bucket_1of2 {self} waiting')
+            logger.info('Bucket_1of2 %s waiting', self)
             vals = []
             while True:
                 val = await self.l.recv()
-                logger.info(f'Bucket_1of2 {self} received {val}')
+                logger.info('Bucket_1of2 %s received %s', self, val)
                 vals.append(val)
         except curio.CancelledError:
             pass # Time to end because the simulation is done and we were cancelled
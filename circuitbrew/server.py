@@ -0,0 +1,312 @@
+"""
+    A long-running netlist server (`cb_netlistd`) that keeps the interpreter, the
+    imported libraries and the parsed tech files warm between requests.
+
+    Clients send the same command line they would give `cb_netlist`, plus their
+    working directory, over a local Unix socket:
+
+        cb_netlistd /tmp/cb.sock &
+        cb_netlist --connect /tmp/cb.sock sw130 mine.logic hspice all
+
+    The server remembers every design it has built along with the user module
+    files it was built from (any imported module that lives under the client's
+    working directory, plus the MODULE itself), and the tech file and process
+    template it used.  A request for a design whose sources haven't changed
+    since the last build returns immediately; otherwise only the changed modules
+    (and the modules that import from them) are reloaded before rebuilding.  A background thread polls the watched files so
+    that most edits are already rebuilt by the time the next request arrives.
+"""
+import os, sys, json, socket, socketserver, threading, time, logging
+import importlib, traceback
+
+logger = logging.getLogger(__name__)
+
+
+def _split_connect(argv: list[str]) -> tuple[str, list[str]]:
+    """ Pull the --connect SOCKET option out of a cb_netlist command line
+
+        Returns:
+            (socket_path, argv): The socket and the remaining arguments
+    """
+    argv = list(argv)
+    for i, arg in enumerate(argv):
+        if arg == '--connect':
+            socket_path = argv[i+1]
+            del argv[i:i+2]
+            return socket_path, argv
+        elif arg.startswith('--connect='):
+            del argv[i]
+            return arg.split('=', 1)[1], argv
+    raise ValueError('No --connect SOCKET option given')
+
+
+def _recv_line(sock) -> bytes:
+    chunks = []
+    while (chunk := sock.recv(65536)):
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+    return b''.join(chunks)
+
+
+def request(socket_path: str, argv: list[str], cwd: str = None) -> dict:
+    """ Send one netlist request to a running server and return its response
+
+        Args:
+            socket_path: The server's Unix socket
+            argv: cb_netlist command line (without --connect)
+            cwd: Directory to run the request in (defaults to the current directory)
+
+        Returns:
+            dict: with keys `ok`, `cached`, `elapsed_ms`, `outputs`, `changed` (the
+                  outputs whose contents changed) and optionally
+                  `error` and `report`
+    """
+    req = {'argv': list(argv), 'cwd': cwd or os.getcwd()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(req).encode() + b'\n')
+        return json.loads(_recv_line(sock))
+
+
+def run_client(argv: list[str]) -> int:
+    """ Entry point used by `cb_netlist --connect SOCKET ...`
+
+        Returns:
+            Process exit status
+    """
+    socket_path, argv = _split_connect(argv)
+    response = request(socket_path, argv)
+    if response.get('report'):
+        print(response['report'], file=sys.stderr)
+    if not response['ok']:
+        print(response['error'], file=sys.stderr)
+        return 1
+    return 0
+
+
+def _is_modified(filename: str, mtime: int) -> bool:
+    try:
+        return os.stat(filename).st_mtime_ns != mtime
+    except OSError:
+        return True
+
+
+class Design:
+    """ A netlist request that the server has built, and the user source files
+        it was built from.
+
+        Attributes:
+            argv (list[str]): cb_netlist command line
+            cwd (str): Client working directory
+            module (str): The MODULE of the last build that got that far
+            process (str): Its process
+            sources (dict): module name -> (filename, mtime) of the watched modules,
+                            in import order
+            tech_files (dict): filename -> mtime of the tech file and process template
+            outputs (list[str]): Files written by the last build
+            changed (list[str]): Those of the outputs whose contents changed
+            error (str): Traceback of the last build if it failed
+    """
+    def __init__(self, argv: list[str], cwd: str):
+        self.argv = argv
+        self.cwd = cwd
+        self.module = None
+        self.process = None
+        self.sources = {}
+        self.tech_files = {}
+        self.outputs = []
+        self.changed = []
+        self.error = None
+        self.report = None
+
+    def changed_modules(self) -> list[str]:
+        return [mod_name for mod_name, (filename, mtime) in self.sources.items()
+                    if _is_modified(filename, mtime)]
+
+    def changed_tech_files(self) -> list[str]:
+        return [filename for filename, mtime in self.tech_files.items()
+                    if _is_modified(filename, mtime)]
+
+    def is_stale(self) -> bool:
+        """ Returns:
+                Whether a watched module or tech file changed since the last build
+        """
+        return bool(self.changed_modules() or self.changed_tech_files())
+
+    def is_current(self) -> bool:
+        return (self.error is None and len(self.sources) > 0
+                and not self.is_stale()
+                and all(os.path.exists(fn) for fn in self.outputs))
+
+    def track(self, module_name: str, tech_files: list[str] = ()):
+        """ Record the files this design depends on: the top module plus every
+            imported module whose file is under the client's working directory,
+            and the tech files (from CircuitBrew.get_tech_files).
+        """
+        self.tech_files = {}
+        for filename in tech_files:
+            try:
+                self.tech_files[filename] = os.stat(filename).st_mtime_ns
+            except OSError:
+                pass
+        root = os.path.join(os.path.abspath(self.cwd), '')
+        self.sources = {}
+        for mod_name, mod in list(sys.modules.items()):
+            filename = getattr(mod, '__file__', None)
+            if not filename:
+                continue
+            if mod_name == module_name or os.path.abspath(filename).startswith(root):
+                try:
+                    self.sources[mod_name] = (filename, os.stat(filename).st_mtime_ns)
+                except OSError:
+                    pass
+
+
+class NetlistServer:
+    """ Serve cb_netlist requests from a warm interpreter.
+
+        Requests are handled one at a time (they change the working directory and
+        reload modules), but clients can connect concurrently and will queue.
+
+        Args:
+            socket_path: Unix socket to listen on
+            poll: Seconds between checks of the watched source files (0 disables
+                  the background rebuilds)
+    """
+
+    def __init__(self, socket_path: str, poll: float = 0.5):
+        self.socket_path = socket_path
+        self.poll = poll
+        self.designs = {}   # (cwd, argv) -> Design
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._warm_up()
+
+    def _warm_up(self):
+        """ Import everything a request could need once, up front
+        """
+        import curio, yaml, docopt
+        import mako.template
+        from . import circuitbrew, elements, gates, qdi, measure
+        from .cb_netlist import __doc__ as docopt_string
+        self.docopt_string = docopt_string
+
+    def handle(self, req: dict) -> dict:
+        t0 = time.perf_counter()
+        key = (req['cwd'], tuple(req['argv']))
+        with self.lock:
+            design = self.designs.get(key)
+            cached = design is not None and design.is_current()
+            if not cached:
+                if design is None:
+                    design = self.designs[key] = Design(list(req['argv']), req['cwd'])
+                self._build(design)
+        response = {'ok': design.error is None,
+                    'cached': cached,
+                    'outputs': design.outputs,
+                    'changed': [] if cached else design.changed,
+                    'elapsed_ms': (time.perf_counter()-t0)*1000,
+                   }
+        if design.error:
+            response['error'] = design.error
+        if design.report:
+            response['report'] = design.report
+        return response
+
+    def _reload(self, design: Design):
+        """ Reload the changed source modules of this design, plus any watched modules
+            that import from them (in import order, so dependencies come first).
+            Modules whose file was deleted are dropped instead.
+        """
+        stale = set(design.changed_modules())
+        for mod_name, (filename, mtime) in design.sources.items():
+            mod = sys.modules.get(mod_name)
+            if mod is None:
+                continue
+            if not os.path.exists(filename):
+                logger.info(f'Dropping {mod_name}, its file is gone')
+                sys.modules.pop(mod_name)
+                continue
+            if mod_name not in stale:
+                # Also reload modules holding references into a stale module
+                for obj in vars(mod).values():
+                    dep = obj.__name__ if isinstance(obj, type(sys)) else getattr(obj, '__module__', None)
+                    if dep in stale:
+                        stale.add(mod_name)
+                        break
+                else:
+                    continue
+            logger.info(f'Reloading {mod_name}')
+            importlib.reload(mod)
+
+    def _build(self, design: Design):
+        from .circuitbrew import CircuitBrew
+        os.chdir(design.cwd)
+        if design.cwd not in sys.path:
+            sys.path.append(design.cwd)
+        design.error = design.report = None
+        script = None
+        try:
+            if design.sources:
+                self._reload(design)
+            # Every netlist() call runs in its own Session, so nothing leaks between builds
+            script = CircuitBrew(self.docopt_string)
+            script.get_options(design.argv)
+            script.netlist()
+            design.outputs = [os.path.abspath(fn) for fn in script.outputs]
+            design.changed = [os.path.abspath(fn) for fn in script.changed]
+            if script.args['--time-startup']:
+                design.report = script.timer.report()
+        except SystemExit as e:
+            # docopt exits on bad usage
+            design.error = str(e)
+        except Exception:
+            design.error = traceback.format_exc()
+        finally:
+            # Track even when the reload failed, so the next request doesn't
+            # retry it against the old sources
+            if script is not None and getattr(script, 'module', None):
+                design.module, design.process = script.module, script.process
+            if design.module:
+                design.track(design.module, CircuitBrew.get_tech_files(design.process))
+
+    def _watch(self):
+        while not self._stop.wait(self.poll):
+            with self.lock:
+                for design in list(self.designs.values()):
+                    if design.sources and design.is_stale():
+                        logger.info(f'Sources changed, rebuilding {" ".join(design.argv)}')
+                        self._build(design)
+
+    def serve_forever(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                try:
+                    response = server.handle(json.loads(line))
+                except Exception:
+                    response = {'ok': False, 'error': traceback.format_exc()}
+                self.wfile.write(json.dumps(response).encode() + b'\n')
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self.poll:
+            threading.Thread(target=self._watch, daemon=True).start()
+        with socketserver.ThreadingUnixStreamServer(self.socket_path, Handler) as srv:
+            self._server = srv
+            logger.info(f'Listening on {self.socket_path}')
+            try:
+                srv.serve_forever()
+            finally:
+                self._stop.set()
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        self._stop.set()
+        self._server.shutdown()
+
@@ -0,0 +1,110 @@
+import itertools
+import contextvars
+from collections import Counter
+
+_default_session = None
+
+
+class Session:
+    """ Owns the registries that are shared by all the modules of one design:
+        instance counters, emitted subcircuits, the tech settings and so on.
+
+        Everything that used to be process-global class state (`Module.registry`,
+        `Module.module_counts`, `Module._modules`, `Module.sim_setup`,
+        `LogBlock.blocks`) now reads through the current session, so one process
+        can netlist many designs back to back, or in several threads at once,
+        without the designs seeing each other's counters and subcircuits.
+
+        Examples:
+
+            >>> with Session(sim_setup=tech_options) as session:
+                    main = Main()
+                    BuildPass(main, 'xmain').run()
+                    NetlistPass(main, 'xmain').run()
+            >>> session.modules   # The emitted subcircuits of this design
+
+        The session is tracked with a context variable, so each thread (and each
+        `with` block) has its own.  Code running outside of any `with Session()`
+        uses a process-wide default session.
+
+        Args:
+            sim_setup: The tech options for this design
+            profiler: A [circuitbrew.profiling.Profiler][] to profile this design with
+            tracer: A [circuitbrew.trace.TraceRecorder][] to record the sim tokens with
+            channel_stats: A [circuitbrew.channel_stats.ChannelStats][] to collect sim channel statistics with
+            sim_clock: A [circuitbrew.timing.SimClock][] to run the sim in virtual time with
+            hdl_sources: A dict to keep the Verilog-A sources in, instead of writing them
+                         into the output directory (see [circuitbrew.netlist][])
+
+        Attributes:
+            registry (dict): Module sub classes defined in this session (class name -> class).
+                             Starts with the classes registered in the default session
+            module_counts (Counter): Instances created so far of each Module class
+            modules (dict): Emitted subcircuits (module type name -> list of lines)
+            sim_setup (dict): The tech options
+            log_blocks (dict): Open LogBlock banners
+            profiler (Profiler): Collects timings when profiling (see [circuitbrew.profiling][]), else None
+            tracer (TraceRecorder): Records sim tokens when tracing (see [circuitbrew.trace][]), else None
+            channel_stats (ChannelStats): Counts sim channel stalls (see [circuitbrew.channel_stats][]), else None
+            sim_clock (SimClock): Virtual time of a timed sim (see [circuitbrew.timing][]), else None
+            hdl_sources (dict): Verilog-A source filename -> contents when netlisting in memory, else None
+            outputs (dict): Output filename -> whether its contents changed, of the files written
+                            by the last netlist (see [circuitbrew.outputs][])
+    """
+
+    def __init__(self, sim_setup: dict = None, profiler=None, tracer=None, channel_stats=None, sim_clock=None,
+                 hdl_sources=None):
+        self.registry = dict(_default_session.registry) if _default_session else {}
+        self.module_counts = Counter()
+        self.modules = {}
+        self.sim_setup = sim_setup
+        self.log_blocks = {}
+        self.profiler = profiler
+        self.tracer = tracer
+        self.channel_stats = channel_stats
+        self.sim_clock = sim_clock
+        self.hdl_sources = hdl_sources
+        self.outputs = {}
+        self._ids = itertools.count()
+        self._tokens = []
+
+    def next_id(self) -> int:
+        """ Ids for naming objects (e.g. the temporary nodes in transistor stacks),
+            counted from 0 in every session so that names are reproducible
+        """
+        return next(self._ids)
+
+    def __enter__(self):
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._tokens.pop())
+
+    @staticmethod
+    def current() -> 'Session':
+        return current_session()
+
+
+class SessionAttribute:
+    """ Class attribute that reads through to the current session, e.g:
+
+            class Module:
+                module_counts = SessionAttribute('module_counts')
+
+        Both `Module.module_counts` and `self.module_counts` then return the
+        counter of the current session.  Assign through the session, not the class.
+    """
+    def __init__(self, attr: str):
+        self.attr = attr
+
+    def __get__(self, instance, owner):
+        return getattr(current_session(), self.attr)
+
+
+def current_session() -> Session:
+    return _current.get() or _default_session
+
+
+_current = contextvars.ContextVar('circuitbrew_session', default=None)
+_default_session = Session()
@@ -0,0 +1,194 @@
+"""
+    Short names for SPICE netlists, enabled with the `short_names` tech option
+    (or `cb_netlist --short-names`), to shrink big netlists and the time the
+    simulator spends parsing them.
+
+    The generated names (`xwchb_17`, `xCelement2_inst_523`, the `t1234_0` nodes of
+    the transistor stacks, `Inv_p_strength_2_n_strength_2_vt_svt`) are replaced,
+    in each subcircuit, by base-36 ids in order of first use:
+
+    - nets (ports included) become `n0`, `n1`, ... (node `0` is global and kept)
+    - elements keep their type letter: `x0`, `x1`, `v2`, ...
+    - subcircuit types become `s0`, `s1`, ... except the top one (Main), which
+      the process template instances
+
+    The `.measure` statements keep their names (see [circuitbrew.measurements][]),
+    their probes (`v(node)`, `i(element)`) are renamed.  The Verilog-A modules keep
+    their names.
+
+    The original names are written to a name map (`names.map` next to the
+    netlist), to trace the simulation results back to the Python names:
+
+        >>> with NameMap('output/names.map') as names:
+                names.original('xmain.x4.n2')
+        'xmain.xwchb_1.mypreset'
+
+    The map is a sorted text file, one `scope, short name, original name, type`
+    line per name (scope is the short type of the subcircuit, empty for Main, or
+    `=` for the types themselves), which `NameMap` memory-maps and binary searches,
+    so maps of very large designs are never read whole.
+"""
+import mmap, logging
+
+from .flatten import parse_subcircuit, rename_probes, GLOBAL_NETS
+
+logger = logging.getLogger(__name__)
+
+MAIN_SCOPE = ''
+TYPES_SCOPE = '='
+
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def base36(i: int) -> str:
+    s = ''
+    while True:
+        i, r = divmod(i, 36)
+        s = _DIGITS[r] + s
+        if not i:
+            return s
+
+
+def shorten_names(subcircuits: dict, main_type_name: str) -> tuple[dict, str]:
+    """ Rename the nets, elements and types of the subcircuits
+
+        Args:
+            subcircuits: Module type name -> lines of its subcircuit (from
+                         [circuitbrew.netlist.get_subcircuits][])
+            main_type_name: The top subcircuit, which keeps its name
+
+        Returns:
+            (subcircuits, name map): the renamed subcircuits (by their new type
+            names), and the text of the name map file
+    """
+    is_subckt = {type_name: bool(lines) and lines[0].startswith('.subckt')
+                    for type_name, lines in subcircuits.items()}
+    types = {}
+    for type_name in subcircuits:
+        if is_subckt[type_name] and type_name != main_type_name:
+            types[type_name] = f's{base36(len(types))}'
+    entries = [(TYPES_SCOPE, short, type_name, '') for type_name, short in types.items()]
+
+    shortened = {}
+    for type_name, lines in subcircuits.items():
+        if not is_subckt[type_name]:
+            shortened[type_name] = lines
+            continue
+        short_type = types.get(type_name, type_name)
+        scope = types.get(type_name, MAIN_SCOPE)
+        ports, body = parse_subcircuit(type_name, lines)
+        nets = {}
+        elements = {}
+
+        def net(name):
+            if (short := nets.get(name)) is None:
+                short = nets[name] = name if name in GLOBAL_NETS else f'n{base36(len(nets))}'
+            return short
+
+        for port in ports:
+            net(port)
+        for entry in body:
+            if entry[0] != '.':
+                elements[entry[1]] = f'{entry[1][0].lower()}{base36(len(elements))}'
+                for name in entry[2]:
+                    net(name)
+
+        out = [f'.subckt {short_type} {" ".join([nets[port] for port in ports])}']
+        for entry in body:
+            kind = entry[0]
+            if kind == 'x':
+                _, name, inst_nets, child, rest = entry
+                params = rest.split(None, 1)[1:]
+                out.append(' '.join([elements[name], *[nets[n] for n in inst_nets], types.get(child, child), *params]))
+            elif kind == 'e':
+                _, name, elem_nets, rest = entry
+                out.append(' '.join([elements[name], *[nets[n] for n in elem_nets], rest]))
+            else:
+                out.append(rename_probes(entry[1], lambda arg: elements.get(arg) or nets.get(arg) or arg))
+        out.append('.ends')
+        shortened[short_type] = out
+
+        entries += [(scope, short, name, '') for name, short in nets.items() if name not in GLOBAL_NETS]
+        children = {entry[1]: entry[3] for entry in body if entry[0] == 'x'}
+        entries += [(scope, short, name, types.get(children.get(name), ''))
+                        for name, short in elements.items()]
+
+    entries.sort()
+    lines = [f'#main\t{main_type_name}'] + ['\t'.join(entry) for entry in entries]
+    logger.info('Shortened the names of %d subcircuits', len(types) + 1)
+    return shortened, '\n'.join(lines) + '\n'
+
+
+class NameMap:
+    """ Look names up in a name map file (see [circuitbrew.shortnames][]), without
+        reading it whole
+
+        Args:
+            filename: The name map file
+    """
+    def __init__(self, filename: str):
+        self._file = open(filename, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end = self._mm.find(b'\n')
+        header = self._mm[:header_end].decode().split('\t')
+        assert header[0] == '#main', f'{filename} is not a name map'
+        self.main_type_name = header[1]
+        self._start = header_end + 1
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, scope: str, short: str):
+        """ Returns:
+                (original name, short type of the instance or '') of the short name
+                in scope, or None if it isn't in the map
+        """
+        mm = self._mm
+        key = (scope.encode(), short.encode())
+        lo, hi = self._start, len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mm.rfind(b'\n', lo, mid) + 1 or lo
+            end = mm.find(b'\n', mid)
+            end = len(mm) if end < 0 else end
+            fields = mm[start:end].split(b'\t')
+            line_key = (fields[0], fields[1])
+            if line_key < key:
+                lo = end + 1
+            elif line_key > key:
+                hi = start
+            else:
+                return fields[2].decode(), fields[3].decode()
+        return None
+
+    def type_name(self, short_type: str) -> str:
+        """ Returns:
+                The original name of a short subcircuit type
+        """
+        if (found := self.lookup(TYPES_SCOPE, short_type)) is None:
+            return short_type
+        return found[0]
+
+    def original(self, path: str) -> str:
+        """ Returns:
+                The original hierarchical name of a short one (e.g. `xmain.x4.n2`,
+                simulators also give them in lowercase).  The part of the path that
+                isn't in the map is kept.
+        """
+        head, *names = path.lower().split('.')
+        out = [head]
+        scope = MAIN_SCOPE
+        for i, name in enumerate(names):
+            if scope is None or (found := self.lookup(scope, name)) is None:
+                out += names[i:]
+                break
+            out.append(found[0])
+            scope = found[1] or None
+        return '.'.join(out)
@@ -0,0 +1,51 @@
+"""
+    Split the netlist into a file per subcircuit, enabled with the
+    `split_subcircuits` tech option (or `cb_netlist --split-subckts`), so that
+    the simulator and artifact stores handle smaller pieces, and the pieces that
+    didn't change keep their mtimes (see [circuitbrew.outputs][]).
+
+    Each subcircuit (or Verilog module) of `Module._modules` is written to
+    `subckt_<module type name>.sp` (`.v`) in the output directory, and the
+    `${circuit}` of the process template gets the line that includes it instead
+    (`.include` or `` `include ``), in netlist order.  The other entries (the
+    `.hdl` lines of the Verilog-A modules) stay in the top file.
+"""
+from .outputs import compressed_filename
+
+PREFIX = 'subckt_'
+
+
+def include_line(filename: str, sim_type: str) -> str:
+    """ Returns:
+            The netlist line that includes filename
+    """
+    if sim_type == 'verilog':
+        return f'`include "{filename}"'
+    return f".include '{filename}'"
+
+
+def _is_subcircuit(lines: list[str]) -> bool:
+    return bool(lines) and lines[0].startswith(('.subckt', 'module '))
+
+
+def split_subcircuits(subcircuits: dict, sim_type: str, extension: str,
+                      compression: str = None) -> tuple[dict, dict]:
+    """ Args:
+            subcircuits: Module type name -> lines of its subcircuit
+            extension: The netlist file extension (e.g. `sp`)
+            compression: The compression of the files (see [circuitbrew.outputs][]),
+                         to name them
+
+        Returns:
+            (subcircuits, files): the subcircuits with the lines of each replaced by
+            the line that includes its file, and filename -> contents of the files
+    """
+    netlisted, files = {}, {}
+    for type_name, lines in subcircuits.items():
+        if not _is_subcircuit(lines):
+            netlisted[type_name] = lines
+            continue
+        filename = compressed_filename(f'{PREFIX}{type_name}.{extension}', compression)
+        files[filename] = '\n'.join(lines) + '\n'
+        netlisted[type_name] = [include_line(filename, sim_type)]
+    return netlisted, files
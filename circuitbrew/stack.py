@@ -1,11 +1,13 @@
 #from ports import Port, WithId
 from .helpers import WithId
 from .ports import *
+from .session import current_session
 
 class Stack(WithId):
 
     def __init__(self):
         super().__init__()
+        self.name_id = current_session().next_id()  # For naming the tmp nodes
         self.top = None
         self.bot = None
         self.fets = []
@@ -69,7 +71,7 @@ class Stack(WithId):
         self.fets.append(fet)
         if self.top:
             # a & b -> put 
-            tmp_node = Port(f't{self.count}_{self.tmp_id}')
+            tmp_node = Port(f't{self.name_id}_{self.tmp_id}')
             self.tmp_id += 1
             self.tmp_nodes.append(tmp_node)
             tmp_node._set(fet.s)
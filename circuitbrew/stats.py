@@ -0,0 +1,141 @@
+"""
+    Transistor and instance statistics of a built design, enabled with
+    `cb_netlist --stats FILE`, for area and power budgeting.
+
+    The statistics are computed bottom-up once per module type (from the first
+    instance of each type, like the subcircuit in the netlist) and multiplied
+    through the instance hierarchy, so counting a design takes time in the
+    number of module types and instances per subcircuit, not in the number of
+    transistors.  For each module type they are:
+
+    - `fets`: transistors per fet type (`Nfet`, `Pfet`) in one instance, including
+      its whole sub-hierarchy
+    - `fet_width`: total width of those transistors, in the units of the tech file
+      (fets sized with anything but a number count in `fets` but not here)
+    - `instances`: instances per module type in its sub-hierarchy (leaves too)
+    - `children`: instances per module type directly in its subcircuit
+
+    The report also has the number of instances of each type in the design
+    (`count`), and the totals of the whole design.
+"""
+import sys, json, logging
+from collections import Counter
+
+from .module import Module
+from .fets import Fet
+
+logger = logging.getLogger(__name__)
+
+
+class TypeStats:
+    """ The statistics of one instance of a module type (see [circuitbrew.stats][])
+    """
+    __slots__ = ('fets', 'fet_width', 'instances', 'children')
+
+    def __init__(self):
+        self.fets = Counter()
+        self.fet_width = Counter()
+        self.instances = Counter()
+        self.children = Counter()
+
+    def add(self, other: 'TypeStats', n: int = 1):
+        """ Add n instances worth of other
+        """
+        for totals, other_totals in ((self.fets, other.fets), (self.fet_width, other.fet_width),
+                                     (self.instances, other.instances)):
+            for key, value in other_totals.items():
+                totals[key] += n*value
+
+    def to_dict(self) -> dict:
+        return {'transistors': sum(self.fets.values()),
+                'fets': dict(self.fets),
+                'fet_width': dict(self.fet_width),
+                'instances': dict(self.instances),
+                'children': dict(self.children)}
+
+
+def _iter_modules(var):
+    if isinstance(var, list):
+        for item in var:
+            yield from _iter_modules(item)
+    elif isinstance(var, Module):
+        yield var
+
+
+def get_type_stats(module: Module, types: dict = None) -> dict:
+    """ Compute the statistics of the type of module and of every type under it
+
+        Args:
+            module: A built module
+            types: Type statistics already computed (filled in)
+
+        Returns:
+            dict: module type name -> TypeStats
+    """
+    types = {} if types is None else types
+    type_name = module.get_module_type_name()
+    if type_name in types:
+        return types
+    stats = types[type_name] = TypeStats()
+    # One representative instance of each child type, the fets one by one (their sizes
+    # are set per instance)
+    representatives = {}
+    for inst in _iter_modules(list(module._sym_table.sub_instances.values())):
+        child_name = inst.get_module_type_name()
+        stats.children[child_name] += 1
+        if isinstance(inst, Fet):
+            stats.fets[child_name] += 1
+            if isinstance(inst.w, (int, float)):
+                stats.fet_width[child_name] += inst.w
+        else:
+            representatives.setdefault(child_name, inst)
+    for child_name, n in stats.children.items():
+        stats.instances[child_name] += n
+        if (inst := representatives.get(child_name)) is not None:
+            get_type_stats(inst, types)
+            stats.add(types[child_name], n)
+    return types
+
+
+def analyze(main: Module) -> dict:
+    """ Returns:
+            dict: the totals of the design (`transistors`, `fets`, `fet_width`,
+            `instances`) and `types`: module type name -> its statistics and
+            `count` in the design, ranked by the transistors they add up to
+    """
+    types = get_type_stats(main)
+    top_name = main.get_module_type_name()
+    top = types[top_name]
+    counts = Counter({top_name: 1}) + top.instances
+    report = {'top': top_name, **top.to_dict()}
+    del report['children']
+    type_reports = {}
+    for type_name, stats in types.items():
+        type_reports[type_name] = {'count': counts[type_name], **stats.to_dict()}
+    report['types'] = dict(sorted(type_reports.items(),
+                                  key=lambda kv: (-kv[1]['count']*kv[1]['transistors'], kv[0])))
+    logger.info('Counted %d transistors in %d module types', report['transistors'], len(types))
+    return report
+
+
+def summary(report: dict, top: int = 10) -> str:
+    """ A short table of the design totals and the `top` module types by transistors
+    """
+    fets = ', '.join(f'{n} {fet_type}' for fet_type, n in sorted(report['fets'].items()))
+    lines = [f'{report["top"]}: {report["transistors"]} transistors ({fets or "none"}), '
+             f'{sum(report["instances"].values())} instances',
+             '',
+             f'{"module type":<40}{"count":>9}{"fets/inst":>11}{"fets":>11}{"width":>12}']
+    for type_name, entry in list(report['types'].items())[:top]:
+        width = entry['count']*sum(entry['fet_width'].values())
+        lines.append(f'{type_name[:39]:<40}{entry["count"]:9d}{entry["transistors"]:11d}'
+                     f'{entry["count"]*entry["transistors"]:11d}{width:12.4g}')
+    return '\n'.join(lines)
+
+
+def write(main: Module, filename: str):
+    report = analyze(main)
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info('Wrote design statistics to %s', filename)
+    print(summary(report), file=sys.stderr)
@@ -0,0 +1,400 @@
+"""
+    Netlist a design at many process corners / parameter settings.
+
+    A sweep file lists the corners as overrides of the tech options:
+
+    ``` yaml
+    corners:
+      - name: tt_1v8_85c
+      - name: ss_1v6_125c
+        corner: ss
+        voltage: 1.6
+        temp: 125
+      - name: wide_inv
+        params:            # Param/auto values for a Module class (over Parameterize values)
+          Inv:
+            p_strength: 3
+    ```
+
+    The design is built (and behaviorally simulated) once.  While building and
+    netlisting, the tech options record which keys were read, by the build and by
+    every subcircuit.  Each corner is then netlisted into `output_dir/<name>/`:
+
+    - Corners that only change keys the build never read reuse the built
+      hierarchy, and reuse the text of every subcircuit that didn't read any of
+      the changed keys (Verilog modules are always re-emitted, because their
+      sources are written into each corner's directory).
+    - Corners that change keys the build read (for example the `auto` settings of
+      a class, or a value your `build()` looks up) are rebuilt from scratch.
+
+    Corners are spread over a pool of worker processes, which are forked from the
+    process holding the built design, so nothing has to be pickled.
+
+    Instead of one netlist per corner, a sweep can also be written as a single
+    netlist (`Sweep.run_single`), so that the simulator parses the circuit only
+    once:
+
+    - `alter`: the circuit at the first corner, followed by one `.alter` block per
+      remaining corner.  Each block re-declares the process template's `alter()`
+      def (model library, `.temp`, `.param voltage`) and every subcircuit whose
+      text differs from the first corner's.  Verilog-A sources can't be altered, so
+      they are written at the first corner (with a warning if a corner would
+      change them).
+    - `data`: the circuit once, plus a `.data` table with one row per corner that
+      the analysis sweeps over.  Only the tech options the template declares as
+      `.param`s (`sweep_params` in the tech file) can vary, and no subcircuit may
+      depend on them; use `alter` otherwise.
+"""
+import os, copy, time, logging, tempfile
+from functools import partial
+from contextlib import contextmanager
+from importlib import import_module
+
+from .elements import VerilogModule
+from .session import Session
+from .walker import NetlistPass
+
+logger = logging.getLogger(__name__)
+
+
+class SimSetup(dict):
+    """ The tech options dict, able to record which top-level keys get read
+
+        Examples:
+
+            >>> with sim_setup.track() as keys:
+                    main.get_spice()
+            >>> keys
+            {'voltage', 'Fet'}
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._recorders = []
+
+    def __getitem__(self, key):
+        for keys in self._recorders:
+            keys.add(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        for keys in self._recorders:
+            keys.add(key)
+        return super().get(key, default)
+
+    @contextmanager
+    def track(self):
+        keys = set()
+        self._recorders.append(keys)
+        try:
+            yield keys
+        finally:
+            self._recorders.remove(keys)
+
+
+def merge_options(base: dict, overrides: dict) -> dict:
+    """ Recursively merge the overrides into a copy of the base tech options
+    """
+    merged = copy.deepcopy(base)
+    for key, val in overrides.items():
+        if isinstance(val, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_options(merged[key], val)
+        else:
+            merged[key] = copy.deepcopy(val)
+    return merged
+
+
+class Corner:
+    """ One point of a sweep
+
+        Args:
+            name: Name of the corner (also its output sub-directory)
+            options: Overrides of the top-level tech options (voltage, temp, corner, ...)
+            params: Class name -> {attribute: value} settings, applied as the
+                    `override` settings of the tech file (like `auto`, but they
+                    also override Parameterize values)
+    """
+    def __init__(self, name: str, options: dict = None, params: dict = None):
+        self.name = name
+        self.options = options or {}
+        self.params = params or {}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'Corner':
+        d = dict(d)
+        assert 'name' in d, f'Sweep corner {d} needs a name'
+        name = d.pop('name')
+        params = d.pop('params', {})
+        return cls(name, options=d, params=params)
+
+    def get_overrides(self) -> dict:
+        overrides = dict(self.options)
+        for cls_name, attrs in self.params.items():
+            overrides = merge_options(overrides, {cls_name: {'override': attrs}})
+        return overrides
+
+    def __repr__(self):
+        return f'Corner({self.name})'
+
+
+class CornerResult:
+    """ Attributes:
+            corner (Corner): The corner
+            outputs (list[str]): Files written for this corner
+            changed (list[str]): Those of the outputs whose contents changed
+            rebuilt (bool): Whether the design had to be rebuilt for this corner
+            elapsed (float): Seconds spent on this corner
+    """
+    def __init__(self, corner, outputs, rebuilt, elapsed, changed=None):
+        self.corner = corner
+        self.outputs = outputs
+        self.changed = outputs if changed is None else changed
+        self.rebuilt = rebuilt
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f'CornerResult({self.corner.name}, rebuilt={self.rebuilt}, {self.elapsed*1000:.1f} ms)'
+
+
+class SweepNetlistPass(NetlistPass):
+    """ NetlistPass that reuses subcircuits from an earlier corner, unless they read
+        one of the changed tech options.  With changed=None it only fills the cache
+        (and skips the Verilog modules, which would write out their sources).
+    """
+    def __init__(self, target, target_name, cache: dict, changed: set = None):
+        super().__init__(target, target_name)
+        self.cache = cache
+        self.changed = changed
+
+    def walk(self, module, target_name):
+        return type(self)(module, target_name, self.cache, self.changed)
+
+    def emit(self):
+        cls_name = self.target.get_module_type_name()
+        if isinstance(self.target, VerilogModule):
+            return [] if self.changed is None else super().emit()
+        cached = self.cache.get(cls_name)
+        if cached and not (cached[1] & self.changed):
+            return cached[0]
+        with self.target.sim_setup.track() as keys:
+            lines = super().emit()
+        self.cache[cls_name] = (lines, keys)
+        return lines
+
+
+# The design being swept.  Set before the worker pool forks, so that workers
+# inherit the built hierarchy instead of receiving it pickled.
+_sweep = None
+
+def _call_corner(method, index):
+    return getattr(_sweep, method)(_sweep.corners[index])
+
+
+class Sweep:
+    """ Netlist a design once per corner
+
+        Examples:
+
+            >>> script = CircuitBrew(cb_netlist.__doc__)
+            >>> script.process, script.module, script.netlist_type = 'sw130', 'mine.logic', 'hspice'
+            >>> sweep = Sweep(script, [Corner('ss', {'corner': 'ss', 'voltage': 1.6})], jobs=4)
+            >>> results = sweep.run()
+
+        Args:
+            script: A CircuitBrew object with the process, module, netlist type and flow set
+            corners: The corners to generate
+            jobs: Number of worker processes (1 runs everything in this process)
+    """
+    def __init__(self, script, corners: list[Corner], jobs: int = 1):
+        names = [corner.name for corner in corners]
+        assert len(set(names)) == len(names), f'Sweep corner names must be unique: {names}'
+        self.script = script
+        self.corners = corners
+        self.jobs = jobs
+
+    @classmethod
+    def load_corners(cls, filename: str) -> list[Corner]:
+        import yaml
+        with open(filename) as f:
+            spec = yaml.safe_load(f)
+        return [Corner.from_dict(d) for d in spec['corners']]
+
+    def run(self) -> list[CornerResult]:
+        """ Write one netlist per corner, into output_dir/<corner name>
+        """
+        self._build()
+        return self._map('_run_corner')
+
+    def _build(self, base: Corner = None):
+        script = self.script
+        tech_options, self.template_str = script._get_techfile(script.process)
+        tech_options = script.add_options(tech_options)
+        if base:
+            tech_options = merge_options(tech_options, base.get_overrides())
+        self.tech_options = tech_options
+        self.circuit_lib = import_module(script.module)
+
+        # Build once, recording what the build depends on
+        sim_setup = SimSetup(tech_options)
+        self.session = Session(sim_setup)
+        with self.session:
+            with sim_setup.track() as self.build_keys:
+                self.main = script.build(self.circuit_lib)
+        # Netlist once at the base corner to fill the subcircuit cache (in a session
+        # of its own, to keep the skipped Verilog modules out of the build session)
+        self.cache = {}
+        with Session(sim_setup):
+            SweepNetlistPass(self.main, 'xmain', self.cache).run()
+        logger.info(f'Build depends on tech options {sorted(self.build_keys)}')
+
+    def _map(self, method: str, corners: list[Corner] = None) -> list:
+        """ Call self.<method>(corner) for every corner, in the worker pool if jobs > 1
+        """
+        global _sweep
+        corners = self.corners if corners is None else corners
+        indices = [self.corners.index(corner) for corner in corners]
+        _sweep = self
+        try:
+            if self.jobs > 1 and len(indices) > 1:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                ctx = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(max_workers=self.jobs, mp_context=ctx) as pool:
+                    return list(pool.map(partial(_call_corner, method), indices))
+            else:
+                return [getattr(self, method)(corner) for corner in corners]
+        finally:
+            _sweep = None
+
+    def get_sim_setup(self, corner: Corner) -> SimSetup:
+        sim_setup = SimSetup(merge_options(self.tech_options, corner.get_overrides()))
+        sim_setup['output_dir'] = os.path.join(self.tech_options['output_dir'], corner.name)
+        return sim_setup
+
+    def get_changed_keys(self, sim_setup: dict) -> set:
+        return {key for key in set(sim_setup) | set(self.tech_options)
+                    if sim_setup.get(key) != self.tech_options.get(key)}
+
+    def _run_corner(self, corner: Corner) -> CornerResult:
+        t0 = time.perf_counter()
+        script = self.script
+        sim_setup = self.get_sim_setup(corner)
+        os.makedirs(sim_setup['output_dir'], exist_ok=True)
+        # Each corner gets its own flat netlist, next to its top file
+        flat_file = script.flat_file and os.path.join(sim_setup['output_dir'], os.path.basename(script.flat_file))
+        changed = self.get_changed_keys(sim_setup)
+        rebuild = bool(changed & self.build_keys)
+        if rebuild:
+            logger.info(f'Corner {corner.name} changes {sorted(changed & self.build_keys)}, rebuilding')
+            with Session(sim_setup):
+                main = script.build(self.circuit_lib)
+                script.emit(main, sim_setup, self.template_str, flat_file=flat_file)
+        else:
+            session = Session(sim_setup)
+            with session:
+                script.emit(self.main, sim_setup, self.template_str,
+                    netlist_pass=lambda main, name: SweepNetlistPass(main, name, dict(self.cache), changed),
+                    flat_file=flat_file)
+        return CornerResult(corner, list(script.outputs), rebuild, time.perf_counter()-t0, list(script.changed))
+
+    def _netlist_corner(self, corner: Corner) -> tuple[dict, bool, dict]:
+        """ Netlist one corner for a single-netlist sweep, without rendering the template.
+            Verilog-A sources go to a scratch directory, to be compared with the first corner's.
+
+            Returns:
+                (modules, rebuilt, sources): Subcircuit name -> lines, whether the design was
+                                             rebuilt, and source filename -> contents
+        """
+        sim_setup = self.get_sim_setup(corner)
+        changed = self.get_changed_keys(sim_setup)
+        rebuild = bool(changed & self.build_keys)
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            sim_setup['output_dir'] = scratch_dir
+            with Session(sim_setup) as session:
+                if rebuild:
+                    main = self.script.build(self.circuit_lib)
+                    NetlistPass(main, 'xmain').run()
+                else:
+                    main = self.main
+                    SweepNetlistPass(main, 'xmain', dict(self.cache), changed).run()
+            assert main.get_module_type_name() == self.main.get_module_type_name(), \
+                f'Corner {corner.name} changes the top module to {main.get_module_type_name()}, it needs its own netlist'
+            sources = {}
+            for filename in os.listdir(scratch_dir):
+                with open(os.path.join(scratch_dir, filename)) as f:
+                    sources[filename] = f.read()
+        return session.modules, rebuild, sources
+
+    def run_single(self, style: str = 'alter') -> str:
+        """ Write every corner into one netlist, output_dir/top.sp, with the first corner
+            as the nominal circuit and the others as `.alter` blocks (style='alter') or
+            as rows of a `.data` table (style='data')
+
+            Returns:
+                The rendered netlist
+        """
+        assert style in ('alter', 'data'), f'Unknown single-netlist sweep style {style}'
+        assert not self.script.flat_file, 'Single-netlist sweeps can\'t write a flat netlist'
+        t0 = time.perf_counter()
+        base, others = self.corners[0], self.corners[1:]
+        self._build(base)
+        sim_setup = self.session.sim_setup
+        os.makedirs(sim_setup['output_dir'], exist_ok=True)
+        with self.session:
+            # This also writes the Verilog-A sources into output_dir
+            SweepNetlistPass(self.main, 'xmain', self.cache, set()).run()
+            base_modules = dict(self.session.modules)
+        netlisted = self._map('_netlist_corner', others)
+
+        from .netlist import get_template
+        template = get_template(self.template_str)
+        output_dir = self.tech_options['output_dir']
+        blocks, rows = [], []
+        for corner, (modules, rebuilt, sources) in zip(others, netlisted):
+            corner_setup = self.get_sim_setup(corner)
+            changed = self.get_changed_keys(corner_setup)
+            altered = [name for name, lines in modules.items() if base_modules.get(name) != lines]
+            stale = []
+            for filename, contents in sources.items():
+                base_file = os.path.join(output_dir, filename)
+                if not os.path.exists(base_file):
+                    stale.append(filename)
+                    continue
+                with open(base_file) as f:
+                    if f.read() != contents:
+                        stale.append(filename)
+            if style == 'data':
+                sweepable = set(self.tech_options.get('sweep_params', []))
+                assert changed <= sweepable | {'output_dir'}, \
+                    f'Corner {corner.name} changes {sorted(changed - sweepable - {"output_dir"})}, '\
+                    f'but a .data sweep can only vary {sorted(sweepable)} (use the alter style)'
+                assert not altered and not stale, \
+                    f'Corner {corner.name} changes subcircuits {altered + stale}, which a .data sweep can\'t (use the alter style)'
+                rows.append(corner_setup)
+            else:
+                if stale:
+                    logger.warning(f'Corner {corner.name} changes the Verilog-A sources {stale}; '
+                                    f'they are written at corner {base.name}')
+                lines = [f'.alter {corner.name}', template.get_def('alter').render(**corner_setup)]
+                for name in altered:
+                    lines += modules[name]
+                blocks.append('\n'.join(lines))
+
+        if style == 'data':
+            params = sorted(set(self.tech_options.get('sweep_params', [])))
+            table = [f'.data cb_corners {" ".join(params)}']
+            for row in [sim_setup] + rows:
+                table.append('+ ' + ' '.join(str(row[param]) for param in params))
+            table.append('.enddata')
+            sim_setup['sweep_data'] = '\n'.join(table)
+            sim_setup['sweep_analysis'] = ' sweep data=cb_corners'
+        else:
+            sim_setup['alters'] = '\n\n'.join(blocks)
+
+        with self.session:
+            spice = self.script.emit(self.main, sim_setup, self.template_str)
+        missing = 'alters' if style == 'alter' else 'sweep_data'
+        assert not sim_setup[missing] or sim_setup[missing] in spice, \
+            f'The process template does not place ${{{missing}}}, so it can\'t be used for {style} sweeps'
+        logger.info(f'Netlisted {len(self.corners)} corners into {self.script.outputs[0]} '
+                    f'in {(time.perf_counter()-t0)*1000:.1f} ms')
+        return spice
@@ -1,4 +1,4 @@
-import inspect, logging
+import inspect, logging, time
 from .ports import Port, Ports
 from collections import defaultdict
 from .helpers import LogBlock
@@ -101,12 +101,13 @@ class SymbolTable:
             for connected_port in port.connections:
                 self.connected['locals'][connected_port].add(sym)
 
-        logger.debug('fast ports table:')
-        for port, connected_set in self.connected['ports'].items():
-            logger.debug(f'{port} == {connected_set}')
-        logger.debug('fast locals table:')
-        for local_port, local_connected_set in self.connected['locals'].items():
-            logger.debug(f'{local_port} == {local_connected_set}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('fast ports table:')
+            for port, connected_set in self.connected['ports'].items():
+                logger.debug('%s == %s', port, connected_set)
+            logger.debug('fast locals table:')
+            for local_port, local_connected_set in self.connected['locals'].items():
+                logger.debug('%s == %s', local_port, local_connected_set)
         LogBlock(f'Setting up connections lookup for {self.instance} symbol table')
 
 
@@ -195,21 +196,32 @@ xmp0 p.vdd a b UNC pch_svt_mac nfin=2 l=0.008u
         # - probably not because everything should be only 1 away
 
 
+        profiler = self.instance.profiler
         # Check the instance ports first; this name should always take priority
         #if (sym := self.get_connected_symbol(port, self.ports)):
         if (sym := self.get_connected_symbol_fast(port, 'ports')):
-            logger.debug(f'\t\tFound instance port {sym}')
+            logger.debug('\t\tFound instance port %s', sym)
+            if profiler is not None:
+                profiler.count_lookup(self.instance.get_module_type_name(), 'fast')
             return sym.name, sym.port
         elif (sym := self.get_connected_symbol_fast(port, 'locals')):
         #elif (sym := self.get_connected_symbol(port, self.locals)):
-            logger.debug(f'\t\tFound local port {sym}')
+            logger.debug('\t\tFound local port %s', sym)
+            if profiler is not None:
+                profiler.count_lookup(self.instance.get_module_type_name(), 'fast')
             return sym.name, sym.port
         else:
             # More complicated case to search in sub_instance ports in this module
             # This is slow the first time each port is encountered, but subsequent references
             # can pull up the symbol directly from the locals (since create a new local alias
             # to refer to the subport)
-            sym = self.get_connected_symbol(port, self.sub_instance_ports)
+            if profiler is None:
+                sym = self.get_connected_symbol(port, self.sub_instance_ports)
+            else:
+                t0 = time.perf_counter()
+                sym = self.get_connected_symbol(port, self.sub_instance_ports)
+                profiler.count_lookup(self.instance.get_module_type_name(),
+                                      'slow_hit' if sym else 'slow_miss', t0)
             if (sym):
                 # Need to create a temp var here to access the sub port
                 # because I'm not sure verilog allows a "inst.port" reference
@@ -222,11 +234,13 @@ xmp0 p.vdd a b UNC pch_svt_mac nfin=2 l=0.008u
                 
                 sym = Symbol(tmp_var.name, tmp_var)
                 self.connected['locals'][tmp_var].add(sym)
+                # So that looking this port up again finds the same name
+                self.connected['locals'][port].add(sym)
                 for connected_port in port.connections:
                     self.connected['locals'][connected_port].add(sym)
 
                 #self._get_set_of_connections(tmp_var, tmp_var.name, self.connected['locals'])
-                logger.debug(f'\t\tCreated new local {tmp_var.name}={tmp_var} for {port.name}, {port}')
+                logger.debug('\t\tCreated new local %s=%s for %s, %s', tmp_var.name, tmp_var, port.name, port)
                 self.tmp_id+=1
                 return tmp_var.name, tmp_var
             else:
@@ -234,7 +248,7 @@ xmp0 p.vdd a b UNC pch_svt_mac nfin=2 l=0.008u
 
 
     def get_connected_symbol_fast(self, port, search_type:str) -> Symbol:
-        logger.debug(f'Getting fast connected symbol in {search_type} for {port}')
+        logger.debug('Getting fast connected symbol in %s for %s', search_type, port)
         search_set = self.connected[search_type].get(port, None)
         if search_set:
             #return next(iter(search_set))
@@ -254,17 +268,17 @@ xmp0 p.vdd a b UNC pch_svt_mac nfin=2 l=0.008u
         """
 
         # Need to make a set of port and its connections, then find intersection with p and its connections
-        logger.debug(f'Getting connected symbol for {port}')
+        logger.debug('Getting connected symbol for %s', port)
         port_aliases = set([port]) | port.connections
         for p_name, p in lookup_dict.items():
-            logger.debug(f'Searching {p_name}={p}')
+            logger.debug('Searching %s=%s', p_name, p)
             if isinstance(p, dict):
                 # Collection of sub_instance ports
                 logger.debug('found dict')
                 for sub_port_name, sub_port in p.items():
                     # Need to flatten each sub_port to check if this port is in this subinstance ports
                     for flattened in sub_port.iter_flattened():
-                        logger.debug(f'\t\tChecking {port} against {flattened}')
+                        logger.debug('\t\tChecking %s against %s', port, flattened)
                         if port == flattened or flattened in port.connections:
                             return Symbol(f'{sub_port_name}', flattened, hierarchy=p_name)
             elif p.is_flat():
@@ -0,0 +1,26 @@
+// Single-bit bucket: checks d against the next value on every rising clk edge out of reset (see hspice_bucket.va)
+module ${MODULE_NAME}(clk, _reset, d);
+    input clk;
+    input _reset;
+    input d;
+
+    parameter integer N = ${nvalues};
+
+    reg values [0:${max(nvalues, 1) - 1}];
+    integer cvalue = 0;
+
+    initial begin
+% for i, val in enumerate(values):
+        values[${i}] = 1'b${val};
+% endfor
+    end
+
+    always @(posedge clk)
+        if (cvalue < N && _reset === 1'b1) begin
+            if (d === values[cvalue])
+                $display("At time %0t verified %0dth value %0d to %m", $time, cvalue, values[cvalue]);
+            else
+                $display("ERROR: At time %0t expected %0dth value %0d but received %b to %m", $time, cvalue, values[cvalue], d);
+            cvalue = cvalue + 1;
+        end
+endmodule
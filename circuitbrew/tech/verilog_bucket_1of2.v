@@ -0,0 +1,51 @@
+// Dual-rail with enable (E1of2) sink/verification for 4-phase QDI circuits (see hspice_bucket_1of2.va)
+module ${MODULE_NAME}(_pReset, _sReset, lt, lf, le);
+    input _pReset, _sReset, lt, lf;
+    output le;
+
+    parameter DELAY = 0.03;   // ns
+    parameter integer N = ${nvalues};
+
+    reg values [0:${max(nvalues, 1) - 1}];
+    reg vle = 1'b0;
+    integer cvalue = 0;
+
+    assign #DELAY le = vle;
+
+    initial begin
+% for i, val in enumerate(values):
+        values[${i}] = 1'b${val};
+% endfor
+    end
+
+    task check;
+        input val;
+        begin
+            if (cvalue >= N) begin
+                $display("At time %0t bucketed %0dth value of %0d to %m", $time, cvalue, val);
+                vle = 1'b0;
+            end
+            else if (values[cvalue] !== val) begin
+                // The channel would deadlock, so end the sim
+                $display("Error, %m %0dth value expected %0d, got %0d", cvalue, values[cvalue], val);
+                $finish;
+            end
+            else begin
+                $display("At time %0t verified %0dth value of %0d to %m", $time, cvalue, val);
+                vle = 1'b0;
+            end
+            cvalue = cvalue + 1;
+        end
+    endtask
+
+    // If both resets are released at once, _sReset wins
+    always @(posedge _pReset) if (_sReset !== 1'b1) vle = 1'b0;
+
+    always @(posedge lt) check(1'b1);
+    always @(posedge lf) check(1'b0);
+
+    always @(posedge _sReset) vle = 1'b1;
+
+    // Neutrality
+    always @(negedge lt or negedge lf) vle = 1'b1;
+endmodule
@@ -0,0 +1,20 @@
+// Clock (see hspice_clk.va)
+module ${MODULE_NAME}(en, clk);
+    input en;
+    output clk;
+
+    parameter real freq = 1000;   // KHz
+    parameter real offset = 0;    // ns
+
+    reg clk = 1'b0;
+
+    initial begin
+        #(offset);
+        forever begin
+            clk = 1'b0;
+            #(1e6/freq/2);
+            clk = 1'b1;
+            #(1e6/freq/2);
+        end
+    end
+endmodule
@@ -0,0 +1,25 @@
+// Single-bit source: outputs the next value on every rising clk edge out of reset (see hspice_src.va)
+module ${MODULE_NAME}(clk, _reset, d);
+    input clk;
+    input _reset;
+    output d;
+
+    parameter integer N = ${nvalues};
+
+    reg values [0:${max(nvalues, 1) - 1}];
+    reg d = 1'b0;
+    integer cvalue = 0;
+
+    initial begin
+% for i, val in enumerate(values):
+        values[${i}] = 1'b${val};
+% endfor
+    end
+
+    always @(posedge clk)
+        if (_reset === 1'b1) begin
+            if (cvalue == N) cvalue = 0;
+            d <= values[cvalue];
+            cvalue = cvalue + 1;
+        end
+endmodule
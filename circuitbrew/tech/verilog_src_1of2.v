@@ -0,0 +1,47 @@
+// Dual-rail with enable (E1of2) source for 4-phase QDI circuits (see hspice_src_1of2.va)
+module ${MODULE_NAME}(_pReset, _sReset, lt, lf, le);
+    input _pReset, _sReset, le;
+    output lt, lf;
+
+    parameter DELAY = 0.02;   // ns
+    parameter integer N = ${nvalues};
+
+    reg values [0:${max(nvalues, 1) - 1}];
+    reg vlt = 1'b0, vlf = 1'b0;
+    integer cvalue = 0;
+
+    assign #DELAY lt = vlt;
+    assign #DELAY lf = vlf;
+
+    initial begin
+% for i, val in enumerate(values):
+        values[${i}] = 1'b${val};
+% endfor
+    end
+
+    task send;
+        begin
+            if (cvalue == N) cvalue = 0;
+            if (values[cvalue]) vlt = 1'b1;
+            else vlf = 1'b1;
+            $display("At time %0t sourced %0dth value of %0d to %m", $time, cvalue, values[cvalue]);
+            cvalue = cvalue + 1;
+        end
+    endtask
+
+    always @(posedge _pReset) begin
+        vlt = 1'b0;
+        vlf = 1'b0;
+    end
+
+    always @(posedge le) send;
+
+    always @(posedge _sReset)
+        if (le === 1'b1) send;
+
+    // Neutrality, reset data rails
+    always @(negedge le) begin
+        vlt = 1'b0;
+        vlf = 1'b0;
+    end
+endmodule
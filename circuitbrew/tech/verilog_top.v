@@ -0,0 +1,22 @@
+// Structural Verilog netlist of ${main_type_name}
+`timescale 1ns/1ps
+
+${circuit}
+
+// Charge storage of a floating node: weakly keeps the last value driven on it
+module cb_charge(n);
+    inout n;
+
+    reg q = 1'bx;
+
+    assign (weak0, weak1) n = q;
+
+    always @(n)
+        if (n !== 1'bz) q = n;
+endmodule
+
+module top;
+    ${main_type_name} xmain();
+
+    initial #${context.get('sim_time', 10)} $finish;
+endmodule
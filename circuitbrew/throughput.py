@@ -0,0 +1,369 @@
+"""
+    Static throughput analysis of QDI pipelines, enabled with
+    `cb_netlist --throughput FILE`, to size pipelines before running transients.
+
+    The handshakes of the built design are modelled as a marked graph (Williams'
+    pipeline model).  The cells are the modules with `E1of2` ports that have no
+    sub-instances with `E1of2` ports of their own (e.g. `Wchb`, the sources and
+    buckets), plus any module that has latency annotations.  For every channel
+    from an `E1of2OutputPort` of cell u to an `E1of2InputPort` of cell v there is:
+
+    - a forward arc u -> v with v's `forward_latency` (the data), and
+    - a backward arc v -> u with v's `backward_latency` (the acknowledge), which
+      holds the one token of slack of the channel
+
+    Cells with `initial_tokens` set (e.g. a token buffer in a ring) start with a
+    token on their output channels instead.  The latencies are set per module type
+    in the tech file (`auto: {forward_latency: .., backward_latency: ..}`) or as
+    instance attributes, in any one time unit; unannotated cells take no time.
+
+    The cycle time of the design is the maximum cycle ratio of the graph: over
+    all cycles, the largest sum of latencies divided by the tokens on the cycle.
+    It is computed with Howard's policy iteration, which takes a few passes over
+    the arcs even for graphs with 100k cells.  The throughput is 1/cycle time, and
+    the cycle reaching it is the critical cycle: the stages to speed up (or the ring
+    to add slack or tokens to).
+"""
+import sys, json, logging
+
+logger = logging.getLogger(__name__)
+
+EPSILON = 1e-9
+
+
+class HandshakeGraph:
+    """ Marked graph of the channel handshakes between cells
+
+        Attributes:
+            names (list[str]): Hierarchical cell names (indexed by node)
+            src, dst (list[int]): Nodes of each arc
+            latency (list[float]): Latency of each arc
+            tokens (list[int]): Initial tokens on each arc
+            labels (list[str]): Description of each arc (`forward`/`backward` and the channel)
+    """
+    def __init__(self):
+        self.names = []
+        self.src, self.dst = [], []
+        self.latency, self.tokens = [], []
+        self.labels = []
+
+    def add_node(self, name: str) -> int:
+        self.names.append(name)
+        return len(self.names) - 1
+
+    def add_arc(self, u: int, v: int, latency: float, tokens: int, label: str = ''):
+        self.src.append(u)
+        self.dst.append(v)
+        self.latency.append(float(latency))
+        self.tokens.append(tokens)
+        self.labels.append(label)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_module(cls, main, main_name: str = 'xmain') -> 'HandshakeGraph':
+        """ Extract the handshake graph of a built design
+        """
+        from .compound_ports import E1of2InputPort, E1of2OutputPort
+        graph = cls()
+        cells = []    # (node, module)
+        owners = {}   # true rail Port of a cell input -> (node, port name)
+
+        def e1of2_ports(module):
+            return [(name, port) for name, port in module._sym_table.ports.items()
+                        if isinstance(port, (E1of2InputPort, E1of2OutputPort))]
+
+        def walk(module, name) -> bool:
+            # Returns whether module or anything below it has E1of2 ports
+            below = False
+            for inst_name, inst in module._sym_table.sub_instances.items():
+                below |= walk(inst, f'{name}.{inst_name}')
+            ports = e1of2_ports(module)
+            annotated = hasattr(module, 'forward_latency') or hasattr(module, 'backward_latency')
+            if ports and (annotated or not below):
+                node = graph.add_node(name)
+                cells.append((node, module))
+                for port_name, port in ports:
+                    if isinstance(port, E1of2InputPort):
+                        owners[port.t] = (node, port_name)
+            return below or bool(ports)
+
+        walk(main, main_name)
+
+        for u, module in cells:
+            tokens = int(getattr(module, 'initial_tokens', 0))
+            for port_name, port in e1of2_ports(module):
+                if not isinstance(port, E1of2OutputPort):
+                    continue
+                for v, in_name in _find_receivers(port.t, owners):
+                    receiver = cells[v][1]
+                    channel = f'{graph.names[u]}.{port_name} -> {graph.names[v]}.{in_name}'
+                    graph.add_arc(u, v, getattr(receiver, 'forward_latency', 0), min(tokens, 1),
+                                  f'forward {channel}')
+                    graph.add_arc(v, u, getattr(receiver, 'backward_latency', 0), 1 - min(tokens, 1),
+                                  f'backward {channel}')
+        logger.info('Handshake graph has %d cells and %d arcs', len(graph), len(graph.src))
+        return graph
+
+
+def _find_receivers(port, owners) -> list:
+    """ Search the net of the true rail `port` for the cell inputs on it
+    """
+    found = []
+    seen = {port}
+    stack = [port]
+    while stack:
+        p = stack.pop()
+        for q in p.connections:
+            if q in seen:
+                continue
+            seen.add(q)
+            if (owner := owners.get(q)) is not None:
+                # Don't search into the cell
+                found.append(owner)
+            else:
+                stack.append(q)
+    return found
+
+
+def _strongly_connected(n: int, out_arcs: list, dst: list) -> list:
+    """ Tarjan's algorithm (iterative)
+
+        Returns:
+            list of components (lists of nodes)
+    """
+    index = [-1]*n
+    low = [0]*n
+    on_stack = [False]*n
+    stack, components = [], []
+    counter = 0
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        work = [(root, 0)]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            u, i = work[-1]
+            arcs = out_arcs[u]
+            if i < len(arcs):
+                work[-1] = (u, i+1)
+                v = dst[arcs[i]]
+                if index[v] < 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+                    work.append((v, 0))
+                elif on_stack[v] and index[v] < low[u]:
+                    low[u] = index[v]
+            else:
+                work.pop()
+                if work and low[u] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[u]
+                if low[u] == index[u]:
+                    component = []
+                    while True:
+                        v = stack.pop()
+                        on_stack[v] = False
+                        component.append(v)
+                        if v == u:
+                            break
+                    components.append(component)
+    return components
+
+
+def _has_cycle(component: list, out_arcs: list, dst: list) -> bool:
+    if len(component) > 1:
+        return True
+    u = component[0]
+    return any(dst[e] == u for e in out_arcs[u])
+
+
+def _howard(nodes: list, out_arcs: list, dst: list, w: list, t: list) -> tuple:
+    """ Howard's policy iteration for the maximum cycle ratio of one strongly
+        connected component (every cycle must hold a token)
+
+        Returns:
+            (ratio, list of the arcs of the critical cycle)
+    """
+    n = len(out_arcs)
+    in_scc = [False]*n
+    for u in nodes:
+        in_scc[u] = True
+    arcs = [None]*n
+    preds = [None]*n
+    for u in nodes:
+        arcs[u] = [e for e in out_arcs[u] if in_scc[dst[e]]]
+        preds[u] = []
+    src = {}
+    for u in nodes:
+        for e in arcs[u]:
+            preds[dst[e]].append(e)
+            src[e] = u
+    # Start each node on its best local cycle of two arcs (a channel handshake),
+    # which is often the critical one
+    policy = [-1]*n
+    for u in nodes:
+        best, best_ratio = max(arcs[u], key=w.__getitem__), None
+        for e in arcs[u]:
+            for r in arcs[dst[e]]:
+                if dst[r] == u and t[e] + t[r] > 0:
+                    ratio = (w[e] + w[r])/(t[e] + t[r])
+                    if best_ratio is None or ratio > best_ratio:
+                        best, best_ratio = e, ratio
+        policy[u] = best
+    lam, x = [0.0]*n, [0.0]*n
+    done = [False]*n
+    # Tolerances for comparing ratios and path values, relative to the latencies
+    scale = max(1.0, max(abs(w[e]) for e in src))
+    eps_lam = EPSILON*scale
+    eps_x = EPSILON*scale*len(nodes)
+    while True:
+        # Value determination: each node follows its policy arc to a cycle
+        for u in nodes:
+            done[u] = False
+        for start in nodes:
+            if done[start]:
+                continue
+            path, on_path = [], {}
+            u = start
+            while not done[u] and u not in on_path:
+                on_path[u] = len(path)
+                path.append(u)
+                u = dst[policy[u]]
+            if u in on_path:
+                cycle = path[on_path[u]:]
+                weight = sum(w[policy[c]] for c in cycle)
+                tokens = sum(t[policy[c]] for c in cycle)
+                ratio = weight/tokens
+                lam[u], x[u], done[u] = ratio, 0.0, True
+                for c in reversed(cycle[1:]):
+                    e = policy[c]
+                    lam[c], x[c], done[c] = ratio, w[e] - ratio*t[e] + x[dst[e]], True
+                path = path[:on_path[u]]
+            for c in reversed(path):
+                e = policy[c]
+                v = dst[e]
+                lam[c], x[c], done[c] = lam[v], w[e] - lam[v]*t[e] + x[v], True
+
+        # Policy improvement, first towards the cycles with larger ratios.  Push each
+        # ratio back through all the predecessors at once: plain Howard moves it by one
+        # arc per iteration, which takes as many iterations as a long ring has stages
+        changed = False
+        work = list(nodes)
+        while work:
+            v = work.pop()
+            for e in preds[v]:
+                u = src[e]
+                if lam[v] > lam[u] + eps_lam:
+                    lam[u] = lam[v]
+                    policy[u] = e
+                    changed = True
+                    work.append(u)
+        if not changed:
+            # Then towards larger values among the cycles with the same ratio, pushed
+            # through the predecessors the same way (a longest path search).  If the
+            # ratio isn't the best one yet, this would go round a cycle forever: stop
+            # and let the value determination find the better cycle
+            budget = len(src)
+            work = list(nodes)
+            while work and budget > 0:
+                v = work.pop()
+                for e in preds[v]:
+                    u = src[e]
+                    if abs(lam[v] - lam[u]) <= eps_lam and (val := w[e] - lam[u]*t[e] + x[v]) > x[u] + eps_x:
+                        x[u] = val
+                        policy[u] = e
+                        changed = True
+                        work.append(u)
+                        budget -= 1
+        if not changed:
+            break
+
+    u = max(nodes, key=lam.__getitem__)
+    seen = set()
+    while u not in seen:
+        seen.add(u)
+        u = dst[policy[u]]
+    cycle, v = [], u
+    while True:
+        cycle.append(policy[v])
+        v = dst[policy[v]]
+        if v == u:
+            break
+    ratio = sum(w[e] for e in cycle)/sum(t[e] for e in cycle)
+    return ratio, cycle
+
+
+def max_cycle_ratio(graph: HandshakeGraph) -> tuple:
+    """ Returns:
+            (cycle time, list of the arcs of the critical cycle), or (0.0, []) if the
+            graph has no cycles
+    """
+    n = len(graph)
+    out_arcs = [[] for _ in range(n)]
+    for e, u in enumerate(graph.src):
+        out_arcs[u].append(e)
+
+    # A cycle without tokens can never fire: check that the arcs without tokens
+    # can be sorted topologically
+    in_degree = [0]*n
+    for e, v in enumerate(graph.dst):
+        if graph.tokens[e] == 0:
+            in_degree[v] += 1
+    ready = [u for u in range(n) if in_degree[u] == 0]
+    while ready:
+        u = ready.pop()
+        for e in out_arcs[u]:
+            if graph.tokens[e] == 0:
+                v = graph.dst[e]
+                in_degree[v] -= 1
+                if in_degree[v] == 0:
+                    ready.append(v)
+    stuck = [graph.names[u] for u in range(n) if in_degree[u] > 0]
+    assert not stuck, f'Deadlock: cycle without tokens through {", ".join(stuck[:10])}'
+
+    best, critical = 0.0, []
+    for component in _strongly_connected(n, out_arcs, graph.dst):
+        if _has_cycle(component, out_arcs, graph.dst):
+            ratio, cycle = _howard(component, out_arcs, graph.dst, graph.latency, graph.tokens)
+            if ratio > best or not critical:
+                best, critical = ratio, cycle
+    return best, critical
+
+
+def analyze(main, main_name: str = 'xmain') -> dict:
+    """ Static throughput analysis of a built design
+
+        Returns:
+            dict: `cycle_time`, `throughput` (tokens per time unit), the `critical_cycle`
+            (its arcs, with latencies and tokens), and the size of the graph
+    """
+    graph = HandshakeGraph.from_module(main, main_name)
+    cycle_time, cycle = max_cycle_ratio(graph)
+    return {'cells': len(graph),
+            'arcs': len(graph.src),
+            'cycle_time': cycle_time,
+            'throughput': 1/cycle_time if cycle_time > 0 else None,
+            'critical_cycle': [{'arc': graph.labels[e], 'latency': graph.latency[e], 'tokens': graph.tokens[e]}
+                                   for e in cycle]}
+
+
+def summary(report: dict) -> str:
+    lines = [f'Cycle time {report["cycle_time"]:g} ({report["cells"]} cells, {report["arcs"]} arcs)',
+             'Critical cycle:']
+    for arc in report['critical_cycle']:
+        lines.append(f'  {arc["latency"]:10g} {"*" if arc["tokens"] else " "} {arc["arc"]}')
+    return '\n'.join(lines)
+
+
+def write(main, filename: str):
+    report = analyze(main)
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info('Wrote throughput analysis to %s', filename)
+    print(summary(report), file=sys.stderr)
@@ -0,0 +1,193 @@
+"""
+    Timing-annotated behavioral simulation, enabled with `cb_netlist --timing FILE`,
+    for quick throughput estimates before running SPICE.
+
+    The sim runs in virtual time.  Each simulated module takes its
+    `forward_latency` (from its last input token to its next output token) and
+    `backward_latency` (for a channel it received on to accept the next token,
+    after its output) from the tech file (`auto:` settings per module type) or from
+    a `Param`, e.g. `Parameterize(Wchb, forward_latency=80)`.  Unannotated modules
+    take no time.  Channels hold one token unless the tech file sets
+    `channel_slack`, so a channel from u to v runs a token at most every
+    forward_latency(v) + backward_latency(v), as in [circuitbrew.throughput][].
+
+    Virtual time only moves when every sim task is blocked: the clock then jumps to
+    the next pending delay.  The sim ends when nothing is pending any more, and the
+    report has, for each channel, the number of tokens, the arrival of the first
+    token (the latency from the start of the sim) and the mean time between tokens
+    (the cycle time).  The slowest channel sets the cycle time of the design.
+"""
+import sys, json, heapq, itertools, logging
+
+from .trace import iter_named_ports
+
+logger = logging.getLogger(__name__)
+
+
+class ModuleTiming:
+    """ Latencies and state of one simulated module
+
+        Attributes:
+            forward (float): Forward latency
+            backward (float): Backward latency
+            ready_at (float): Virtual time its next output token is ready
+    """
+    __slots__ = ('forward', 'backward', 'ready_at')
+
+    def __init__(self, forward: float, backward: float):
+        self.forward = forward
+        self.backward = backward
+        self.ready_at = 0.0
+
+
+class ChannelTiming:
+    """ Token arrival times on one receiving port
+    """
+    __slots__ = ('name', 'tokens', 'first', 'last')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.tokens = 0
+        self.first = None
+        self.last = None
+
+
+class SimClock:
+    """ Virtual time for the behavioral sim.  It is a curio activation (so it sees
+        every task run) and Port.send/Port.recv call it while it is set on the
+        current session.
+
+        Examples:
+
+            >>> clock = SimClock()
+            >>> with Session(sim_setup, sim_clock=clock):
+                    curio.run(SimPass(main, 'xmain').run_sim, activations=[clock])
+            >>> clock.write('timing.json')
+
+        Attributes:
+            now (float): Current virtual time
+            stalled (list[str]): Sources that could not send all their tokens (deadlock)
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.stalled = []
+        self._sleepers = []   # Heap of (wake up time, sequence number, curio Event)
+        self._seq = itertools.count()
+        self._runs = 0
+        self.modules = {}     # Port -> ModuleTiming of the simulated module it belongs to
+        self.free_at = {}     # Receiving Port -> virtual time it accepts the next token
+        self.channels = {}    # Receiving Port -> ChannelTiming
+        self.port_names = {}  # Port -> hierarchical name, from the sim walk
+
+    # ---- curio activation
+    def activate(self, kernel): pass
+
+    def created(self, task): pass
+
+    def running(self, task):
+        self._runs += 1
+
+    def suspended(self, task, trap): pass
+
+    def terminated(self, task): pass
+
+    # ---- Setup from the sim walk
+    def name_ports(self, module_name: str, port_name: str, port):
+        for name, sub_port in iter_named_ports(f'{module_name}.{port_name}', port):
+            self.port_names.setdefault(sub_port, name)
+
+    def add_module(self, module):
+        """ Apply the latencies of a simulated module to its ports
+        """
+        timing = ModuleTiming(float(getattr(module, 'forward_latency', 0) or 0),
+                              float(getattr(module, 'backward_latency', 0) or 0))
+        for port in module._sym_table.ports.values():
+            for flat_port in port.iter_flattened():
+                self.modules.setdefault(flat_port, timing)
+
+    # ---- Called from Port.send/recv
+    async def sleep_until(self, t: float):
+        if t <= self.now:
+            return
+        from curio import Event
+        event = Event()
+        heapq.heappush(self._sleepers, (t, next(self._seq), event))
+        await event.wait()
+
+    async def before_send(self, port):
+        """ Wait until the sending module's output is ready
+        """
+        if (timing := self.modules.get(port)) is not None:
+            await self.sleep_until(timing.ready_at)
+
+    async def before_put(self, receiver):
+        """ Wait until the receiving channel accepts the next token
+        """
+        if (t := self.free_at.get(receiver)) is not None:
+            await self.sleep_until(t)
+
+    def received(self, port):
+        """ A token arrived on port
+        """
+        now = self.now
+        if (timing := self.modules.get(port)) is not None:
+            timing.ready_at = now + timing.forward
+            self.free_at[port] = now + timing.forward + timing.backward
+        if (name := self.port_names.get(port)) is not None:
+            if (channel := self.channels.get(port)) is None:
+                channel = self.channels[port] = ChannelTiming(name)
+                channel.first = now
+            channel.tokens += 1
+            channel.last = now
+
+    # ---- Driver
+    async def run(self):
+        """ Advance virtual time whenever every other task is blocked, until
+            nothing is pending any more
+        """
+        from curio import sleep
+        sleepers = self._sleepers
+        while True:
+            runs = self._runs
+            await sleep(0)
+            if self._runs > runs + 1:
+                continue  # Other tasks ran
+            if not sleepers:
+                return
+            self.now = t = sleepers[0][0]
+            while sleepers and sleepers[0][0] <= t:
+                await heapq.heappop(sleepers)[2].set()
+
+    def get_report(self) -> dict:
+        """ Returns:
+                dict: the end `time`, the `cycle_time` of the slowest channel, the
+                `stalled` sources, and the `channels` (slowest first)
+        """
+        channels = []
+        for channel in self.channels.values():
+            cycle_time = (channel.last - channel.first)/(channel.tokens - 1) if channel.tokens > 1 else None
+            channels.append({'name': channel.name, 'tokens': channel.tokens,
+                             'first_token': channel.first, 'cycle_time': cycle_time})
+        channels.sort(key=lambda c: (-(c['cycle_time'] or 0), c['name']))
+        return {'time': self.now,
+                'cycle_time': channels[0]['cycle_time'] if channels else None,
+                'stalled': self.stalled,
+                'channels': channels}
+
+    def summary(self, report: dict, top: int = 10) -> str:
+        cycle_time = report['cycle_time']
+        lines = [f'Sim ended at {report["time"]:g}, cycle time {cycle_time if cycle_time is None else f"{cycle_time:g}"}']
+        if report['stalled']:
+            lines.append(f'Deadlock: {", ".join(report["stalled"])} did not finish')
+        lines.append(f'{"channel":<40}{"tokens":>9}{"first token":>13}{"cycle time":>12}')
+        for c in report['channels'][:top]:
+            cycle = '' if c['cycle_time'] is None else f'{c["cycle_time"]:12g}'
+            lines.append(f'{c["name"][:39]:<40}{c["tokens"]:9d}{c["first_token"]:13g}{cycle:>12}')
+        return '\n'.join(lines)
+
+    def write(self, filename: str):
+        report = self.get_report()
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info('Wrote sim timing to %s', filename)
+        print(self.summary(report), file=sys.stderr)
@@ -0,0 +1,260 @@
+"""
+    Record every token sent and received during a behavioral simulation, cheaply
+    enough to leave on for long sims, and export it to VCD for a waveform viewer.
+
+        cb_netlist --trace sim.cbt --vcd sim.vcd sw130 mine.logic hspice all
+
+    While recording, each `Port.send` and `Port.recv` stores (time, channel id,
+    kind, value) into preallocated arrays, which are written out to the trace file
+    in binary blocks whenever they fill up.  A channel is one Port object (for
+    E1of2 channels that's the true rail, which carries the tokens); channels are
+    named by their place in the hierarchy, e.g. `xmain.buf0.r.t`.
+
+    The trace file is:
+
+    - the magic `CBTRACE2`
+    - blocks of `B`, the record count n (uint32), then n times (int64 ns since
+      the start of the recording), n channel ids (uint32), n kinds (uint8,
+      0 = send, 1 = recv, plus `TABLED` if the value isn't an int64) and n
+      values (int64), in native byte order
+    - a final `J` block: uint32 length, then JSON with the channel names and the
+      table of the other values (the value of a `TABLED` record is its index)
+"""
+import json, time, struct, logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CBTRACE2'
+SEND, RECV = 0, 1
+TABLED = 2  # Flag in the kind of a record whose value indexes the value table
+_INT64_MASK = (1 << 64) - 1
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+# Translation tables of the kind bytes, into SEND/RECV and into the TABLED flag
+_KIND_BYTES = bytes(k & RECV for k in range(256))
+_TABLED_BYTES = bytes(bool(k & TABLED) for k in range(256))
+
+
+def iter_named_ports(prefix: str, port):
+    """ Yields:
+            (name, Port) for each single port in port (e.g. `xmain.buf0.r.t` for the
+            true rail of E1of2 port `r` with prefix `xmain.buf0.r`)
+    """
+    from .compound_ports import CompoundPort
+    from .ports import Ports
+    if isinstance(port, CompoundPort):
+        for sub_name, sub_port in port.get_ports().items():
+            yield from iter_named_ports(f'{prefix}.{sub_name}', sub_port)
+    elif isinstance(port, Ports):
+        for i, sub_port in enumerate(port):
+            yield from iter_named_ports(f'{prefix}[{i}]', sub_port)
+    else:
+        yield prefix, port
+
+
+class TraceRecorder:
+    """ Records sim tokens into a trace file
+
+        Examples:
+
+            >>> with Session(sim_setup, tracer=TraceRecorder('sim.cbt')) as session:
+                    ...
+            >>> session.tracer.close()
+            >>> export_vcd('sim.cbt', 'sim.vcd')
+
+        Args:
+            filename: The trace file to write
+            capacity: Number of records buffered in memory between writes
+    """
+    def __init__(self, filename: str, capacity: int = 1 << 16):
+        self.filename = filename
+        self.capacity = capacity
+        self.times = array('q', bytes(8*capacity))
+        self.channels = array('I', bytes(4*capacity))
+        self.kinds = array('B', bytes(capacity))
+        self.values = array('q', bytes(8*capacity))
+        self.n = 0
+        self.total = 0
+        self.ids = {}        # Port -> channel id
+        self.names = []      # channel id -> name
+        self.port_names = {} # Port -> hierarchical name, from the sim walk
+        self.value_ids = {}  # repr of a non-int64 value -> index in value_table
+        self.value_table = []
+        self.t0 = time.perf_counter_ns()
+        self.f = open(filename, 'wb')
+        self.f.write(MAGIC)
+
+    def name_ports(self, module_name: str, port_name: str, port):
+        """ Name the channels of a module port, for ports that get traced later
+        """
+        for name, sub_port in iter_named_ports(f'{module_name}.{port_name}', port):
+            self.port_names.setdefault(sub_port, name)
+
+    def _new_channel(self, port) -> int:
+        cid = self.ids[port] = len(self.names)
+        self.names.append(self.port_names.get(port) or f'{port.name}#{cid}')
+        return cid
+
+    def record(self, port, kind: int, val):
+        """ Record one token (called from Port.send/recv)
+        """
+        if (cid := self.ids.get(port)) is None:
+            cid = self._new_channel(port)
+        if type(val) is not int or not _INT64_MIN <= val <= _INT64_MAX:
+            if isinstance(val, bool):
+                val = int(val)
+            else:
+                kind |= TABLED
+                val = self._value_index(val)
+        n = self.n
+        self.times[n] = time.perf_counter_ns() - self.t0
+        self.channels[n] = cid
+        self.kinds[n] = kind
+        self.values[n] = val
+        self.n = n = n+1
+        if n == self.capacity:
+            self.flush()
+
+    def _value_index(self, val) -> int:
+        key = repr(val)
+        if (index := self.value_ids.get(key)) is None:
+            index = self.value_ids[key] = len(self.value_table)
+            self.value_table.append(key)
+        return index
+
+    def flush(self):
+        """ Write the buffered records to the file
+        """
+        n = self.n
+        if n == 0:
+            return
+        self.f.write(b'B' + struct.pack('I', n))
+        for arr in (self.times, self.channels, self.kinds, self.values):
+            self.f.write(memoryview(arr)[:n].tobytes())
+        self.total += n
+        self.n = 0
+
+    def close(self):
+        self.flush()
+        footer = json.dumps({'channels': self.names, 'values': self.value_table}).encode()
+        self.f.write(b'J' + struct.pack('I', len(footer)) + footer)
+        self.f.close()
+        logger.info('Wrote %d sim tokens on %d channels to %s', self.total, len(self.names), self.filename)
+
+
+class Trace:
+    """ A trace file read back into arrays
+
+        Attributes:
+            channels (list[str]): Channel names (indexed by channel id)
+            times (array): Time of each record in ns
+            channel_ids (array): Channel id of each record
+            kinds (array): SEND or RECV
+            tabled (array): 1 where the value is an index into value_table
+            values (array): Token values
+            value_table (list[str]): repr() of the values that aren't int64 (wide
+                                     integers included)
+    """
+    def __init__(self, filename: str):
+        self.times, self.channel_ids = array('q'), array('I')
+        self.kinds, self.values = array('B'), array('q')
+        with open(filename, 'rb') as f:
+            assert f.read(len(MAGIC)) == MAGIC, f'{filename} is not a circuitbrew trace'
+            while (tag := f.read(1)) == b'B':
+                n, = struct.unpack('I', f.read(4))
+                for arr in (self.times, self.channel_ids, self.kinds, self.values):
+                    arr.frombytes(f.read(n*arr.itemsize))
+            assert tag == b'J', f'{filename} is truncated (was the recording closed?)'
+            size, = struct.unpack('I', f.read(4))
+            footer = json.loads(f.read(size))
+        self.channels = footer['channels']
+        self.value_table = footer['values']
+        kinds = self.kinds.tobytes()
+        self.kinds = array('B', kinds.translate(_KIND_BYTES))
+        self.tabled = array('B', kinds.translate(_TABLED_BYTES))
+
+    def __len__(self):
+        return len(self.times)
+
+    def get_value(self, i: int):
+        val = self.values[i]
+        return self.value_table[val] if self.tabled[i] else val
+
+    def tokens(self, channel: str, kind: int = SEND) -> list:
+        """ Returns:
+                The values sent (or received) on a channel, in order
+        """
+        cid = self.channels.index(channel)
+        return [self.get_value(i) for i in range(len(self))
+                    if self.channel_ids[i] == cid and self.kinds[i] == kind]
+
+
+def _vcd_id(n: int) -> str:
+    chars = []
+    while True:
+        n, r = divmod(n, 94)
+        chars.append(chr(33+r))
+        if n == 0:
+            return ''.join(chars)
+        n -= 1
+
+
+def export_vcd(trace_filename: str, vcd_filename: str):
+    """ Convert a trace file into a VCD file.  Every channel gets a wire with the last
+        value sent on it (1 bit, or 64 bits in two's complement if it ever carried an
+        integer other than 0/1, or a string for other values) and a `<channel>.tok` wire that toggles with every
+        token sent, so that repeated values remain visible.
+    """
+    trace = Trace(trace_filename)
+    n_channels = len(trace.channels)
+    sent = [False]*n_channels
+    kind = ['bit']*n_channels
+    for i in range(len(trace)):
+        if trace.kinds[i] == SEND:
+            cid, val = trace.channel_ids[i], trace.values[i]
+            sent[cid] = True
+            if trace.tabled[i]:
+                kind[cid] = 'string'
+            elif val not in (0, 1) and kind[cid] == 'bit':
+                kind[cid] = 'int'
+
+    with open(vcd_filename, 'w') as f:
+        f.write(f'$date {time.strftime("%Y-%m-%d %H:%M:%S")} $end\n')
+        f.write('$version circuitbrew trace $end\n$timescale 1ns $end\n$scope module top $end\n')
+        for cid, name in enumerate(trace.channels):
+            if not sent[cid]:
+                continue
+            if kind[cid] == 'string':
+                f.write(f'$var string 1 {_vcd_id(2*cid)} {name} $end\n')
+            else:
+                width = 1 if kind[cid] == 'bit' else 64
+                f.write(f'$var wire {width} {_vcd_id(2*cid)} {name} $end\n')
+            f.write(f'$var wire 1 {_vcd_id(2*cid+1)} {name}.tok $end\n')
+        f.write('$upscope $end\n$enddefinitions $end\n')
+
+        toggles = [0]*n_channels
+        f.write('$dumpvars\n')
+        for cid in range(n_channels):
+            if sent[cid]:
+                unknown = {'bit': 'x', 'int': 'bx ', 'string': 's '}[kind[cid]]
+                f.write(f'{unknown}{_vcd_id(2*cid)}\n0{_vcd_id(2*cid+1)}\n')
+        f.write('$end\n')
+
+        last_time = None
+        for i in range(len(trace)):
+            if trace.kinds[i] != SEND:
+                continue
+            t, cid = trace.times[i], trace.channel_ids[i]
+            if t != last_time:
+                f.write(f'#{t}\n')
+                last_time = t
+            ident = _vcd_id(2*cid)
+            if kind[cid] == 'bit':
+                f.write(f'{trace.values[i]}{ident}\n')
+            elif kind[cid] == 'int':
+                f.write(f'b{trace.values[i] & _INT64_MASK:b} {ident}\n')
+            else:
+                f.write(f's{str(trace.get_value(i)).replace(" ", "_")} {ident}\n')
+            toggles[cid] ^= 1
+            f.write(f'{toggles[cid]}{_vcd_id(2*cid+1)}\n')
+    logger.info('Wrote %s', vcd_filename)
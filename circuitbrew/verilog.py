@@ -0,0 +1,81 @@
+"""
+    Structural Verilog netlists (`cb_netlist TECH MODULE verilog all`), to run
+    functional regressions in an event-driven digital simulator instead of
+    transient SPICE.
+
+    The same passes and symbol resolution as the SPICE netlist emit one Verilog
+    module per module type (see `Module.get_verilog`), with:
+
+    - the fets as bidirectional switches (`tranif1` for nfets, `tranif0` for
+      pfets), so that the CMOS stacks simulate at the switch level.  The internal
+      nets of the modules with fets get a `cb_charge` holder (defined in the top
+      file), which weakly keeps the last value driven on them, like the charge of
+      a floating node in SPICE (e.g. the state of a C-element)
+    - the supplies as `supply` strength drivers, and the reset pulses as steps at
+      the middle of their slope
+    - behavioral modules for the sources, buckets and clocks, from the
+      `verilog_*.v` templates (the counterparts of their Verilog-A templates),
+      that send and check the same values as their `sim()` methods
+    - nothing for the measurements
+
+    Instances keep their SPICE names (`xwchb_0`), and the names that aren't
+    Verilog identifiers (`p.vdd`, `a[0]`) are escaped (`\\p.vdd `).  The top file
+    instances Main as `xmain` in module `top`, with a 1ns time unit, and ends the
+    sim after the `sim_time` tech option (10 ns by default).  The buckets end it
+    early (`$finish`) on a token that doesn't match.  To run it with Icarus:
+
+        cd output && iverilog -s top -o top.vvp top.v && vvp top.vvp
+"""
+import re
+import importlib.resources as pkg_resources
+
+import circuitbrew.tech as tech
+
+TOP_TEMPLATE = 'verilog_top.v'
+CHARGE_MODULE = 'cb_charge'  # Charge holder of the internal nets, in the top file
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_$]*\Z')
+
+
+def escape(name: str) -> str:
+    """ Returns:
+            name as a Verilog identifier (escaped if it isn't a simple identifier)
+    """
+    return name if _IDENTIFIER.match(name) else f'\\{name} '
+
+
+def port_direction(port_type: type) -> str:
+    """ Returns:
+            The Verilog direction of a single port of class port_type
+    """
+    from .ports import InputPort, OutputPort
+    if issubclass(port_type, InputPort):
+        return 'input'
+    if issubclass(port_type, OutputPort):
+        return 'output'
+    return 'inout'
+
+
+def port_declarations(port) -> list[tuple[str, str]]:
+    """ Returns:
+            (name, direction) of each single port of a module port, in the order
+            of its subcircuit port list
+    """
+    return list(zip(port.get_spice().split(), _directions(port)))
+
+
+def _directions(port) -> list[str]:
+    from .ports import Ports
+    from .compound_ports import CompoundPort
+    if isinstance(port, Ports):
+        return [port_direction(port.port_type)]*len(port)
+    if isinstance(port, CompoundPort):
+        return [direction for sub_port in port.get_ports().values() for direction in _directions(sub_port)]
+    return [port_direction(type(port))]
+
+
+def get_top_template() -> str:
+    """ Returns:
+            The text of the top file template for Verilog netlists
+    """
+    return pkg_resources.files(tech).joinpath(TOP_TEMPLATE).read_text()
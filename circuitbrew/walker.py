@@ -1,8 +1,8 @@
 import logging
-from curio import spawn
 
 from .module import Module, Leaf, SourceModule
 from .helpers import LogBlock
+from .session import current_session
 logger = logging.getLogger(__name__)
 
 class Walker: 
@@ -26,7 +26,12 @@ class BuildPass(Walker):
 
     def run(self):
         LogBlock(f'Build pass {self.target}')
-        self.target.build()
+        if (profiler := self.target.profiler) is None:
+            self.target.build()
+        else:
+            start = profiler.start()
+            self.target.build()
+            profiler.add('build', self.target.get_module_type_name(), start)
         assert self.target.finalize_called, f'{self.target} build method does not havea self.finalize() call at the end'
         # Now, look at all the modules attached as attributes in the target module
         # and walk those recursively
@@ -39,14 +44,36 @@ class BuildPass(Walker):
         
 class NetlistPass(Walker):
 
+    def emit(self) -> list[str]:
+        """ Return the subcircuit definition of the target (called once per module type)
+        """
+        # Call the fast symbol table lookup constructor
+        self.target._sym_table._setup_connections_lookup()
+        # Fets are numbered per subcircuit, so start from 0 if this instance
+        # was netlisted before
+        self.target.fet_count.clear()
+        if self.target.sim_setup.get('sim_type') == 'verilog':
+            get_netlist = self.target.get_verilog
+        else:
+            get_netlist = self.target.get_spice
+        if (profiler := self.target.profiler) is None:
+            return get_netlist()
+        start = profiler.start()
+        lines = get_netlist()
+        profiler.add(get_netlist.__name__, self.target.get_module_type_name(), start)
+        return lines
+
+    def walk(self, module, target_name):
+        """ Create the walker for a sub-instance (override to pass along extra state)
+        """
+        return type(self)(module, target_name)
+
     def run(self):
         cls_name = self.target.get_module_type_name()
         LogBlock(f'Netlist pass {cls_name}')
         if cls_name not in Module._modules and not isinstance(self.target, Leaf):
-            # Call the fast symbol table lookup constructor
-            self.target._sym_table._setup_connections_lookup()
-            Module._modules[cls_name] = self.target.get_spice()
-            logger.debug(f'Got spice for {cls_name}')
+            Module._modules[cls_name] = self.emit()
+            logger.debug('Got spice for %s', cls_name)
             logger.debug(Module._modules[cls_name])
             logger.debug(self.target._sym_table.ports)
         else:  
@@ -55,8 +82,8 @@ class NetlistPass(Walker):
         # and walk those recursively
         for varname, var in vars(self.target).items():
             for i, module in enumerate(self.iter_flattened(var, lambda x: isinstance(x,Module))):
-                logger.debug(f'Walking {i}:{module}')
-                walker = NetlistPass(module, f'{self.target_name}.{varname}{i}')
+                logger.debug('Walking %s:%s', i, module)
+                walker = self.walk(module, f'{self.target_name}.{varname}{i}')
                 walker.run()
         LogBlock(f'Netlist pass {cls_name}')
 
@@ -64,32 +91,64 @@ class SimPass(Walker):
 
     async def run_sim(self):
         processes = await self.run()
+        if (clock := current_session().sim_clock) is not None:
+            # Run until nothing is pending in virtual time, then stop everything
+            await clock.run()
+            for proc in self.iter_flattened(processes, lambda x: isinstance(x,SourceModule)):
+                if proc._pid.terminated:
+                    await proc._pid.join()
+                else:
+                    clock.stalled.append(proc.name)
+            for proc in self.iter_flattened(processes):
+                if not proc._pid.terminated:
+                    await proc._pid.cancel()
+            return
+
         for proc in self.iter_flattened(processes, lambda x: isinstance(x,SourceModule)):
-            logger.info(f'Joining on {proc}')
+            logger.info('Joining on %s', proc)
             await proc._pid.join()
         
         for proc in self.iter_flattened(processes, lambda x: not isinstance(x,SourceModule)):
-            logger.info(f'Cancelling {proc}')
+            logger.info('Cancelling %s', proc)
             await proc._pid.cancel() 
 
     async def run(self):
+        from curio import spawn
         sim_modules = []  # Keep track off all the sim jobs we launched (module)
-        logger.info(f'Running sim of {self.target.name}')
+        logger.info('Running sim of %s', self.target.name)
         LogBlock(f'Sim pass {self.target.name}')
+        session = current_session()
+        for monitor in (session.tracer, session.channel_stats, session.sim_clock):
+            if monitor is not None:
+                for port_name, port in self.target._sym_table.ports.items():
+                    monitor.name_ports(self.target_name, port_name, port)
+        if session.sim_clock is not None:
+            session.sim_clock.add_module(self.target)
+        # Timed sims model channels with one token of slack by default
+        slack = (session.sim_setup or {}).get('channel_slack') or (1 if session.sim_clock is not None else 0)
+        if slack:
+            # Bound the queues of the simulated modules only: the ports of the
+            # un-simulated cells inside them also get every token, but are never read
+            from curio import Queue
+            for port in self.target._sym_table.ports.values():
+                for flat_port in port.iter_flattened():
+                    if '_q' not in flat_port.__dict__:
+                        flat_port._q = Queue(maxsize=slack)
         pid = await spawn(self.target.sim())
         self.target._pid = pid
         sim_modules.append(self.target)
 
         # Now, look at all the modules attached as attributes in the target module
         # and walk those recursively, if there's no sim method defined in the target class
-        has_sim_method = 'sim' in vars(self.target.__class__)
+        # (or a base class of it, e.g. for Parameterize'd modules)
+        has_sim_method = type(self.target).sim is not Module.sim
         if not has_sim_method:
             # We need to simulate all the sub instances recursively
             for varname, var in vars(self.target).items():
                 for i, module in enumerate(self.iter_flattened(var, 
                                                     lambda x: isinstance(x,Module) and not 
                                                             isinstance(x, Leaf))):
-                    logger.debug(f'Siming {i}:{module}')
+                    logger.debug('Siming %s:%s', i, module)
                     walker = SimPass(module, f'{self.target_name}.{varname}{i}')
                     sim_submodules = await walker.run()
                     sim_modules.append(sim_submodules)
@@ -0,0 +1,333 @@
+"""
+    Check the tokens on the `E1of2` channels of a SPICE transient sim against the
+    behavioral sim, from the waveform file of the simulator.
+
+        >>> report = verify_tokens('output/top.tr0', main, 'sim.cbt', threshold=0.9)
+
+    `main` is the design as built and netlisted by circuitbrew (so the spice node
+    of each rail can be looked up), and `sim.cbt` the trace of the behavioral sim
+    (`cb_netlist --trace`, see [circuitbrew.trace][]).  For every `E1of2` port of
+    the simulated modules, the tokens decoded from its rails (a rising true rail is
+    a 1, a rising false rail a 0) are compared to the tokens the port sent (for
+    outputs) or received (for inputs) in the behavioral sim.
+
+    The waveform file is memory-mapped and streamed block by block, and only the
+    columns of the nodes asked for are kept, so files much larger than memory can be
+    read.  The HSPICE post formats are read:
+
+    - binary (`.option post=1`): blocks framed by four int32 (4, n, 4, size) and a
+      trailing int32 size, the header text first and then float32 values (float64
+      for post version 2001)
+    - ASCII (`.option post=2`): the header text, then the values as fixed-width
+      (or whitespace-separated) numbers
+
+    In both, the header ends with the column names and `$&%#`, the values are rows
+    of the time and the columns, and each sweep ends with a value of 1e30.
+
+    Reading waveforms needs NumPy (the `analysis` extra).
+"""
+import mmap, struct, logging
+
+from .module import Module, Leaf
+from .walker import Walker
+
+logger = logging.getLogger(__name__)
+
+END_OF_SWEEP = 1e30
+HEADER_END = b'$&%#'
+
+
+def normalize_node(name: str) -> str:
+    """ Returns:
+            The node name as written by the simulator: lowercase, without `v(...)`
+    """
+    name = name.lower()
+    if name.startswith('v(') and name.endswith(')'):
+        name = name[2:-1]
+    return name
+
+
+class Waveform:
+    """ A memory-mapped waveform file
+
+        Examples:
+
+            >>> with Waveform('output/top.tr0') as wave:
+                    data = wave.read(['xmain.r_0', 'xmain.r_1'])
+            >>> data['time'], data['xmain.r_0']
+
+        Attributes:
+            names (list[str]): Normalized names of the columns, the first one is the time
+            sweep_names (list[str]): Names of the sweep parameters (if any)
+            binary (bool): Whether the file is in the binary format
+            post_version (str): e.g. `9601` or `2001`
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.f = open(filename, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        head = self.mm[:4]
+        self.binary = len(head) == 4 and 4 in (struct.unpack('<i', head)[0], struct.unpack('>i', head)[0])
+        if self.binary:
+            self.endian = '<' if struct.unpack('<i', head)[0] == 4 else '>'
+            header = self._read_binary_header()
+        else:
+            end = self.mm.find(HEADER_END)
+            assert end >= 0, f'{filename} is not a waveform file (no {HEADER_END} header end)'
+            header = self.mm[:end+len(HEADER_END)]
+            self._data_start = self.mm.find(b'\n', end) + 1 or len(self.mm)
+        self._parse_header(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def _iter_blocks(self, offset: int):
+        """ Yields:
+                (payload offset, payload size) of the binary blocks from offset on
+        """
+        mm, endian = self.mm, self.endian
+        while offset + 16 <= len(mm):
+            marker, _, marker2, size = struct.unpack_from(f'{endian}4i', mm, offset)
+            assert marker == 4 and marker2 == 4, f'{self.filename}: bad block header at {offset}'
+            yield offset + 16, size
+            offset += 16 + size + 4
+
+    def _read_binary_header(self) -> bytes:
+        parts = []
+        for start, size in self._iter_blocks(0):
+            parts.append(self.mm[start:start+size])
+            if HEADER_END in parts[-1]:
+                self._data_start = start + size + 4
+                return b''.join(parts)
+        raise AssertionError(f'{self.filename} has no {HEADER_END} header end')
+
+    def _parse_header(self, header: bytes):
+        text = header.decode('ascii', errors='replace')
+        counts = text[:12]
+        n_vectors = int(counts[0:4]) + int(counts[4:8])
+        n_sweeps = int(counts[8:12])
+        self.post_version = text[16:20] if text[16:20].strip() else text[20:24]
+        tokens = text[:text.index(HEADER_END.decode())].split()
+        names = tokens[len(tokens)-n_vectors-n_sweeps:]
+        self.names = [normalize_node(name) for name in names[:n_vectors]]
+        self.sweep_names = names[n_vectors:]
+
+    def _iter_values(self):
+        """ Yields:
+                1-d arrays of the values in the file, in order
+        """
+        import numpy as np
+        mm = self.mm
+        if self.binary:
+            dtype = np.dtype('f8' if self.post_version.strip() == '2001' else 'f4').newbyteorder(self.endian)
+            for start, size in self._iter_blocks(self._data_start):
+                yield np.frombuffer(mm, dtype=dtype, count=size//dtype.itemsize, offset=start)
+            return
+        width = self._ascii_width()
+        pos, chunk_size = self._data_start, 1 << 24
+        while pos < len(mm):
+            end = mm.find(b'\n', min(pos+chunk_size, len(mm)))
+            end = len(mm) if end < 0 else end+1
+            chunk = mm[pos:end]
+            pos = end
+            packed = chunk.translate(None, b'\r\n')
+            if width and len(packed) % width == 0:
+                yield np.frombuffer(packed, dtype=f'S{width}').astype(np.float64)
+            else:
+                yield np.array(chunk.split()).astype(np.float64)
+
+    def _ascii_width(self) -> int:
+        """ Returns:
+                The width of the values, if the first line of values has them all the
+                same width with nothing in between (0 otherwise)
+        """
+        import re
+        end = self.mm.find(b'\n', self._data_start)
+        line = self.mm[self._data_start:end if end >= 0 else len(self.mm)].rstrip()
+        fields = [m.end() for m in re.finditer(rb'\s*[-+]?(\d+\.?\d*|\.\d+)[Ee][-+]?\d+', line)]
+        widths = {b-a for a, b in zip([0]+fields, fields)}
+        return widths.pop() if len(widths) == 1 and fields[-1] == len(line) else 0
+
+    def read(self, nodes: list, sweep: int = 0) -> dict:
+        """ Read the waveforms of some nodes
+
+            Args:
+                nodes: Node names (matched with normalize_node)
+                sweep: Which sweep of the file to read
+
+            Returns:
+                dict: `time` and each node -> numpy array
+        """
+        import numpy as np
+        index = {name: i for i, name in enumerate(self.names)}
+        missing = [node for node in nodes if normalize_node(node) not in index]
+        assert not missing, f'{self.filename} has no waveforms for {missing}'
+        columns = [0] + [index[normalize_node(node)] for node in nodes]
+        n_cols = len(self.names)
+        rows, carry = [], None
+        current = 0
+        need_sweep_value = bool(self.sweep_names)
+        for values in self._iter_values():
+            while len(values):
+                if need_sweep_value:
+                    values, need_sweep_value = values[1:], False
+                    continue
+                ends = np.flatnonzero(values >= END_OF_SWEEP)
+                # Values of this sweep up to its end marker (a value of a row can't be
+                # 1e30, so the first one found ends the sweep)
+                segment = values[:ends[0]] if len(ends) else values
+                if current == sweep:
+                    if carry is not None and len(carry):
+                        segment = np.concatenate((carry, segment))
+                    n_rows = len(segment) // n_cols
+                    rows.append(segment[:n_rows*n_cols].reshape(n_rows, n_cols)[:, columns])
+                    carry = segment[n_rows*n_cols:]
+                if not len(ends):
+                    break
+                if current == sweep:
+                    assert not len(carry), f'{self.filename}: sweep {sweep} ends in the middle of a row'
+                    return self._columns(['time'] + list(nodes), rows)
+                values = values[ends[0]+1:]
+                current += 1
+                need_sweep_value = bool(self.sweep_names)
+        assert current == sweep, f'{self.filename} has only {current} sweeps'
+        return self._columns(['time'] + list(nodes), rows)
+
+    @staticmethod
+    def _columns(names: list, rows: list) -> dict:
+        import numpy as np
+        data = np.concatenate(rows) if rows else np.empty((0, len(names)))
+        return {name: data[:, i] for i, name in enumerate(names)}
+
+
+def rising_edges(time, v, low: float, high: float):
+    """ Returns:
+            The times v rises through high, having been below low since the last
+            time (hysteresis against noise near the threshold), interpolated between
+            samples
+    """
+    import numpy as np
+    above, below = v >= high, v <= low
+    rises = np.flatnonzero(~above[:-1] & above[1:]) + 1
+    falls = np.flatnonzero(~below[:-1] & below[1:]) + 1
+    if below[0]:
+        falls = np.concatenate(([0], falls))
+    events = np.concatenate((rises, falls))
+    is_rise = np.concatenate((np.ones(len(rises), bool), np.zeros(len(falls), bool)))
+    order = np.argsort(events, kind='stable')
+    events, is_rise = events[order], is_rise[order]
+    # A rise counts if the event before it was a fall
+    valid = is_rise & np.concatenate(([False], ~is_rise[:-1]))
+    i = events[valid]
+    t0, t1, v0, v1 = time[i-1], time[i], v[i-1], v[i]
+    return t0 + (high - v0)*(t1 - t0)/(v1 - v0)
+
+
+def decode_e1of2(time, t, f, threshold: float, hysteresis: float = 0.1):
+    """ Decode the tokens of a dual rail channel
+
+        Args:
+            time, t, f: Sample times and the true and false rail voltages
+            threshold: Voltage a rail must rise through
+            hysteresis: Fraction of threshold a rail must fall below it before rising again
+
+        Returns:
+            (times, values): numpy arrays of the token times and values (1 or 0)
+    """
+    import numpy as np
+    low, high = threshold*(1-hysteresis), threshold
+    t_rises, f_rises = rising_edges(time, t, low, high), rising_edges(time, f, low, high)
+    times = np.concatenate((t_rises, f_rises))
+    values = np.concatenate((np.ones(len(t_rises), np.int8), np.zeros(len(f_rises), np.int8)))
+    order = np.argsort(times, kind='stable')
+    return times[order], values[order]
+
+
+class NodePass(Walker):
+    """ Find the spice nodes of the rails of the E1of2 ports of the simulated
+        modules.  Run it after netlisting, like SimPass it only walks into modules
+        that don't have a sim method of their own.
+    """
+    def __init__(self, target, target_name, spice_name: str, port_nodes: dict):
+        super().__init__(target, target_name)
+        self.spice_name = spice_name
+        self.port_nodes = port_nodes   # Flattened port of the target -> spice node
+
+    def run(self, channels: dict = None) -> dict:
+        """ Returns:
+                dict: port name (as in the sim, e.g. `xmain.buf0.l`) -> (true rail node,
+                      false rail node, whether it's an input)
+        """
+        from .compound_ports import E1of2, E1of2InputPort
+        channels = {} if channels is None else channels
+        sym_table = self.target._sym_table
+        if type(self.target).sim is not Module.sim:
+            for port_name, port in sym_table.ports.items():
+                if isinstance(port, E1of2) and port.t in self.port_nodes and port.f in self.port_nodes:
+                    channels[f'{self.target_name}.{port_name}'] = (
+                        self.port_nodes[port.t], self.port_nodes[port.f], isinstance(port, E1of2InputPort))
+            return channels
+
+        if not hasattr(sym_table, 'connected'):
+            sym_table._setup_connections_lookup()
+        # Look the ports up in the order the netlist did, so that any temporary
+        # locals get the same names
+        sub_nodes = {}
+        for modules in sym_table.sub_instances.values():
+            for module in self.iter_flattened(modules, lambda x: isinstance(x,Module) and not isinstance(x, Leaf)):
+                nodes = sub_nodes[id(module)] = {}
+                for port in module._sym_table.ports.values():
+                    for flat_port in port.iter_flattened():
+                        if (found := sym_table.get_symbol_from_scope(flat_port)) is not None:
+                            name, scope_port = found
+                            nodes[flat_port] = self.port_nodes.get(scope_port) or normalize_node(f'{self.spice_name}.{name}')
+        for varname, var in vars(self.target).items():
+            for i, module in enumerate(self.iter_flattened(var, lambda x: isinstance(x,Module) and not isinstance(x, Leaf))):
+                NodePass(module, f'{self.target_name}.{varname}{i}', f'{self.spice_name}.x{module.name}',
+                         sub_nodes.get(id(module), {})).run(channels)
+        return channels
+
+
+def verify_tokens(waveform_file: str, main: Module, trace_file: str, threshold: float,
+                  sweep: int = 0) -> dict:
+    """ Compare the tokens of a SPICE sim to the behavioral sim (see [circuitbrew.waveforms][])
+
+        Args:
+            waveform_file: The waveform file of the SPICE sim
+            main: The built and netlisted design
+            trace_file: The trace of the behavioral sim
+            threshold: Voltage for a rail to be high (e.g. half the supply)
+            sweep: Which sweep of the waveform file to check
+
+        Returns:
+            dict: port name -> {`nodes`, `sim` and `spice` tokens, `mismatch`: index of the
+                  first token that differs (None if they all match)}
+    """
+    from .trace import Trace, SEND, RECV
+    channels = NodePass(main, 'xmain', 'xmain', {}).run()
+    trace = Trace(trace_file)
+    with Waveform(waveform_file) as wave:
+        nodes = sorted({node for t_node, f_node, _ in channels.values() for node in (t_node, f_node)
+                            if node in wave.names})
+        data = wave.read(nodes, sweep)
+    report = {}
+    for name, (t_node, f_node, is_input) in channels.items():
+        if t_node not in data or f_node not in data or f'{name}.t' not in trace.channels:
+            continue
+        _, values = decode_e1of2(data['time'], data[t_node], data[f_node], threshold)
+        spice = [int(v) for v in values]
+        sim = trace.tokens(f'{name}.t', RECV if is_input else SEND)
+        mismatch = next((i for i, (a, b) in enumerate(zip(sim, spice)) if a != b), None)
+        if mismatch is None and len(sim) != len(spice):
+            mismatch = min(len(sim), len(spice))
+        report[name] = {'nodes': [t_node, f_node], 'sim': sim, 'spice': spice, 'mismatch': mismatch}
+        if mismatch is not None:
+            logger.warning('%s: token %d differs between the sim and spice', name, mismatch)
+    return report
@@ -1,7 +1,11 @@
 import circuitbrew.circuitbrew as P
+import circuitbrew.cb_netlist as cb_netlist
 
 import pytest
 import os
+import sys
+import time
+import shutil
 import logging
 
 import smtplib
@@ -11,16 +15,728 @@ from mock import MagicMock
 from mock import PropertyMock
 
 
+NOR_DESIGN = '''
+from circuitbrew.module import Module, Parameterize
+from circuitbrew.elements import Supply
+from circuitbrew.gates import NorN, Inv_x1
+
+class Main(Module):
+    def build(self):
+        self.supply = Supply('vdd', self.sim_setup['voltage'])
+        p = self.supply.p
+        self.nors = [Parameterize(NorN, N=3)(p=p) for i in range(3)]
+        self.inv = Inv_x1(inp=self.nors[0].b, p=p)
+        self.finalize()
+'''
+
+SLOW_STAGE_DESIGN = '''
+import curio
+from circuitbrew.module import Module, SourceModule
+from circuitbrew.compound_ports import E1of2InputPort, E1of2OutputPort
+from circuitbrew.qdi import Wchb
+
+class Stage(Module):
+    def build(self):
+        self.finalize()
+
+class Src(Stage, SourceModule):
+    l = E1of2OutputPort()
+    async def sim(self):
+        for i in range(10):
+            await self.l.send(i & 1)
+
+class Slow(Stage):
+    l = E1of2InputPort()
+    r = E1of2OutputPort()
+    async def sim(self):
+        while True:
+            val = await self.l.recv()
+            await curio.sleep(0.002)
+            await self.r.send(val)
+
+class Sink(Stage):
+    l = E1of2InputPort()
+    async def sim(self):
+        while True:
+            await self.l.recv()
+
+class Main(Module):
+    def build(self):
+        self.src = Src('src')
+        self.slow = Slow('slow')
+        self.fast = Wchb('fast')
+        self.sink = Sink('sink')
+        self.slow.l = self.src.l
+        self.fast.l = self.slow.r
+        self.sink.l = self.fast.r
+        self.finalize()
+'''
+
 class Testcircuitbrew:
 
-    def setup(self):
-        self.p = P.CircuitBrew()
+    def setup_method(self):
+        self.p = P.CircuitBrew(cb_netlist.__doc__)
 
-    def test_big(self):
+    def test_big(self, tmp_path, monkeypatch):
         #self.p.get_options(['-v', 'n7.sp', 'circuitbrew.examples.simple3', 'hspice', ])
-        self.p.techfile = 'n7.sp'
-        self.p.module = 'circuitbrew.examples.simple3'
+        monkeypatch.chdir(tmp_path)
+        self.p.process = 'sw130'
+        self.p.module = 'circuitbrew.examples.inverter_sim.inverter_sim_03'
         self.p.netlist_type = 'hspice'
         sp = self.p.netlist()
         print(sp)
+        assert '.subckt Inverter a b p.gnd p.vdd' in sp
+        assert (tmp_path / 'output' / 'top.sp').read_text() == sp
+
+    def test_startup_is_lazy(self):
+        # Importing the CLI and a circuit library should not pull in the
+        # simulation/templating dependencies
+        code = ('import sys, circuitbrew.cb_netlist, circuitbrew.circuitbrew, circuitbrew.qdi;'
+                'print(",".join(m for m in ("curio", "mako") if m in sys.modules))')
+        import subprocess, sys
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        assert out.stdout.strip() == ''
+
+    def test_server(self, tmp_path, monkeypatch):
+        import threading
+        from circuitbrew.server import NetlistServer, request
+        monkeypatch.chdir(tmp_path)
+        sock = str(tmp_path / 'cb.sock')
+        server = NetlistServer(sock, poll=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        deadline = time.monotonic() + 10
+        while not os.path.exists(sock):
+            assert time.monotonic() < deadline, 'The server did not start listening'
+            time.sleep(0.01)
+
+        argv = ['sw130', 'circuitbrew.examples.inverter_sim.inverter_sim_03', 'hspice', 'all']
+        first = request(sock, argv, cwd=str(tmp_path))
+        assert first['ok'] and not first['cached']
+        assert first['outputs'][0] == str(tmp_path / 'output' / 'top.sp')
+        assert str(tmp_path / 'output' / 'hspice_clk.va') in first['outputs']
+        assert first['changed'] == first['outputs']
+        second = request(sock, argv, cwd=str(tmp_path))
+        assert second['ok'] and second['cached'] and second['changed'] == []
+
+        bad = request(sock, ['sw130', 'no_such_module', 'hspice', 'all'], cwd=str(tmp_path))
+        assert not bad['ok'] and 'no_such_module' in bad['error']
+
+        # Editing the tech files of a local process rebuilds the design
+        import shutil, importlib.resources
+        shutil.copytree(importlib.resources.files('circuitbrew.tech') / 'process' / 'sw130', tmp_path / 'proc')
+        argv = [str(tmp_path / 'proc')] + argv[1:]
+        assert not request(sock, argv, cwd=str(tmp_path))['cached']
+        assert request(sock, argv, cwd=str(tmp_path))['cached']
+        template = tmp_path / 'proc' / 'sw130.sp'
+        template.write_text(template.read_text().replace('.option post', '.option post\n* edited'))
+        os.utime(template, ns=(0, 0))
+        edited = request(sock, argv, cwd=str(tmp_path))
+        assert edited['ok'] and not edited['cached']
+        assert '* edited' in (tmp_path / 'output' / 'top.sp').read_text()
+
+        # Deleting a helper module (and its import) doesn't break the design
+        (tmp_path / 'gone_helper.py').write_text('WIDTH = 3\n')
+        design = tmp_path / 'helped_design.py'
+        design.write_text('import gone_helper\n' + NOR_DESIGN)
+        argv = ['sw130', 'helped_design', 'hspice', 'build', 'netlist']
+        assert request(sock, argv, cwd=str(tmp_path))['ok']
+        (tmp_path / 'gone_helper.py').unlink()
+        design.write_text(NOR_DESIGN)
+        os.utime(design, ns=(0, 0))
+        again = request(sock, argv, cwd=str(tmp_path))
+        assert again['ok'] and not again['cached'], again.get('error')
+        assert 'gone_helper' not in sys.modules
+        sys.modules.pop('helped_design', None)
+        server.shutdown()
+
+    def test_sessions_are_isolated(self, tmp_path, monkeypatch):
+        import threading
+        (tmp_path / 'output').mkdir()
+        (tmp_path / 'nor_design.py').write_text(NOR_DESIGN)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        self.p.process = 'sw130'
+        self.p.module = 'nor_design'
+        self.p.netlist_type = 'hspice'
+        first = self.p.netlist()
+        # Same counters and subcircuits when netlisting again in this process
+        assert self.p.netlist() == first
+
+        results = []
+        def worker():
+            script = P.CircuitBrew(cb_netlist.__doc__)
+            script.process, script.module, script.netlist_type = 'sw130', self.p.module, 'hspice'
+            script.flow = {'build': '', 'netlist': ''}
+            results.append(script.netlist())
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert len(results) == 4 and len(set(results)) == 1
+
+    def test_sweep(self, tmp_path, monkeypatch):
+        from circuitbrew.sweep import Sweep, Corner
+        (tmp_path / 'nor_design.py').write_text(NOR_DESIGN)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        self.p.process, self.p.module, self.p.netlist_type = 'sw130', 'nor_design', 'hspice'
+        corners = [Corner('tt'),
+                   Corner('ss_hot', {'corner': 'ss', 'temp': 125}),
+                   Corner('wide', params={'Fet': {'w': 2.0}})]
+        for jobs in (1, 2):
+            results = {r.corner.name: r for r in Sweep(self.p, corners, jobs=jobs).run()}
+            assert [results[c].rebuilt for c in ('tt', 'ss_hot', 'wide')] == [False, False, True]
+            tt, ss, wide = [(tmp_path / 'output' / c / 'top.sp').read_text() for c in ('tt', 'ss_hot', 'wide')]
+            assert '.temp 125' in ss and '" ss' in ss and '.temp 85' in tt
+            assert tt.split('.option post')[1] == ss.split('.option post')[1]
+            assert 'w=2.0' in wide and 'w=2.0' not in tt
+
+    def test_sweep_options(self, tmp_path, monkeypatch):
+        import gzip
+        from circuitbrew.shortnames import NameMap
+        (tmp_path / 'nor_design.py').write_text(NOR_DESIGN)
+        (tmp_path / 'corners.yml').write_text('corners:\n  - name: tt\n  - name: ss\n    corner: ss\n')
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        (tmp_path / 'output').mkdir()
+        self.p.go(['--sweep', 'corners.yml', '--split-subckts', '--compress', 'gzip', '--short-names',
+                   '--flat', 'flat.sp', 'sw130', 'nor_design', 'hspice', 'build', 'netlist'])
+        for corner in ('tt', 'ss'):
+            out = tmp_path / 'output' / corner
+            top = gzip.decompress((out / 'top.sp.gz').read_bytes()).decode()
+            assert ".include 'subckt_s0.sp.gz'" in top.splitlines() and 'NorN' not in top
+            assert (out / 'subckt_s0.sp.gz').exists() and (out / 'flat.sp.gz').exists()
+            with NameMap(str(out / 'names.map')) as names:
+                assert names.type_name('s0') == 'Supply'
+        assert not (tmp_path / 'flat.sp.gz').exists()
+        with pytest.raises(AssertionError):
+            self.p.sweep('corners.yml', style='alter')
+
+    def test_sweep_param_precedence(self):
+        from circuitbrew.sweep import Corner, merge_options
+        from circuitbrew.session import Session
+        from circuitbrew.module import Parameterize
+        from circuitbrew.gates import Inv
+        tech = {'Inv': {'auto': {'forward_latency': 1, 'backward_latency': 2}}}
+        Slow = Parameterize(Inv, forward_latency=5)
+        # Parameterize values beat the tech auto values...
+        with Session(tech):
+            inv = Slow()
+            assert (inv.forward_latency, inv.backward_latency) == (5, 2)
+        # ...corner params beat both, and constructor kwargs beat everything
+        with Session(merge_options(tech, Corner('c', params={'Inv': {'forward_latency': 7}}).get_overrides())):
+            assert Slow().forward_latency == 7 and Inv().forward_latency == 7
+            assert Slow(forward_latency=9).forward_latency == 9
+
+    def test_sweep_single_netlist(self, tmp_path, monkeypatch):
+        from circuitbrew.sweep import Sweep, Corner
+        (tmp_path / 'nor_design.py').write_text(NOR_DESIGN)
+        # Refer to the voltage .param instead of reading the tech option, so .data can sweep it
+        (tmp_path / 'nor_param.py').write_text(NOR_DESIGN.replace("self.sim_setup['voltage']", "\"'voltage'\", measure=False"))
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        self.p.process, self.p.module, self.p.netlist_type = 'sw130', 'nor_design', 'hspice'
+        corners = [Corner('tt'), Corner('ss_hot', {'corner': 'ss', 'temp': 125}), Corner('lowv', {'voltage': 1.6})]
+        sp = Sweep(self.p, corners).run_single('alter')
+        nominal, ss_hot, lowv = sp.split('.alter ')
+        assert nominal.count('.subckt Supply') == 1 and '.temp 85' in nominal
+        assert ss_hot.startswith('ss_hot\n') and '.temp 125' in ss_hot and '.subckt' not in ss_hot
+        assert '.param voltage=1.6' in lowv and '.subckt Supply' in lowv and '.subckt NorN' not in lowv
+
+        self.p.module = 'nor_param'
+        sp = Sweep(self.p, [Corner('nom'), Corner('lowv', {'voltage': 1.6})]).run_single('data')
+        assert '.data cb_corners voltage\n+ 1.8\n+ 1.6\n.enddata' in sp
+        assert '.tran 1p 10n sweep data=cb_corners' in sp
+        with pytest.raises(AssertionError):
+            Sweep(self.p, [Corner('nom'), Corner('ss', {'corner': 'ss'})]).run_single('data')
+
+    def test_benchmarks(self):
+        from circuitbrew.benchmarks.runner import Benchmark, run_suite, compare, get_scaling
+        benches = [Benchmark('wide_nor', 2, width=2), Benchmark('wide_nor', 4, width=4)]
+        results = run_suite(benches, repeat=1)
+        small = results['benchmarks']['wide_nor(width=2)']
+        assert small['lines'] < results['benchmarks']['wide_nor(width=4)']['lines']
+        assert small['peak_mb'] > 0 and small['build'] > 0
+        assert set(get_scaling(benches, results['benchmarks'])) == {'wide_nor'}
+        assert compare(results, results) == []
+        baseline = {'benchmarks': {'wide_nor(width=2)': dict(small, netlist=small['netlist']/10, lines=1)}}
+        regressions = compare(results, baseline)
+        assert any('lines changed' in r for r in regressions)
+        assert any('netlist' in r for r in regressions) == (small['netlist'] >= 5.0)
+
+    def test_profile(self, tmp_path, monkeypatch):
+        import json
+        (tmp_path / 'nor_design.py').write_text(NOR_DESIGN)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        (tmp_path / 'output').mkdir()
+        self.p.go(['--profile', 'prof.json', 'sw130', 'nor_design', 'hspice', 'build', 'netlist'])
+        report = json.loads((tmp_path / 'prof.json').read_text())
+        assert {'build', 'netlist', 'render'} <= set(report['passes'])
+        assert 'alloc_blocks' in report['passes']['netlist']
+        nor = report['module_types']['NorN_N_3']
+        assert nor['build']['calls'] == 3 and nor['get_spice']['calls'] == 1
+        assert 'alloc_blocks' in nor['build'] and 'alloc_blocks' in nor['get_instance_spice']
+        assert report['module_types']['Main']['get_spice']['calls'] == 1
+        assert report['lookups']['fast'] + report['lookups'].get('slow_hit', 0) > 0
+
+    def test_stats(self, tmp_path, monkeypatch):
+        import json
+        (tmp_path / 'nor_design.py').write_text(NOR_DESIGN)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        (tmp_path / 'output').mkdir()
+        self.p.go(['--stats', 'stats.json', 'sw130', 'nor_design', 'hspice', 'build', 'netlist'])
+        report = json.loads((tmp_path / 'stats.json').read_text())
+        nor = report['types']['NorN_N_3']
+        # Matches the netlist: 3 NorN_N_3 and an inverter
+        netlist = (tmp_path / 'output' / 'top.sp').read_text()
+        nor_fets = netlist.split('.subckt NorN_N_3 ')[1].split('.ends')[0].count('\nxm')
+        assert nor['count'] == 3 and nor['transistors'] == nor_fets == 6
+        assert report['transistors'] == 3*6 + 2 and report['fets'] == {'Nfet': 10, 'Pfet': 10}
+        assert report['instances']['Nfet'] == 10 and report['types']['Main']['children']['NorN_N_3'] == 3
+
+    def test_trace(self, tmp_path, monkeypatch):
+        from circuitbrew.trace import Trace, RECV
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / 'output').mkdir()
+        self.p.go(['--vcd', 'sim.vcd', 'sw130', 'circuitbrew.examples.buf_wchb_chain', 'hspice', 'build', 'sim'])
+        trace = Trace(tmp_path / 'sim.cbt')
+        # Every token the source sends passes through each buffer of the chain
+        sent = trace.tokens('xmain.src0.l.t')
+        assert len(sent) > 0 and trace.tokens('xmain.buf3.r.t') == sent
+        assert trace.tokens('xmain.buf0.l.t', RECV) == sent
+        vcd = (tmp_path / 'sim.vcd').read_text()
+        assert '$var wire 1 ! xmain.src0.l.t $end' in vcd and '$enddefinitions' in vcd
+
+    def test_trace_values(self, tmp_path):
+        from circuitbrew.trace import TraceRecorder, Trace, export_vcd, SEND
+        class Chan:
+            name = 'c'
+        ints, mixed = Chan(), Chan()
+        recorder = TraceRecorder(str(tmp_path / 'sim.cbt'), capacity=2)
+        recorder.port_names.update({ints: 'ints', mixed: 'mixed'})
+        for val in (-1, 5, -3, 2**63-1):
+            recorder.record(ints, SEND, val)
+        for val in (-1, 'x', -3, True, 'x', 2**64):
+            recorder.record(mixed, SEND, val)
+        recorder.close()
+        trace = Trace(str(tmp_path / 'sim.cbt'))
+        assert trace.tokens('ints') == [-1, 5, -3, 2**63-1]
+        # Integers too wide for int64 go to the value table
+        assert trace.tokens('mixed') == [-1, "'x'", -3, 1, "'x'", str(2**64)]
+        export_vcd(str(tmp_path / 'sim.cbt'), str(tmp_path / 'sim.vcd'))
+        vcd = (tmp_path / 'sim.vcd').read_text()
+        assert f'b{"1"*62}01 !' in vcd and 's-3 #' in vcd and "s'x' #" in vcd and f's{2**64} #' in vcd
+
+    def test_channel_stats(self, tmp_path, monkeypatch):
+        import json
+        from circuitbrew.session import Session
+        (tmp_path / 'slow_design.py').write_text(SLOW_STAGE_DESIGN)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        import slow_design
+        tech_options, _ = self.p._get_techfile('sw130')
+        self.p.flow = {'build': '', 'sim': ''}
+        self.p.channel_stats_file = 'channels.json'
+        with Session(dict(tech_options, channel_slack=1)):
+            self.p.build(slow_design)
+        report = json.loads((tmp_path / 'channels.json').read_text())
+        # The slow stage backs up its input and starves its output
+        assert next(iter(report['modules'])) == 'xmain.slow0'
+        channels = {c['name']: c for c in report['channels']}
+        assert channels['xmain.slow0.l.t']['tokens'] == 10
+        assert channels['xmain.slow0.l.t']['full_time'] > channels['xmain.fast0.l.t']['full_time']
+        assert channels['xmain.slow0.l.t']['max_occupancy'] == 1
+
+    def test_timing(self, tmp_path, monkeypatch):
+        import json
+        from circuitbrew.session import Session
+        from circuitbrew.module import Parameterize
+        from circuitbrew.qdi import Wchb
+        (tmp_path / 'slow_design.py').write_text(SLOW_STAGE_DESIGN)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        import slow_design
+        class TimedMain(slow_design.Main):
+            def build(self):
+                self.src = slow_design.Src('src')
+                self.a = Wchb('a')
+                self.b = Parameterize(Wchb, backward_latency=900)('b')
+                self.sink = slow_design.Sink('sink')
+                self.a.l = self.src.l
+                self.b.l = self.a.r
+                self.sink.l = self.b.r
+                self.finalize()
+        slow_design.Main = TimedMain
+        tech_options, _ = self.p._get_techfile('sw130')
+        self.p.flow = {'build': '', 'sim': ''}
+        self.p.timing_file = 'timing.json'
+        with Session(tech_options):
+            self.p.build(slow_design)
+        report = json.loads((tmp_path / 'timing.json').read_text())
+        channels = {c['name']: c for c in report['channels']}
+        # Tech file latencies for a, the Parameterize override for b
+        assert channels['xmain.b0.l.t']['first_token'] == 100
+        assert report['cycle_time'] == pytest.approx(100 + 900)
+        assert report['stalled'] == []
+
+    def test_throughput(self):
+        from circuitbrew.session import Session
+        from circuitbrew.walker import BuildPass
+        from circuitbrew.qdi import Wchb
+        from circuitbrew.module import Module
+        from circuitbrew import throughput
+        class WchbRing(Module):
+            def build(self):
+                self.buf = [Wchb(f'b{i}') for i in range(4)]
+                for i in range(4):
+                    self.buf[i].l = self.buf[i-1].r
+                self.finalize()
+        tech_options, _ = self.p._get_techfile('sw130')
+        with Session(tech_options):
+            ring = WchbRing()
+            BuildPass(ring, 'xring').run()
+            with pytest.raises(AssertionError, match='Deadlock'):
+                throughput.analyze(ring)
+            ring.buf[0].initial_tokens = 1
+            report = throughput.analyze(ring)
+        assert report['cells'] == 4 and report['arcs'] == 8
+        # One token in a ring of 4: the 3 bubbles going backwards are the limit
+        assert report['cycle_time'] == pytest.approx(4*400/3)
+        assert all(arc['arc'].startswith('backward') for arc in report['critical_cycle'])
+
+    def test_measurements(self, tmp_path):
+        pytest.importorskip('numpy')
+        from circuitbrew.session import Session
+        from circuitbrew.walker import BuildPass
+        from circuitbrew.module import Module
+        from circuitbrew.gates import Inv_x1
+        from circuitbrew.measure import Freq
+        from circuitbrew import measurements
+        class Ring(Module):
+            def build(self):
+                self.inv = Inv_x1()
+                self.msr = Freq(node=self.inv.out)
+                self.finalize()
+        tech_options, _ = self.p._get_techfile('sw130')
+        with Session(tech_options):
+            ring = Ring()
+            BuildPass(ring, 'xmain').run()
+            measures = measurements.find_measures(ring)
+        (tmp_path / 'tt').mkdir()
+        (tmp_path / 'ss').mkdir()
+        # Names and values wrapped over several lines, as HSPICE writes them
+        (tmp_path / 'tt' / 'top.mt0').write_text(
+            "$DATA1 SOURCE='HSPICE' VERSION='P-2019.06' PARAM_COUNT=0\n.TITLE '* top'\n"
+            " cycletime0       freq0            \n temper           alter#\n"
+            " 3.125e-09        3.200e+08        \n 25.0000          1.0000\n")
+        (tmp_path / 'ss' / 'top.mt0').write_text("CYCLETIME0 = failed\nFREQ0 = failed\n")
+        data = measurements.read_runs(measurements.find_measure_files(tmp_path))
+        assert list(data['run']) == [os.path.join('ss', 'top.mt0'), os.path.join('tt', 'top.mt0')]
+        freq = measurements.by_instance(data, measures)['xmain.msr0']['freq']
+        assert freq[1] == 3.2e8 and freq[0] != freq[0]
+
+    def test_waveforms(self, tmp_path, monkeypatch):
+        import struct
+        np = pytest.importorskip('numpy')
+        from importlib import import_module
+        from circuitbrew.session import Session
+        from circuitbrew.trace import Trace, RECV
+        from circuitbrew import waveforms
+        (tmp_path / 'output').mkdir()
+        monkeypatch.chdir(tmp_path)
+        self.p.process, self.p.module, self.p.netlist_type = 'sw130', 'circuitbrew.examples.buf_wchb_chain', 'hspice'
+        self.p.flow = {'build': '', 'sim': ''}
+        self.p.trace_file = 'sim.cbt'
+        tech_options, template = self.p._get_techfile('sw130')
+        tech_options['sim_type'] = 'hspice'
+        with Session(tech_options):
+            main = self.p.build(import_module(self.p.module))
+            self.p.emit(main, tech_options, template)
+            channels = waveforms.NodePass(main, 'xmain', 'xmain', {}).run()
+            # A binary .tr0 with a pulse on the true or false rail of every input
+            # channel for each token the behavioral sim received on it
+            trace = Trace('sim.cbt')
+            nodes = sorted({node for t, f, _ in channels.values() for node in (t, f)})
+            time = np.linspace(0, 20e-9, 2001)
+            volts = {node: np.zeros_like(time) for node in nodes}
+            for name, (t, f, is_input) in channels.items():
+                if is_input:
+                    for i, val in enumerate(trace.tokens(f'{name}.t', RECV)):
+                        volts[t if val else f][(time > (i+0.2)*1e-9) & (time < (i+0.6)*1e-9)] = 1.8
+            values = np.append(np.stack([time] + [volts[node] for node in nodes], axis=1).ravel(), 1e30)
+            header = f'{len(nodes):04d}{1:04d}{0:04d}00009601'.ljust(256)
+            header += ' '.join(['1']*(len(nodes)+1) + ['TIME'] + [f'v({node})' for node in nodes]) + ' $&%#'
+            with open('top.tr0', 'wb') as f:
+                for payload in [header.encode()] + [values[i:i+1000].astype('<f4').tobytes()
+                                                        for i in range(0, len(values), 1000)]:
+                    f.write(struct.pack('<4i', 4, len(payload)//4, 4, len(payload)) + payload
+                            + struct.pack('<i', len(payload)))
+            report = waveforms.verify_tokens('top.tr0', main, 'sim.cbt', threshold=0.9)
+        assert set(report) == set(channels)
+        assert all(r['mismatch'] is None and len(r['sim']) == 10 for r in report.values())
+
+    def test_netlist_in_memory(self, tmp_path, monkeypatch):
+        from circuitbrew.netlist import Tech, netlist
+        from circuitbrew.examples import buf_wchb_chain
+        monkeypatch.chdir(tmp_path)
+        tech = Tech.load('sw130')
+        results = [netlist(buf_wchb_chain.Main, tech, voltage=v) for v in (1.8, 1.6)]
+        assert list(tmp_path.iterdir()) == []
+        assert results[0].top != results[1].top and '.param voltage=1.6' in results[1].top.lower()
+        assert 'Wchb' in results[0].subcircuits
+        assert any(name.endswith('.va') for name in results[0].sources)
+        files = results[0].write('out')
+        assert files[0] == os.path.join('out', 'top.sp') and len(files) == 1 + len(results[0].sources)
+
+    def test_flat_netlist(self, tmp_path, monkeypatch):
+        from circuitbrew.netlist import Tech, netlist
+        from circuitbrew.examples import buf_wchb_chain
+        monkeypatch.chdir(tmp_path)
+        result = netlist(buf_wchb_chain.Main, Tech.load('sw130'))
+        counts = result.write_flat('flat.sp')
+        lines = [line.strip() for line in (tmp_path / 'flat.sp').read_text().splitlines()]
+        assert not any(line.startswith(('.subckt', '.ends')) for line in lines)
+        fets = [line.split() for line in lines if line.split()[0].split('.')[-1].startswith('xm')]
+        assert len(fets) == 4*32 and counts['elements'] == len(fets) + 6    # 2 resets, 2 supplies, src, buc
+        # The nets take the names of the highest instance they reach
+        nor = [fet for fet in fets if fet[0] == 'xmain.xwchb_1.xNorN_N_3_inst_0.xmn0'][0]
+        assert nor[1:5] == ['xmain.r_2', 'xmain.r_4', 'xmain.p.gnd', 'xmain.p.gnd']
+        assert '.measure TRAN supplycurrent0 avg i(Vxmain.xvdd.Vvdd_vdd)' in lines
+        assert 'Vxmain.xvdd.Vvdd_vss xmain.p.gnd 0 0.0' in lines
+
+    def test_verilog_netlist(self, tmp_path):
+        from circuitbrew.netlist import Tech, netlist
+        from circuitbrew.examples import buf_wchb_chain
+        result = netlist(buf_wchb_chain.Main, Tech.load('sw130'), 'verilog')
+        lines = [line.strip() for line in result.top.splitlines()]
+        assert lines[:2] == ['// Structural Verilog netlist of Main', '`timescale 1ns/1ps']
+        assert 'module Wchb(_pReset, \\l.t , \\l.f , \\l.e , \\p.gnd , \\p.vdd , \\r.t , \\r.f , \\r.e );' in lines
+        assert 'tranif1 xmn0(\\p.gnd , out, inp);' in lines and 'tranif0 xmp0(\\p.vdd , out, inp);' in lines
+        assert "assign (supply1, supply0) \\p.vdd  = 1'b1;" in lines
+        assert 'Wchb xwchb_1(_pR, r_0, r_1, r_2, \\p.gnd , \\p.vdd , r_3, r_4, r_5);' in lines
+        assert not any('.measure' in line for line in lines)
+        # The behavioral sources are included from their own files
+        assert sorted(result.sources) == ['template_0_verilog_bucket_1of2.v', 'template_0_verilog_src_1of2.v']
+        assert '`include "template_0_verilog_src_1of2.v"' in lines
+        assert lines[-5:] == ['module top;', 'Main xmain();', '', 'initial #10 $finish;', 'endmodule']
+        filenames = result.write(str(tmp_path))
+        assert filenames[0].endswith('top.v') and len(filenames) == 3
+
+    @pytest.mark.skipif(shutil.which('iverilog') is None, reason='needs Icarus Verilog')
+    def test_verilog_sim(self, tmp_path, monkeypatch):
+        import subprocess
+        from circuitbrew.netlist import Tech, netlist
+        from circuitbrew.examples import buf_wchb_chain
+        from circuitbrew.qdi import VerilogBucketE1of2
+
+        def simulate(directory):
+            netlist(buf_wchb_chain.Main, Tech.load('sw130'), 'verilog').write(str(directory))
+            subprocess.run(['iverilog', '-s', 'top', '-o', 'top.vvp', 'top.v'], cwd=directory, check=True)
+            return subprocess.run(['vvp', 'top.vvp'], cwd=directory, check=True,
+                                  capture_output=True, text=True).stdout
+
+        out = simulate(tmp_path / 'chain')
+        assert out.count(' verified ') == 10 and 'Error' not in out
+
+        # A bucket that expects other values ends the sim at the first token
+        class Flipped(VerilogBucketE1of2):
+            async def sim(self):
+                try:
+                    await super().sim()
+                finally:
+                    self.values = [1-val for val in self.values]
+        monkeypatch.setattr(buf_wchb_chain, 'VerilogBucketE1of2', Flipped)
+        out = simulate(tmp_path / 'flipped')
+        assert 'Error' in out and ' verified ' not in out
+
+    def test_unchanged_outputs_are_not_rewritten(self, tmp_path, monkeypatch):
+        import random
+        monkeypatch.chdir(tmp_path)
+        build = P.CircuitBrew.build
+        def seeded_build(script, circuit_lib):
+            random.seed(0)   # The example sources random values
+            return build(script, circuit_lib)
+        monkeypatch.setattr(P.CircuitBrew, 'build', seeded_build)
+        self.p.process, self.p.module, self.p.netlist_type = 'sw130', 'circuitbrew.examples.inverter_sim.inverter_sim_03', 'hspice'
+        self.p.flat_file = str(tmp_path / 'flat.sp')
+        self.p.netlist()
+        assert self.p.changed == self.p.outputs and self.p.outputs[-1] == self.p.flat_file
+        mtimes = {fn: os.stat(fn).st_mtime_ns for fn in self.p.outputs}
+        # Nothing changed: no file is rewritten
+        self.p.netlist()
+        assert self.p.changed == [] and {fn: os.stat(fn).st_mtime_ns for fn in self.p.outputs} == mtimes
+        top = self.p.outputs[0]
+        with open(top, 'a') as f:
+            f.write('* edited\n')
+        self.p.netlist()
+        assert self.p.changed == [top] and '* edited' not in open(top).read()
+        assert not [fn for fn in os.listdir(tmp_path / 'output') if fn.endswith('.tmp')]
+
+    def test_split_netlist(self, tmp_path):
+        import random
+        from circuitbrew.netlist import Tech, netlist
+        from circuitbrew.examples import buf_wchb_chain
+        tech = Tech.load('sw130')
+        random.seed(0)
+        whole = netlist(buf_wchb_chain.Main, tech)
+        random.seed(0)
+        split = netlist(buf_wchb_chain.Main, tech, split_subcircuits=True)
+        assert ".include 'subckt_Wchb.sp'" in split.top.splitlines() and '.subckt' not in split.top
+        assert split.split['subckt_Wchb.sp'].startswith('.subckt Wchb ')
+        # Including the files gives back the whole netlist
+        inlined = split.top
+        for filename, contents in split.split.items():
+            inlined = inlined.replace(f".include '{filename}'\n", contents)
+        assert inlined == whole.top
+        filenames = split.write(str(tmp_path))
+        assert str(tmp_path / 'subckt_Wchb.sp') in filenames
+
+    def test_compressed_netlist(self, tmp_path, monkeypatch):
+        import gzip, random
+        monkeypatch.chdir(tmp_path)
+        self.p.process, self.p.module, self.p.netlist_type = 'sw130', 'circuitbrew.examples.buf_wchb_chain', 'hspice'
+        self.p.compress, self.p.split_subckts = 'gzip', True
+        random.seed(0)
+        spice = self.p.netlist()
+        top = gzip.decompress((tmp_path / 'output' / 'top.sp.gz').read_bytes()).decode()
+        assert top == spice and ".include 'subckt_Wchb.sp.gz'" in top.splitlines()
+        wchb = gzip.decompress((tmp_path / 'output' / 'subckt_Wchb.sp.gz').read_bytes()).decode()
+        assert wchb.startswith('.subckt Wchb ') and wchb.endswith('.ends\n')
+        # The compressed files are reproducible
+        random.seed(0)
+        self.p.netlist()
+        assert self.p.changed == []
+
+    def test_short_names(self, tmp_path):
+        import random
+        from circuitbrew.netlist import Tech, netlist
+        from circuitbrew.shortnames import NameMap
+        from circuitbrew.examples import buf_wchb_chain
+        random.seed(0)
+        result = netlist(buf_wchb_chain.Main, Tech.load('sw130'), short_names=True)
+        lines = result.top.splitlines()
+        assert 'x4 n0 na nb nc n1 n9 nd ne nf s1' in lines and '.subckt s1 n0 n1 n2 n3 n4 n5 n6 n7 n8' in lines
+        assert '.measure TRAN supplycurrent0 avg i(v1)' in [line.strip() for line in lines]
+        assert 'wchb' not in result.top and 'Vpwlpreset' not in result.top
+        result.write(str(tmp_path))
+        with NameMap(str(tmp_path / 'names.map')) as names:
+            assert names.main_type_name == 'Main' and names.type_name('s1') == 'Wchb'
+            assert names.original('xmain.x4.n9') == 'xmain.xwchb_1.mypreset'
+            assert names.original('XMAIN.X4.X0.N5') == 'xmain.xwchb_1.xCelement2_inst_1.t0_0'
+            assert names.original('xmain.x4.x0.x0') == 'xmain.xwchb_1.xCelement2_inst_1.xmn0'
+            assert names.original('xmain.xx.n1') == 'xmain.xx.n1'
+
+    def test_parameterize_is_memoized(self, tmp_path, monkeypatch):
+        from circuitbrew.module import Parameterize
+        from circuitbrew.gates import NorN, Inv
+        assert Parameterize(NorN, N=3) is Parameterize(NorN, N=3)
+        assert Parameterize(NorN, N=3) is not Parameterize(NorN, N=2)
+        # The name follows the parameter order, whichever order was used first
+        assert Parameterize(Inv, p_strength=3, n_strength=2).__name__ == 'Inv_p_strength_3_n_strength_2'
+        assert Parameterize(Inv, n_strength=2, p_strength=3).__name__ == 'Inv_n_strength_2_p_strength_3'
+        # The classes don't outlive their base class (e.g. a reloaded module's)
+        import gc, weakref
+        from circuitbrew.module import Module, Param
+        from circuitbrew.session import Session
+        with Session({}):
+            class Doomed(Module):
+                n: Param
+            doomed = weakref.ref(Doomed)
+            Parameterize(Doomed, n=2)
+            del Doomed
+        gc.collect()
+        assert doomed() is None
+        # Instances of the same parameterization are counted together, so they get distinct names
+        (tmp_path / 'nor_design.py').write_text(NOR_DESIGN)
+        (tmp_path / 'output').mkdir()
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        self.p.process, self.p.module, self.p.netlist_type = 'sw130', 'nor_design', 'hspice'
+        spice = self.p.netlist()
+        assert all(f'xNorN_N_3_inst_{i} ' in spice for i in range(3))
+
+    def test_lazy_ports(self):
+        from circuitbrew.ports import InputPorts, OutputPorts
+        a, b, c = OutputPorts(name='a', width=1024), InputPorts(name='b', width=1024), InputPorts(name='c', width=512)
+        early = c[3]
+        b._set(a)
+        c[:] = b[512:]
+        # Only the bits mapped to the bit created before connecting were created
+        assert list(a._bits) == [515] and list(b._bits) == [515] and a.get_spice().split()[-1] == 'a[1023]'
+        # Creating a bit connects it along the range mappings
+        assert b[600] in a[600].connections and c[88] in b[600].connections
+        assert early in b[515].connections and b[515] in a[515].connections
+        assert len(a._bits) == 2 and len(list(a[1:9:2])) == 4 and a[-1] is a[1023]
+
+    def test_compound_port_layout(self):
+        from circuitbrew.compound_ports import E1of2, E1of2InputPort, SupplyPort
+        assert [name for name, _ in E1of2InputPort._fields] == ['t', 'f', 'e']
+        l, r = E1of2InputPort('l'), E1of2('r')
+        assert l.get_ports() == {'t': l.t, 'f': l.f, 'e': l.e} and l.get_spice() == 'l.t l.f l.e'
+        # Equal and hashed by their sub ports
+        alias = E1of2('alias')
+        alias._ports = l._ports
+        assert alias == l and hash(alias) == hash(l) and l != r and len({l, alias, r}) == 2
+        assert SupplyPort('p').get_spice() == 'p.gnd p.vdd'
+
+    def test_merge_subcircuits(self, tmp_path, monkeypatch):
+        from circuitbrew.netlist import Tech, netlist
+        from circuitbrew.module import Module, Parameterize
+        from circuitbrew.elements import Supply, ResetPulse
+        from circuitbrew.qdi import Wchb, VerilogBucketE1of2, VerilogSrcE1of2
+        class Lanes(Module):
+            # Lanes that only differ in their (sim-only) latencies and source ids
+            def build(self):
+                self.supply = Supply('vdd', self.sim_setup['voltage'])
+                p = self.supply.p
+                self.preset = ResetPulse('preset', p=p)
+                self.sreset = ResetPulse('sreset', p=p)
+                _pR, _sR = self.preset.node, self.sreset.node
+                self.buf = [Parameterize(Wchb, forward_latency=100*(i+1))(f'wchb_{i}', _pReset=_pR, p=p)
+                                for i in range(3)]
+                self.src = [VerilogSrcE1of2(f'src_{i}', values=[1, 0, 1], _pReset=_pR, _sReset=_sR, l=self.buf[i].l)
+                                for i in range(3)]
+                self.buc = [VerilogBucketE1of2(f'buc_{i}', _pReset=_pR, _sReset=_sR, l=self.buf[i].r)
+                                for i in range(3)]
+                self.finalize()
+        monkeypatch.chdir(tmp_path)
+        tech = Tech.load('sw130')
+        plain = netlist(Lanes, tech)
+        merged = netlist(Lanes, tech, merge_subcircuits=True)
+        assert plain.top.count('.subckt Wchb_') == 3 and merged.top.count('.subckt Wchb_') == 1
+        assert len(plain.sources) == 6 and len(merged.sources) == 2
+        assert len(merged.subcircuits) == len(plain.subcircuits) - 6
+        # Every instance refers to a subcircuit that is still defined
+        defined = {lines[0].split()[1] for lines in merged.subcircuits.values() if lines[0].startswith('.subckt')}
+        lanes = merged.subcircuits['Lanes']
+        assert all(line.split()[-1] in defined for line in lanes if line.startswith('xwchb'))
+        assert sum(line.endswith('VerilogSrcE1of2_0') for line in lanes) == 3
+
+        # Literal names on element lines don't clash with the canonical ones
+        from circuitbrew.dedup import merge_subcircuits
+        modules = {'A': ['.subckt A a b', 'M0 a b vss vss nfet', '.ends'],
+                   'B': ['.subckt B a b', 'M0 p0 b vss vss nfet', '.ends'],
+                   'C': ['.subckt C x y', 'M7 x y vss vss nfet', '.ends'],
+                   'D': ['.subckt D a b', 'M0 a b vss vss pfet', '.ends'],
+                   'Main': ['.subckt Main', 'xa n1 n2 A', 'xb n1 n2 B', 'xc n1 n2 C', 'xd n1 n2 D', '.ends']}
+        merged = merge_subcircuits(modules)
+        assert list(merged) == ['A', 'B', 'D', 'Main']
+        assert merged['Main'] == ['.subckt Main', 'xa n1 n2 A', 'xb n1 n2 B', 'xc n1 n2 A', 'xd n1 n2 D', '.ends']
 
+    def test_quiet_logging_is_lazy(self, tmp_path, monkeypatch):
+        # With logging off, nothing on the hot paths should format a Port
+        from circuitbrew.ports import Port
+        def no_str(port):
+            raise AssertionError('Port formatted with logging off')
+        monkeypatch.setattr(Port, '__str__', no_str)
+        (tmp_path / 'nor_design.py').write_text(NOR_DESIGN)
+        (tmp_path / 'output').mkdir()
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        self.p.process, self.p.module, self.p.netlist_type = 'sw130', 'nor_design', 'hspice'
+        logging.getLogger('circuitbrew').setLevel(logging.WARNING)
+        try:
+            assert '.subckt NorN_N_3' in self.p.netlist()
+        finally:
+            logging.getLogger('circuitbrew').setLevel(logging.NOTSET)